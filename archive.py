@@ -0,0 +1,99 @@
+import os
+import gzip
+import json
+import time
+import logging
+import argparse
+from datetime import datetime, timedelta, timezone
+from dotenv import load_dotenv
+
+from db import get_exchanges_before, archive_exchanges_batch
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+logger = logging.getLogger(__name__)
+
+RETENTION_DAYS     = int(os.getenv("RETENTION_DAYS", 90))
+ARCHIVE_MODE       = os.getenv("ARCHIVE_MODE", "table")   # "table" | "jsonl"
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", 500))
+ARCHIVE_PAUSE      = float(os.getenv("ARCHIVE_PAUSE", 0.5))
+ARCHIVE_DIR        = os.getenv("ARCHIVE_DIR", "archive")
+ARCHIVE_SUMMARIES  = os.getenv("ARCHIVE_SUMMARIES", "true").lower() in ("1", "true", "yes")
+
+
+def _cutoff(days: int) -> str:
+    return (datetime.now(timezone.utc) - timedelta(days=days)).isoformat()
+
+
+def archive_to_table(cutoff: str, batch: int, summarize: bool, pause: float, max_batches: int | None) -> int:
+    """Move rows into chat_exchanges_archive, one short transaction per batch."""
+    total, batches = 0, 0
+    while max_batches is None or batches < max_batches:
+        moved = len(archive_exchanges_batch(cutoff, batch, summarize))
+        total += moved
+        batches += 1
+        if moved < batch:
+            break
+        time.sleep(pause)
+    return total
+
+
+def archive_to_jsonl(cutoff: str, batch: int, summarize: bool, pause: float,
+                     max_batches: int | None, directory: str) -> int:
+    """Export rows to a gzipped JSONL file, writing only the rows the archive RPC actually deleted
+    (SKIP LOCKED leaves rows held by live requests for a later batch or run)."""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"chat_exchanges-{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}.jsonl.gz")
+    total, batches = 0, 0
+    with open(path, "ab") as raw, gzip.GzipFile(fileobj=raw, mode="ab") as out:
+        while max_batches is None or batches < max_batches:
+            rows = get_exchanges_before(cutoff, batch)
+            if not rows:
+                break
+            deleted = set(archive_exchanges_batch(
+                cutoff, len(rows), summarize, to_table=False, ids=[row["id"] for row in rows],
+            ))
+            out.write("".join(
+                json.dumps(row, ensure_ascii=False) + "\n" for row in rows if row["id"] in deleted
+            ).encode("utf-8"))
+            out.flush()
+            raw.flush()
+            os.fsync(raw.fileno())
+            total += len(deleted)
+            batches += 1
+            if len(rows) < batch or not deleted:
+                break
+            time.sleep(pause)
+    logger.info(f"Exported archived exchanges to {path}")
+    return total
+
+
+def run_archival(days: int = RETENTION_DAYS, mode: str = ARCHIVE_MODE, batch: int = ARCHIVE_BATCH_SIZE,
+                 summarize: bool = ARCHIVE_SUMMARIES, pause: float = ARCHIVE_PAUSE,
+                 max_batches: int | None = None, directory: str = ARCHIVE_DIR) -> int:
+    """Archive every exchange older than `days`; returns the number of rows moved."""
+    cutoff = _cutoff(days)
+    logger.info(f"Archiving chat exchanges older than {days} days (before {cutoff}) to {mode}")
+    if mode == "jsonl":
+        moved = archive_to_jsonl(cutoff, batch, summarize, pause, max_batches, directory)
+    elif mode == "table":
+        moved = archive_to_table(cutoff, batch, summarize, pause, max_batches)
+    else:
+        raise ValueError(f"Unknown ARCHIVE_MODE {mode!r}; expected 'table' or 'jsonl'")
+    logger.info(f"Archived {moved} chat exchanges")
+    return moved
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move old chat_exchanges out of the hot table.")
+    parser.add_argument("--days", type=int, default=RETENTION_DAYS, help="retention period in days")
+    parser.add_argument("--mode", choices=["table", "jsonl"], default=ARCHIVE_MODE)
+    parser.add_argument("--batch", type=int, default=ARCHIVE_BATCH_SIZE, help="rows per transaction")
+    parser.add_argument("--pause", type=float, default=ARCHIVE_PAUSE, help="seconds between batches")
+    parser.add_argument("--max-batches", type=int, default=None)
+    parser.add_argument("--dir", default=ARCHIVE_DIR, help="output directory for jsonl mode")
+    parser.add_argument("--no-summaries", action="store_true", help="skip chat_session_summaries")
+    args = parser.parse_args()
+    run_archival(args.days, args.mode, args.batch, not args.no_summaries,
+                 args.pause, args.max_batches, args.dir)
@@ -3,11 +3,12 @@ import hashlib
 import base64
 import secrets
 import logging
+import threading
 import urllib.parse
 from functools import wraps
 from flask import session, redirect, url_for, jsonify, request
 import requests as http_requests
-from supabase import create_client
+from supabase import create_client, ClientOptions
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -17,8 +18,15 @@ logger = logging.getLogger(__name__)
 _url = os.getenv("SUPABASE_URL", "")
 _anon_key = os.getenv("SUPABASE_ANON_KEY", "")
 
-# Anon-key client — used for email/password auth only
-_auth_client = create_client(_url, _anon_key) if _url and _anon_key else None
+# Anon-key client — used for email/password auth only.
+# It keeps the last signed-in session in memory, so calls are serialised under
+# _auth_lock when gunicorn runs several request threads; the Flask session is
+# the source of truth, so no token persistence or background refresh is needed.
+_auth_client = create_client(
+    _url, _anon_key,
+    options=ClientOptions(auto_refresh_token=False, persist_session=False),
+) if _url and _anon_key else None
+_auth_lock = threading.Lock()
 
 
 # ─── Decorator ────────────────────────────────────────────────────────────────
@@ -41,11 +49,12 @@ def register_user(email: str, password: str, full_name: str = "") -> dict:
     if _auth_client is None:
         return {"success": False, "error": "Auth service not configured. Check SUPABASE_URL and SUPABASE_ANON_KEY."}
     try:
-        result = _auth_client.auth.sign_up({
-            "email": email,
-            "password": password,
-            "options": {"data": {"full_name": full_name}},
-        })
+        with _auth_lock:
+            result = _auth_client.auth.sign_up({
+                "email": email,
+                "password": password,
+                "options": {"data": {"full_name": full_name}},
+            })
         if result.user:
             return {
                 "success": True,
@@ -71,7 +80,8 @@ def login_user(email: str, password: str) -> dict:
     if _auth_client is None:
         return {"success": False, "error": "Auth service not configured."}
     try:
-        result = _auth_client.auth.sign_in_with_password({"email": email, "password": password})
+        with _auth_lock:
+            result = _auth_client.auth.sign_in_with_password({"email": email, "password": password})
         if result.user and result.session:
             meta = result.user.user_metadata or {}
             return {
@@ -91,7 +101,8 @@ def logout_supabase() -> None:
     if _auth_client is None:
         return
     try:
-        _auth_client.auth.sign_out()
+        with _auth_lock:
+            _auth_client.auth.sign_out()
     except Exception:
         pass
 
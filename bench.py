@@ -0,0 +1,307 @@
+import os
+import sys
+import json
+import random
+import timeit
+import logging
+import argparse
+import platform
+import statistics
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+BENCH_TRAINS    = int(os.getenv("BENCH_TRAINS", 10000))
+BENCH_PLACES    = int(os.getenv("BENCH_PLACES", 1000))
+BENCH_REPEAT    = int(os.getenv("BENCH_REPEAT", 5))
+BENCH_BASELINE  = os.getenv("BENCH_BASELINE", "bench_baseline.json")
+# A case regresses when its median per-call time exceeds the baseline's by more than this fraction
+BENCH_TOLERANCE = float(os.getenv("BENCH_TOLERANCE", 0.25))
+
+DATASETS = ["shipped", "synthetic"]
+
+MESSAGES = [
+    "What's the weather in Manali?",
+    "is it raining in Goa today",
+    "train 12951 schedule",
+    "trains from Delhi to Mumbai",
+    "how long is the drive from Jaipur to Udaipur",
+    "plan a trip from Bangalore to Goa",
+    "tell me about Rishikesh",
+    "best time to visit Darjeeling",
+    "cheap hostel with good wifi in Kasol",
+    "between Chennai and Kochi by road",
+    "hello",
+    "what documents do I need for a visa",
+]
+
+_PREFIXES = ["Ram", "Shiv", "Kal", "Hari", "Chand", "Bhav", "Sur", "Man", "Dev", "Raj",
+             "Nil", "Gang", "Sit", "Indr", "Kris", "Bal", "Mad", "Vij", "Anant", "Kesh"]
+_MIDDLES  = ["", "a", "i", "u", "ava", "esh"]
+_SUFFIXES = ["pur", "abad", "garh", "nagar", "kot", "ganj", "wadi", "pet", "halli", "gaon", "ner", "dera"]
+_QUALIFIERS = ["", "New ", "Old ", "North ", "South ", "Upper "]
+_MONTHS = ["January", "February", "March", "April", "May", "June", "July",
+           "August", "September", "October", "November", "December"]
+_CONDITIONS = ["Clear", "Cloudy", "Rain", "Haze", "Thunderstorm", "Mostly Clear"]
+
+
+# ─── Datasets ─────────────────────────────────────────────────────────────────
+
+def shipped_data(router) -> dict:
+    """The bundled JSON as the router loaded it."""
+    return {
+        "weather": router.fallback_weather_data,
+        "trains":  router.fallback_train_data,
+        "routes":  router.fallback_routes_data,
+        "places":  router.tourism_data,
+    }
+
+
+def _town_names(count: int, taken: set, rng: random.Random) -> list:
+    names = []
+    while len(names) < count:
+        name = rng.choice(_QUALIFIERS) + rng.choice(_PREFIXES) + rng.choice(_MIDDLES) + rng.choice(_SUFFIXES)
+        if name.lower() not in taken:
+            taken.add(name.lower())
+            names.append(name)
+    return names
+
+
+def _clock(minutes: int) -> str:
+    return f"{minutes // 60 % 24:02d}:{minutes % 60:02d}"
+
+
+def synthetic_data(router, trains: int = BENCH_TRAINS, places: int = BENCH_PLACES, seed: int = 0) -> dict:
+    """
+    The shipped data scaled up with generated towns, trains and routes, shaped
+    like the bundled JSON. Shipped entries are kept, so real city names still hit.
+    """
+    rng      = random.Random(seed)
+    shipped  = shipped_data(router)
+    cities   = sorted(set(router.GAZETTEER.values()))
+    taken    = {c.lower() for c in cities}
+    towns    = _town_names(max(0, places - len(shipped["places"]["places"])), taken, rng)
+    stations = cities + towns + _town_names(max(0, 2 * places - len(towns)), taken, rng)
+
+    place_list = list(shipped["places"]["places"])
+    for name in towns:
+        start = rng.randrange(12)
+        place_list.append({
+            "name":        name,
+            "description": f"{name} is a {rng.choice(['hill', 'temple', 'coastal', 'heritage'])} town.",
+            "best_time":   f"{_MONTHS[start]} to {_MONTHS[(start + 4) % 12]}",
+            "attractions": [f"{name} {kind}" for kind in rng.sample(
+                ["Fort", "Lake", "Market", "Temple", "Museum", "Ghat", "Palace"], 3)],
+        })
+
+    train_list = list(shipped["trains"])
+    for number in rng.sample(range(10000, 100000), max(0, trains - len(train_list))):
+        minutes, distance, schedule = rng.randrange(1440), 0, []
+        for serial, station in enumerate(rng.sample(stations, rng.randint(8, 25)), start=1):
+            schedule.append({
+                "arrivalTime":   "--" if serial == 1 else _clock(minutes),
+                "departureTime": _clock(minutes + 5),
+                "distance":      str(distance),
+                "haltTime":      "05:00",
+                "routeNumber":   "1",
+                "stationCode":   station[:4].upper(),
+                "stationName":   station,
+                "stnSerialNumber": str(serial),
+            })
+            minutes  += rng.randint(30, 180)
+            distance += rng.randint(20, 200)
+        train_list.append({"schedule": schedule, "train_name": f"{schedule[0]['stationName']} Express",
+                           "train_number": str(number)})
+
+    route_list = list(shipped["routes"])
+    for _ in range(max(0, places - len(route_list))):
+        start, end = rng.sample(stations, 2)
+        minutes = rng.uniform(60, 2400)
+        route_list.append({"start": f"{start},India", "end": f"{end},India",
+                           "distance_km": round(minutes * 1.3, 2), "duration_minutes": round(minutes, 1),
+                           "eta": {"hours": int(minutes // 60), "minutes": round(minutes % 60, 1)}})
+
+    weather_list = list(shipped["weather"])
+    for place in place_list[len(shipped["places"]["places"]):]:
+        weather_list.append({"location": place["name"], "real_time_weather": {
+            "humidity": rng.randint(20, 95), "temperature": round(rng.uniform(-5, 42), 1),
+            "weather_condition": rng.choice(_CONDITIONS), "wind_direction": "North",
+            "wind_speed": rng.randint(0, 12)}})
+
+    return {"weather": weather_list, "trains": train_list, "routes": route_list, "places": {"places": place_list}}
+
+
+def install(router, data: dict) -> None:
+    """Point the router's fallback lookups at data, rebuilding the gazetteer as startup would."""
+    router.fallback_weather_data = data["weather"]
+    router.fallback_train_data   = data["trains"]
+    router.fallback_routes_data  = data["routes"]
+    router.tourism_data          = data["places"]
+    router.GAZETTEER         = router._build_gazetteer()
+    router.GAZETTEER_PATTERN = router._gazetteer_pattern(router.GAZETTEER)
+
+
+# ─── Cases ────────────────────────────────────────────────────────────────────
+
+def cases(router, data: dict, seed: int = 0) -> list:
+    """(name, function, argument tuples) for every benchmarked call; inputs mix hits and misses."""
+    rng    = random.Random(seed)
+    trains = rng.sample(data["trains"], min(6, len(data["trains"])))
+    legs   = [(t["schedule"][0]["stationName"], t["schedule"][-1]["stationName"])
+              for t in trains if len(t["schedule"]) > 1]
+    places = [p["name"] for p in rng.sample(data["places"]["places"], min(6, len(data["places"]["places"])))]
+    routes = [(r["start"].split(",")[0], r["end"].split(",")[0])
+              for r in rng.sample(data["routes"], min(6, len(data["routes"])))]
+    towns  = [w["location"] for w in rng.sample(data["weather"], min(6, len(data["weather"])))]
+    return [
+        ("rule_based_classify",          router.rule_based_classify, [(m,) for m in MESSAGES]),
+        ("extract_locations_from_route", router.extract_locations_from_route, [(m,) for m in MESSAGES]),
+        ("validate_parameters",          router.validate_parameters, [
+            ("weather", {"location": "Manali"}), ("train_number", {"train_number": "12951"}),
+            ("train_number", {"train_number": "129"}), ("road", {"start": "Delhi", "end": "Agra"}),
+            ("trip_planning", {"start": "Pune", "end": ""}), ("general_travel", {}),
+        ]),
+        ("get_trains_by_route",  router.get_trains_by_route, legs + [("Nowhere", "Elsewhere")]),
+        ("get_road_info/fallback",   lambda s, e: router._road_from_data(s, e, None),
+         routes + [("Nowhere", "Elsewhere")]),
+        ("get_weather/fallback", lambda loc: router._weather_from_data(loc, None), [(t,) for t in towns + ["Nowhere"]]),
+        ("get_place_info",       router.get_place_info, [(p,) for p in places + ["Nowhere"]]),
+    ]
+
+
+def measure(func, inputs: list, repeat: int = BENCH_REPEAT) -> dict:
+    """Per-call seconds over `repeat` rounds, each looping over inputs for at least 0.2 s (timeit.autorange)."""
+    def run():
+        for args in inputs:
+            func(*args)
+    timer    = timeit.Timer(run)
+    loops, _ = timer.autorange()
+    calls    = loops * len(inputs)
+    rounds   = [t / calls for t in timer.repeat(repeat, loops)]
+    return {
+        "median_us": round(statistics.median(rounds) * 1e6, 3),
+        "min_us":    round(min(rounds) * 1e6, 3),
+        "stdev_us":  round(statistics.stdev(rounds) * 1e6, 3) if len(rounds) > 1 else 0.0,
+        "calls":     calls,
+        "rounds":    repeat,
+    }
+
+
+# ─── Runs and baselines ───────────────────────────────────────────────────────
+
+def run_benchmarks(datasets: list = DATASETS, trains: int = BENCH_TRAINS, places: int = BENCH_PLACES,
+                   repeat: int = BENCH_REPEAT, only: str = "", seed: int = 0) -> dict:
+    """Time every case on each dataset; keys are "<dataset>/<case>"."""
+    # The router loads its bundled JSON by relative path
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    import promptflow_router as router
+    # Keep per-call INFO lines (and the terminal writing them) out of the timings
+    logging.getLogger("promptflow_router").setLevel(logging.WARNING)
+
+    shipped = shipped_data(router)
+    sizes, results = {}, {}
+    for dataset in datasets:
+        data = shipped if dataset == "shipped" else synthetic_data(router, trains, places, seed)
+        install(router, data)
+        sizes[dataset] = {"trains": len(data["trains"]), "places": len(data["places"]["places"]),
+                          "routes": len(data["routes"]), "weather": len(data["weather"]),
+                          "gazetteer": len(router.GAZETTEER)}
+        for name, func, inputs in cases(router, data, seed):
+            if only and only not in name:
+                continue
+            results[f"{dataset}/{name}"] = measure(func, inputs, repeat)
+            logger.info(f"{dataset}/{name}: {results[f'{dataset}/{name}']['median_us']:.1f} µs")
+    install(router, shipped)
+    return {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "python":     platform.python_version(),
+            "machine":    f"{platform.system()} {platform.machine()} ({platform.node()})",
+            "seed":       seed,
+            "datasets":   sizes,
+        },
+        "results": results,
+    }
+
+
+def compare(current: dict, baseline: dict, tolerance: float = BENCH_TOLERANCE) -> dict:
+    """Median per-call time of each case against the baseline: ok, regressed, improved, new or missing."""
+    report = {}
+    for key in sorted(set(current["results"]) | set(baseline["results"])):
+        now, then = current["results"].get(key), baseline["results"].get(key)
+        if now is None or then is None:
+            report[key] = {"status": "new" if then is None else "missing"}
+            continue
+        ratio  = now["median_us"] / then["median_us"] if then["median_us"] else float("inf")
+        status = "regressed" if ratio > 1 + tolerance else "improved" if ratio < 1 - tolerance else "ok"
+        report[key] = {"status": status, "ratio": round(ratio, 3),
+                       "baseline_us": then["median_us"], "median_us": now["median_us"]}
+    return report
+
+
+def _warn_if_incomparable(current: dict, baseline: dict) -> None:
+    for field in ("python", "machine"):
+        if current["meta"].get(field) != baseline["meta"].get(field):
+            logger.warning(f"Baseline {field} differs ({baseline['meta'].get(field)} vs "
+                           f"{current['meta'].get(field)}); ratios may reflect that, not the code")
+    for dataset, sizes in current["meta"]["datasets"].items():
+        then = baseline["meta"].get("datasets", {}).get(dataset)
+        if then is not None and then != sizes:
+            logger.warning(f"Baseline {dataset} dataset differs ({then} vs {sizes}); its ratios are not like for like")
+
+
+def _print_table(current: dict, report: dict | None) -> None:
+    print(f"{'case':<45} {'median µs':>12} {'min µs':>12} {'±':>9}  {'vs baseline':<20}")
+    for key, r in current["results"].items():
+        versus = ""
+        if report and key in report:
+            entry  = report[key]
+            versus = f"{entry['ratio']:.2f}x {entry['status']}" if "ratio" in entry else entry["status"]
+        print(f"{key:<45} {r['median_us']:>12.1f} {r['min_us']:>12.1f} {r['stdev_us']:>9.1f}  {versus:<20}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Microbenchmarks for the router's local lookups and parsing.")
+    parser.add_argument("--datasets", default=",".join(DATASETS), help="comma-separated: shipped, synthetic")
+    parser.add_argument("--trains", type=int, default=BENCH_TRAINS, help="trains in the synthetic dataset")
+    parser.add_argument("--places", type=int, default=BENCH_PLACES, help="places in the synthetic dataset")
+    parser.add_argument("--repeat", type=int, default=BENCH_REPEAT, help="timed rounds per case")
+    parser.add_argument("--only", default="", help="run only cases whose name contains this")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", default=BENCH_BASELINE, help="baseline file to compare with or save to")
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the baseline")
+    parser.add_argument("--tolerance", type=float, default=BENCH_TOLERANCE,
+                        help="median slowdown counted as a regression (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    datasets = [d.strip() for d in args.datasets.split(",") if d.strip()]
+    unknown  = set(datasets) - set(DATASETS)
+    if unknown:
+        parser.error(f"unknown datasets: {', '.join(sorted(unknown))}")
+    baseline_path = os.path.abspath(args.baseline)
+    json_path     = os.path.abspath(args.json) if args.json else None
+
+    current = run_benchmarks(datasets, args.trains, args.places, args.repeat, args.only, args.seed)
+    report  = None
+    if not args.save_baseline and os.path.exists(baseline_path):
+        with open(baseline_path, encoding="utf-8") as f:
+            baseline = json.load(f)
+        _warn_if_incomparable(current, baseline)
+        report = compare(current, baseline, args.tolerance)
+        current["comparison"] = {"baseline": baseline_path, "tolerance": args.tolerance, "cases": report}
+
+    _print_table(current, report)
+    if json_path:
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(current, f, indent=2)
+    if args.save_baseline:
+        with open(baseline_path, "w", encoding="utf-8") as f:
+            json.dump(current, f, indent=2)
+        logger.info(f"Saved baseline to {baseline_path}")
+
+    regressed = [key for key, entry in (report or {}).items() if entry["status"] == "regressed"]
+    if regressed:
+        logger.error(f"{len(regressed)} case(s) regressed beyond {args.tolerance:.0%}: {', '.join(regressed)}")
+        sys.exit(1)
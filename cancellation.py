@@ -0,0 +1,113 @@
+import time
+import socket
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class RequestCancelled(Exception):
+    """Raised inside the chat pipeline once its answer can no longer be delivered."""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class CancelToken:
+    """
+    Cancellation flag for one /chat request. It is set explicitly when a newer
+    message arrives in the same session, or found set by polling `probe`
+    (at most every `interval` seconds) once the client has disconnected.
+    """
+
+    def __init__(self, probe=None, interval: float = 0.25):
+        self.reason: str | None = None
+        self._event    = threading.Event()
+        self._probe    = probe
+        self.interval  = interval
+        self._probed   = 0.0
+
+    def cancel(self, reason: str) -> None:
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    def cancelled(self) -> bool:
+        if self._event.is_set():
+            return True
+        now = time.monotonic()
+        if self._probe and now - self._probed >= self.interval:
+            self._probed = now
+            if self._probe():
+                self.cancel("disconnected")
+        return self._event.is_set()
+
+    def detach(self) -> None:
+        """Stop watching the original client: another request is now waiting for this answer."""
+        self._probe = None
+
+
+def disconnect_probe(environ: dict):
+    """
+    A callable that reports whether the client socket behind a WSGI request has
+    closed, or None when the server doesn't expose the socket. Peeks one byte
+    without blocking: b"" means the peer sent FIN.
+    """
+    sock = environ.get("gunicorn.socket") or environ.get("werkzeug.socket")
+    if sock is None:
+        return None
+
+    def probe() -> bool:
+        try:
+            return sock.recv(1, socket.MSG_PEEK | socket.MSG_DONTWAIT) == b""
+        except (BlockingIOError, InterruptedError):
+            return False
+        except OSError:
+            return True
+    return probe
+
+
+# ─── One in-flight request per session ────────────────────────────────────────
+
+_inflight: dict = {}   # session_id -> CancelToken
+_inflight_lock = threading.Lock()
+_stats_lock    = threading.Lock()
+_stats = {"superseded": 0, "disconnected": 0, "tokens_saved": 0, "worker_seconds_saved": 0.0}
+
+
+def begin_request(session_id: str | None, token: CancelToken) -> None:
+    """Register token as the session's current request, superseding any earlier one."""
+    if not session_id:
+        return
+    with _inflight_lock:
+        previous = _inflight.get(session_id)
+        _inflight[session_id] = token
+    if previous is not None:
+        previous.cancel("superseded")
+
+
+def end_request(session_id: str | None, token: CancelToken) -> None:
+    if not session_id:
+        return
+    with _inflight_lock:
+        if _inflight.get(session_id) is token:
+            del _inflight[session_id]
+
+
+def record_abort(reason: str, stage: str, tokens_saved: int, seconds_saved: float) -> None:
+    """Account for a pipeline stopped early: completion tokens and worker time not spent."""
+    logger.info(f"Chat request {reason} during {stage}: saved ≈{tokens_saved} tokens, ≈{seconds_saved:.1f}s")
+    with _stats_lock:
+        _stats[reason] = _stats.get(reason, 0) + 1
+        _stats["tokens_saved"]         += tokens_saved
+        _stats["worker_seconds_saved"] += seconds_saved
+
+
+def cancel_stats() -> dict:
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["worker_seconds_saved"] = round(stats["worker_seconds_saved"], 1)
+    with _inflight_lock:
+        stats["in_flight"] = len(_inflight)
+    return stats
@@ -1,22 +1,38 @@
 import os
+import hmac
+import uuid
 import logging
 from flask import (
-    Flask, request, jsonify, session,
+    Flask, Response, request, jsonify, session,
     redirect, url_for, render_template,
 )
 from werkzeug.middleware.proxy_fix import ProxyFix
 from dotenv import load_dotenv
 
-from promptflow_router import parse_and_respond
-from rail_api import rail_api
+from promptflow_router import parse_and_respond, prefetch_stats, classification_stats, answer_cache
+from prompt_builder import token_stats
+from rail_api import rail_api, train_cache
 from road_api import road_api
-from weather_api import weather_api
+from weather_api import weather_api, geocode_cache, weather_cache
 from auth import (
     require_auth,
     register_user, login_user, logout_supabase,
     build_google_oauth_url, exchange_google_code,
 )
-from db import save_exchange, get_chat_history, create_chat_session, upsert_profile
+from db import (
+    save_exchange, get_chat_history_page, list_chat_sessions, encode_session_cursor, search_chat_exchanges,
+    new_chat_session_id, upsert_profile, exchange_queue_stats,
+)
+from warmup import start_warmup, request_started, request_finished, warmup_stats
+from memory import memory_stats
+from cancellation import (
+    CancelToken, RequestCancelled, disconnect_probe, begin_request, end_request, cancel_stats,
+)
+from idempotency import DuplicateCollapser, request_key, fingerprint, MAX_KEY_LENGTH
+from ratelimit import ChatLimiter
+from load_shedding import shedder, MODES, REJECT, SHED_RETRY_AFTER
+import metrics
+from profiler import request_profiler, PROFILE_MAX_MINUTES
 
 load_dotenv()
 
@@ -39,6 +55,20 @@ app.register_blueprint(road_api)
 app.register_blueprint(weather_api)
 
 
+# Let the background cache warm-up yield to live traffic
+@app.before_request
+def _track_request_start():
+    request_started()
+
+
+@app.teardown_request
+def _track_request_end(exc):
+    request_finished()
+
+
+start_warmup()
+
+
 # ─── Pages ────────────────────────────────────────────────────────────────────
 
 @app.route("/")
@@ -192,25 +222,205 @@ def auth_callback():
     return redirect(url_for("index"))
 
 
-# ─── Debug (remove after confirming production env vars) ─────────────────────
-
-@app.route("/debug/env")
-def debug_env():
-    supabase_url = os.getenv("SUPABASE_URL", "NOT SET")
-    # Mask keys — show only first 8 chars
-    def mask(v): return (v[:8] + "...") if v and v != "NOT SET" else v
+# ─── Operational metrics ──────────────────────────────────────────────────────
+
+# Bearer token for /metrics (open without it) and /debug/stats (disabled without it)
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+# Bearer token for /admin/* endpoints; they are disabled when it is unset
+ADMIN_TOKEN   = os.getenv("ADMIN_TOKEN", "")
+CONFIG_VARS   = ["SUPABASE_URL", "SUPABASE_ANON_KEY", "SUPABASE_SERVICE_KEY", "HF_TOKEN",
+                 "RAPIDAPI_KEY", "ORS_API_KEY", "TOMORROW_API_KEY", "FLASK_SECRET_KEY"]
+
+
+def _bearer_matches(token: str) -> bool:
+    supplied = request.headers.get("Authorization", "").removeprefix("Bearer ").strip()
+    # Compared as bytes: compare_digest raises TypeError on non-ASCII str
+    return hmac.compare_digest(supplied.encode(), token.encode())
+
+
+def _numeric_families(section: str, stats: dict) -> list:
+    """One untyped family per numeric entry of a stats dict: travel_<section>_<key>."""
+    return [
+        (f"travel_{section}_{key}", "untyped", f"{section} {key.replace('_', ' ')}", [({}, value)])
+        for key, value in stats.items()
+        if isinstance(value, (int, float))
+    ]
+
+
+def _collect_metrics() -> list:
+    caches = {
+        "geocode": geocode_cache.stats(),
+        "weather": weather_cache.stats(),
+        "train":   train_cache.stats(),
+        "answers": answer_cache.stats(),
+    }
+    tokens = token_stats()
+    shed   = shedder.stats()
+    sources = {k: v for k, v in classification_stats().items() if k != "local_model"}
+    families = [
+        ("travel_cache_hits_total", "counter", "Cache hits",
+         [({"cache": name}, stats["hits"]) for name, stats in caches.items()]),
+        ("travel_cache_misses_total", "counter", "Cache misses",
+         [({"cache": name}, stats["misses"]) for name, stats in caches.items()]),
+        ("travel_cache_entries", "gauge", "Entries held per cache",
+         [({"cache": name}, stats["size"]) for name, stats in caches.items()]),
+        ("travel_llm_calls_total", "counter", "LLM calls by call type",
+         [({"call": call}, stats["calls"]) for call, stats in tokens.items()]),
+        ("travel_llm_tokens_total", "counter", "Estimated LLM tokens by call type",
+         [({"call": call, "kind": kind}, stats[f"{kind}_tokens"])
+          for call, stats in tokens.items() for kind in ("prompt", "completion")]),
+        ("travel_llm_hit_max_tokens_total", "counter", "LLM completions cut off at max_tokens",
+         [({"call": call}, stats["hit_cap"]) for call, stats in tokens.items()]),
+        ("travel_classifications_total", "counter", "Messages classified, by tier",
+         [({"source": source}, count) for source, count in sources.items()]),
+        ("travel_load_shedding_mode", "gauge", "1 for the current load-shedding mode",
+         [({"mode": mode}, int(mode == shed["mode"])) for mode in MODES]),
+        ("travel_chats_in_flight", "gauge", "Chats being answered by this worker", [({}, shed["in_flight"])]),
+        ("travel_llm_latency_seconds", "gauge", "Mean LLM time to first token over the shedding window",
+         [({}, shed["llm_latency"])]),
+        ("travel_config_present", "gauge", "1 if the environment variable is set",
+         [({"var": var}, int(bool(os.getenv(var)))) for var in CONFIG_VARS]),
+    ]
+    for section, stats in [
+        ("exchange_queue", exchange_queue_stats()),
+        ("prefetch",       prefetch_stats()),
+        ("memory",         memory_stats()),
+        ("cancellation",   cancel_stats()),
+        ("idempotency",    chat_requests.stats()),
+        ("rate_limit",     chat_limiter.stats()),
+        ("warmup",         warmup_stats()),
+    ]:
+        families.extend(_numeric_families(section, stats))
+    return families
+
+
+metrics.register(_collect_metrics)
+
+
+@app.route("/metrics")
+def prometheus_metrics():
+    if METRICS_TOKEN and not _bearer_matches(METRICS_TOKEN):
+        return Response("Unauthorized\n", status=401, mimetype="text/plain")
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/admin/profiler", methods=["GET", "POST", "DELETE"])
+def admin_profiler():
+    """
+    GET: profiler status. POST {"requests": N} or {"percent": P} (optional "minutes"):
+    profile the next N /chat requests or P% of them. DELETE: stop.
+    """
+    if not ADMIN_TOKEN:
+        return jsonify({"error": "Not found"}), 404
+    if not _bearer_matches(ADMIN_TOKEN):
+        return jsonify({"error": "Unauthorized"}), 401
+    if request.method == "DELETE":
+        return jsonify(request_profiler.disarm())
+    if request.method == "POST":
+        data = request.get_json(silent=True) or {}
+        try:
+            count, percent = int(data.get("requests", 0)), float(data.get("percent", 0))
+            minutes = float(data.get("minutes", PROFILE_MAX_MINUTES))
+        except (TypeError, ValueError):
+            return jsonify({"error": "requests, percent and minutes must be numbers."}), 400
+        if count <= 0 and percent <= 0:
+            return jsonify({"error": "Give a positive requests count or percent."}), 400
+        return jsonify(request_profiler.arm(count, percent, minutes))
+    return jsonify(request_profiler.status())
+
+
+@app.route("/debug/stats")
+def debug_stats():
+    # Every subsystem's internals: only for holders of the metrics token
+    if not METRICS_TOKEN:
+        return jsonify({"error": "Not found"}), 404
+    if not _bearer_matches(METRICS_TOKEN):
+        return jsonify({"error": "Unauthorized"}), 401
     return jsonify({
-        "SUPABASE_URL":          supabase_url,
-        "SUPABASE_ANON_KEY":     mask(os.getenv("SUPABASE_ANON_KEY", "NOT SET")),
-        "SUPABASE_SERVICE_KEY":  mask(os.getenv("SUPABASE_SERVICE_KEY", "NOT SET")),
-        "HF_TOKEN":              mask(os.getenv("HF_TOKEN", "NOT SET")),
-        "FLASK_ENV":             os.getenv("FLASK_ENV", "NOT SET"),
-        "PORT":                  os.getenv("PORT", "NOT SET"),
+        "exchange_queue": exchange_queue_stats(),
+        "caches": {
+            "geocode": geocode_cache.stats(),
+            "weather": weather_cache.stats(),
+            "train":   train_cache.stats(),
+            "answers": answer_cache.stats(),
+        },
+        "warmup": warmup_stats(),
+        "memory": memory_stats(),
+        "prefetch": prefetch_stats(),
+        "classification": classification_stats(),
+        "tokens": token_stats(),
+        "cancellation": cancel_stats(),
+        "idempotency": chat_requests.stats(),
+        "rate_limit": chat_limiter.stats(),
+        "load_shedding": shedder.stats(),
     })
 
 
 # ─── Chat API ─────────────────────────────────────────────────────────────────
 
+# Double submits of one message share a single pipeline run and exchange row
+chat_requests = DuplicateCollapser()
+# Per-user token bucket and in-flight cap, shared across workers when there are several
+chat_limiter = ChatLimiter()
+
+RATE_LIMIT_MESSAGES = {
+    "rate":        "You're sending messages too quickly. Please wait a moment and try again.",
+    "concurrency": "Please wait for your other messages to be answered first.",
+}
+OVERLOADED_MESSAGE = "I'm getting a lot of questions right now. Please try again in a few seconds."
+
+
+def _run_chat(user_id: str, session_id: str, user_msg: str, token: CancelToken) -> tuple[dict, int, dict]:
+    # Under pressure the pipeline degrades (rules-only, then no LLM) before refusing work.
+    # Checked before the rate limit, so a refused chat doesn't cost the user a token.
+    mode = shedder.enter()
+    if mode == REJECT:
+        return ({"error": OVERLOADED_MESSAGE, "retry_after": SHED_RETRY_AFTER}, 503,
+                {"Retry-After": str(SHED_RETRY_AFTER)})
+    try:
+        lease, reason, retry_after = chat_limiter.acquire(user_id)
+        if lease is None:
+            logger.info(f"Chat from {user_id} limited ({reason}), retry after {retry_after}s")
+            return ({"error": RATE_LIMIT_MESSAGES[reason], "retry_after": retry_after}, 429,
+                    {"Retry-After": str(retry_after)})
+        try:
+            return _answer_chat(user_id, session_id, user_msg, token, mode)
+        finally:
+            chat_limiter.release(user_id, lease)
+    finally:
+        shedder.leave()
+
+
+def _answer_chat(user_id: str, session_id: str, user_msg: str, token: CancelToken,
+                 mode: str) -> tuple[dict, int, dict]:
+    # A newer message in this session, or the client going away, stops this one early
+    begin_request(session_id, token)
+    trace   = {}
+    profile = request_profiler.start()   # None unless an admin armed the profiler
+    try:
+        bot_reply = parse_and_respond(user_msg, session_id, trace, token, mode)
+    except RequestCancelled as e:
+        trace["cancelled"] = e.reason
+        return {"error": e.reason}, 409, {}
+    except Exception as e:
+        # Not saved and not replayable: a retry with the same Idempotency-Key runs again
+        logger.error(f"parse_and_respond error: {e}")
+        return {"error": "Sorry, something went wrong. Please try again."}, 500, {}
+    finally:
+        end_request(session_id, token)
+        request_profiler.finish(profile, intent=trace.get("intent"), intent_source=trace.get("intent_source"),
+                                mode=mode, cancelled=trace.get("cancelled"))
+
+    if session_id:
+        try:
+            save_exchange(session_id, user_id, user_msg, bot_reply,
+                          trace.get("intent"), trace.get("intent_source"))
+        except Exception as e:
+            logger.warning(f"Failed to save exchange to DB: {e}")
+
+    return {"response": bot_reply}, 200, {}
+
+
 @app.route("/chat", methods=["POST"])
 @require_auth
 def chat():
@@ -218,37 +428,110 @@ def chat():
     user_msg = (data.get("message") or "").strip()
     if not user_msg:
         return jsonify({"error": "Message cannot be empty."}), 400
+    header_key = request.headers.get("Idempotency-Key", "").strip()
+    if len(header_key) > MAX_KEY_LENGTH:
+        return jsonify({"error": f"Idempotency-Key must be at most {MAX_KEY_LENGTH} characters."}), 400
 
     user_id    = session["user_id"]
     session_id = session.get("db_session_id")
-
+    if not session_id:
+        # Cookies from before lazy session creation may not carry an id yet
+        session_id = session["db_session_id"] = new_chat_session_id()
+
+    key, ttl = request_key(user_id, session_id, user_msg, header_key or None)
+    # A derived key already encodes the message; a client's key must keep meaning the same message
+    used_for = fingerprint(user_msg) if header_key else None
+    token    = CancelToken(disconnect_probe(request.environ))
+    while True:
+        role, flight = chat_requests.claim(key, ttl, owner=token, fingerprint=used_for)
+        if role == "conflict":
+            return jsonify({"error": "This Idempotency-Key was already used for a different message."}), 422
+        if role == "replay":
+            body, status, headers = flight
+            return jsonify(body), status, {**headers, "Idempotent-Replayed": "true"}
+        if role == "lead":
+            break
+        # The original keeps running for us even if its own client has gone
+        flight.owner.detach()
+        result = flight.wait()
+        if result is None:
+            chat_requests.wait_timed_out()
+            return jsonify({"error": "Your message is still being answered."}), 503, {"Retry-After": "5"}
+        body, status, headers = result
+        if body.get("error") != "disconnected":
+            return jsonify(body), status, {**headers, "Idempotent-Replayed": "true"}
+        # Its client went away before we attached, so nobody got an answer: compute it ourselves
+
+    result = ({"error": "Sorry, something went wrong. Please try again."}, 500, {})
     try:
-        bot_reply = parse_and_respond(user_msg)
-    except Exception as e:
-        logger.error(f"parse_and_respond error: {e}")
-        bot_reply = "Sorry, something went wrong. Please try again."
-
-    if session_id:
-        try:
-            save_exchange(session_id, user_id, user_msg, bot_reply)
-        except Exception as e:
-            logger.warning(f"Failed to save exchange to DB: {e}")
-
-    return jsonify({"response": bot_reply})
+        result = _run_chat(user_id, session_id, user_msg, token)
+    finally:
+        # Only answers are replayed; a cancelled, limited or failed request may be retried
+        chat_requests.finish(key, flight, result, replayable=result[1] == 200)
+    body, status, headers = result
+    return jsonify(body), status, headers
 
 
 @app.route("/history", methods=["GET"])
 @require_auth
 def history():
     session_id = session.get("db_session_id")
-    if not session_id:
-        return jsonify({"messages": []})
+    # ?session_id= opens a past session from /sessions; rows are then scoped to the user
+    requested  = request.args.get("session_id") or session_id
+    if not requested:
+        return jsonify({"messages": [], "next_cursor": None})
+
+    limit  = min(max(request.args.get("limit", 50, type=int), 1), 100)
+    cursor = request.args.get("cursor") or None
+    owner  = session["user_id"] if requested != session_id else None
     try:
-        msgs = get_chat_history(session_id)
-        return jsonify({"messages": msgs})
+        if owner:
+            uuid.UUID(requested)
+        page = get_chat_history_page(requested, limit, cursor, owner)
+    except ValueError:
+        return jsonify({"error": "Invalid cursor or session id."}), 400
     except Exception as e:
         logger.warning(f"Failed to load history: {e}")
-        return jsonify({"messages": []})
+        return jsonify({"messages": [], "next_cursor": None})
+
+    # Unchanged history revalidates to a bodiless 304
+    response = jsonify(page)
+    response.add_etag()
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response.make_conditional(request)
+
+
+@app.route("/history/search", methods=["GET"])
+@require_auth
+def history_search():
+    query = (request.args.get("q") or "").strip()
+    if len(query) < 2:
+        return jsonify({"error": "Search query must be at least 2 characters."}), 400
+    if len(query) > 200:
+        return jsonify({"error": "Search query is too long."}), 400
+
+    limit  = min(max(request.args.get("limit", 20, type=int), 1), 50)
+    offset = max(request.args.get("offset", 0, type=int), 0)
+    results = search_chat_exchanges(session["user_id"], query, limit, offset)
+    return jsonify({"results": results})
+
+
+@app.route("/sessions", methods=["GET"])
+@require_auth
+def sessions():
+    limit  = min(max(request.args.get("limit", 50, type=int), 1), 200)
+    before = request.args.get("before") or None
+    try:
+        rows = list_chat_sessions(session["user_id"], limit, before)
+    except ValueError:
+        return jsonify({"error": "Invalid before cursor."}), 400
+    current = session.get("db_session_id")
+    for row in rows:
+        row["current"] = row["id"] == current
+    return jsonify({
+        "sessions":    rows,
+        "next_before": encode_session_cursor(rows[-1]) if len(rows) == limit else None,
+    })
 
 
 # ─── Helpers ──────────────────────────────────────────────────────────────────
@@ -258,8 +541,8 @@ def _set_session(user_id: str, email: str, full_name: str, avatar_url: str) -> N
     session["user_email"] = email
     session["user_name"]  = full_name
     session["user_avatar"] = avatar_url
-    db_session_id = create_chat_session(user_id)
-    session["db_session_id"] = db_session_id
+    # The chat_sessions row is written with the first exchange, not at login
+    session["db_session_id"] = new_chat_session_id()
 
 
 if __name__ == "__main__":
@@ -1,8 +1,18 @@
 import os
+import time
+import uuid
+import queue
+import base64
+import atexit
 import logging
+import threading
+from datetime import datetime, timezone
 from dotenv import load_dotenv
 from supabase import create_client, Client
 
+from cache import TTLCache
+from metrics import span, timed, DB_SECONDS
+
 load_dotenv()
 
 logger = logging.getLogger(__name__)
@@ -13,6 +23,16 @@ _service_key = os.getenv("SUPABASE_SERVICE_KEY", "")
 # Service-role client — bypasses RLS; used only on the trusted server side
 supabase: Client = create_client(_url, _service_key) if _url and _service_key else None
 
+# Write-behind settings for chat_exchanges (see save_exchange)
+EXCHANGE_BATCH_SIZE     = int(os.getenv("EXCHANGE_BATCH_SIZE", 50))
+EXCHANGE_FLUSH_INTERVAL = float(os.getenv("EXCHANGE_FLUSH_INTERVAL", 2))
+EXCHANGE_QUEUE_MAX      = int(os.getenv("EXCHANGE_QUEUE_MAX", 5000))
+EXCHANGE_MAX_RETRIES    = int(os.getenv("EXCHANGE_MAX_RETRIES", 5))
+
+# Newest exchanges kept in-process per session for /history (see get_chat_history_page)
+HISTORY_CACHE_ROWS = int(os.getenv("HISTORY_CACHE_ROWS", 100))
+HISTORY_CACHE_TTL  = float(os.getenv("HISTORY_CACHE_TTL", 300))
+
 
 def _check_client() -> None:
     if supabase is None:
@@ -24,6 +44,7 @@ def _check_client() -> None:
 
 # ─── Profiles ─────────────────────────────────────────────────────────────────
 
+@timed(DB_SECONDS, op="upsert_profile")
 def upsert_profile(user_id: str, full_name: str, avatar_url: str, provider: str = "email") -> None:
     """Create or update the user's profile row (called after login/OAuth)."""
     _check_client()
@@ -38,6 +59,7 @@ def upsert_profile(user_id: str, full_name: str, avatar_url: str, provider: str
         logger.error(f"upsert_profile failed: {e}")
 
 
+@timed(DB_SECONDS, op="get_profile")
 def get_profile(user_id: str) -> dict:
     """Return the profile row for a user, or {} if not found."""
     _check_client()
@@ -57,55 +79,457 @@ def get_profile(user_id: str) -> dict:
 
 # ─── Chat Sessions ────────────────────────────────────────────────────────────
 
-def create_chat_session(user_id: str) -> str | None:
-    """Insert a new chat session row and return its UUID."""
+# Sessions are created lazily: login only generates the id, and the
+# chat_sessions row is upserted alongside the first batched exchange insert,
+# so logins never wait on the database and idle logins leave no empty rows.
+
+_persisted_sessions = TTLCache(ttl=86400, maxsize=10000)
+
+
+def new_chat_session_id() -> str:
+    """Return a fresh chat session UUID without touching the database."""
+    session_id = str(uuid.uuid4())
+    # A brand-new session is known to be empty, so its history never needs a query
+    _history_cache.set(session_id, ([], True))
+    return session_id
+
+
+def _ensure_chat_sessions(rows: list) -> None:
+    """Upsert the chat_sessions rows referenced by rows that this process hasn't written yet."""
+    pending = {
+        row["session_id"]: row["user_id"]
+        for row in rows if row["session_id"] not in _persisted_sessions
+    }
+    if not pending:
+        return
+    with span(DB_SECONDS, op="ensure_chat_sessions"):
+        supabase.table("chat_sessions").upsert(
+            [{"id": sid, "user_id": uid} for sid, uid in pending.items()],
+            on_conflict="id",
+            ignore_duplicates=True,
+        ).execute()
+    for sid in pending:
+        _persisted_sessions.set(sid, True)
+
+
+@timed(DB_SECONDS, op="list_chat_sessions")
+def list_chat_sessions(user_id: str, limit: int = 50, before: str | None = None) -> list:
+    """Return the user's non-empty sessions, most recently active first, via one aggregated RPC.
+    Each row has id, created_at, updated_at, exchange_count and preview (first user message).
+    before is a cursor from encode_session_cursor(); raises ValueError if it is malformed."""
     _check_client()
+    before_at, before_id = _decode_cursor(before) if before else (None, None)
     try:
-        res = supabase.table("chat_sessions").insert({"user_id": user_id}).execute()
-        return res.data[0]["id"] if res.data else None
+        res = supabase.rpc("list_chat_sessions", {
+            "p_user_id":   user_id,
+            "p_limit":     limit,
+            "p_before":    before_at,
+            "p_before_id": before_id,
+        }).execute()
+        return res.data or []
     except Exception as e:
-        logger.error(f"create_chat_session failed: {e}")
-        return None
-
+        logger.error(f"list_chat_sessions failed: {e}")
+        return []
 
 
 # ─── Chat Exchanges (paired user + assistant per row) ─────────────────────────
+#
+# Exchanges are written behind the response: save_exchange only enqueues the row,
+# and a background flusher batch-inserts up to EXCHANGE_BATCH_SIZE rows per
+# PostgREST call whenever the batch fills or EXCHANGE_FLUSH_INTERVAL elapses.
+
+_exchange_queue: queue.Queue = queue.Queue(maxsize=EXCHANGE_QUEUE_MAX)
+_flush_wakeup  = threading.Event()
+_flush_lock    = threading.Lock()
+_flusher_lock  = threading.Lock()
+_flusher: threading.Thread | None = None
+_writer_lock   = threading.Lock()
+_writer_stats  = {"enqueued": 0, "flushed": 0, "batches": 0, "retries": 0, "isolated": 0,
+                  "failed": 0, "dropped": 0}
+# Cleared (and logged once) when inserts show migration 009 hasn't been run
+_intent_columns = True
+
 
-def save_exchange(session_id: str, user_id: str, user_message: str, assistant_reply: str) -> None:
-    """Persist one full exchange (user prompt + assistant reply) as a single row."""
+def _count_writes(**counts) -> None:
+    with _writer_lock:
+        for key, n in counts.items():
+            _writer_stats[key] += n
+
+
+def save_exchange(session_id: str, user_id: str, user_message: str, assistant_reply: str,
+                  intent: str | None = None, intent_source: str | None = None) -> None:
+    """Queue one full exchange (user prompt + assistant reply) for a batched insert.
+    intent / intent_source record how the router classified the message (migration 009)."""
     if not session_id:
         return
     _check_client()
+    # id and created_at are assigned here so cached history and the table agree on keyset order
+    row = {
+        "id":              str(uuid.uuid4()),
+        "session_id":      session_id,
+        "user_id":         user_id,
+        "user_message":    user_message,
+        "assistant_reply": assistant_reply,
+        "intent":          intent,
+        "intent_source":   intent_source,
+        "created_at":      datetime.now(timezone.utc).isoformat(),
+    }
     try:
-        supabase.table("chat_exchanges").insert({
-            "session_id":      session_id,
-            "user_id":         user_id,
-            "user_message":    user_message,
-            "assistant_reply": assistant_reply,
-        }).execute()
+        _exchange_queue.put_nowait(row)
+        _count_writes(enqueued=1)
+    except queue.Full:
+        _count_writes(dropped=1)
+        logger.error(f"save_exchange dropped a row: write-behind queue full ({EXCHANGE_QUEUE_MAX})")
+        return
+    _remember_exchange(row)
+    _ensure_flusher()
+    if _exchange_queue.qsize() >= EXCHANGE_BATCH_SIZE:
+        _flush_wakeup.set()
+
+
+def _missing_intent_columns(error: Exception) -> bool:
+    """True for PostgREST's unknown-column error on intent / intent_source (migration 009 not run)."""
+    text = str(error)
+    return "column" in text and ("'intent'" in text or "'intent_source'" in text)
+
+
+def _insert_batch(rows: list) -> None:
+    global _intent_columns
+    _ensure_chat_sessions(rows)
+    if not _intent_columns:
+        rows = [{k: v for k, v in row.items() if k not in ("intent", "intent_source")} for row in rows]
+    try:
+        with span(DB_SECONDS, op="insert_exchanges"):
+            supabase.table("chat_exchanges").insert(rows).execute()
     except Exception as e:
-        logger.error(f"save_exchange failed: {e}")
+        if not _intent_columns or not _missing_intent_columns(e):
+            raise
+        _intent_columns = False
+        logger.error("chat_exchanges has no intent/intent_source columns; run migrations/009_exchanges_intent.sql. "
+                     "Saving exchanges without them until then.")
+        return _insert_batch(rows)
+    _count_writes(flushed=len(rows), batches=1)
 
 
-def get_chat_history(session_id: str, limit: int = 50) -> list:
-    """Return ordered exchanges for a session as a flat [user, assistant, ...] list."""
+def _insert_exchanges(rows: list) -> None:
+    """Bulk-insert rows, retrying with exponential backoff, then isolating the rows that fail."""
+    for attempt in range(EXCHANGE_MAX_RETRIES):
+        try:
+            _insert_batch(rows)
+            return
+        except Exception as e:
+            _count_writes(retries=1)
+            delay = min(0.5 * 2 ** attempt, 30)
+            logger.warning(f"save_exchange batch failed ({e}), retrying in {delay}s")
+            time.sleep(delay)
+    _insert_bisecting(rows)
+
+
+def _insert_bisecting(rows: list) -> None:
+    """Last attempt: split a failing batch in halves until only the bad rows are left out."""
+    try:
+        _insert_batch(rows)
+        return
+    except Exception as e:
+        if len(rows) == 1:
+            _count_writes(failed=1)
+            _forget_exchange(rows[0])
+            logger.error(f"save_exchange dropped exchange {rows[0]['id']} of session "
+                         f"{rows[0]['session_id']} after {EXCHANGE_MAX_RETRIES + 1} attempts: {e}")
+            return
+        _count_writes(isolated=1)
+    middle = len(rows) // 2
+    _insert_bisecting(rows[:middle])
+    _insert_bisecting(rows[middle:])
+
+
+def flush_exchanges() -> int:
+    """Write every queued exchange now; returns the number of rows taken off the queue."""
+    taken = 0
+    with _flush_lock:
+        while True:
+            rows = []
+            while len(rows) < EXCHANGE_BATCH_SIZE:
+                try:
+                    rows.append(_exchange_queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not rows:
+                return taken
+            taken += len(rows)
+            _insert_exchanges(rows)
+
+
+def _flush_loop() -> None:
+    while True:
+        _flush_wakeup.wait(EXCHANGE_FLUSH_INTERVAL)
+        _flush_wakeup.clear()
+        try:
+            flush_exchanges()
+        except Exception as e:
+            logger.error(f"Write-behind flush failed: {e}")
+
+
+def _ensure_flusher() -> None:
+    global _flusher
+    if _flusher is not None:
+        return
+    with _flusher_lock:
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flush_loop, name="exchange-flusher", daemon=True)
+            _flusher.start()
+
+
+def exchange_queue_stats() -> dict:
+    with _writer_lock:
+        stats = dict(_writer_stats)
+    return {**stats, "queue_depth": _exchange_queue.qsize()}
+
+
+# Don't lose queued rows on a clean shutdown (gunicorn workers also flush in worker_exit)
+atexit.register(flush_exchanges)
+
+
+# ─── Chat History (keyset-paginated, newest first) ────────────────────────────
+#
+# Pages walk backwards in time on (created_at, id). The newest rows of each
+# recently used session are cached in-process and kept current by
+# save_exchange, so reopening a session doesn't query Supabase at all.
+
+_history_cache = TTLCache(ttl=HISTORY_CACHE_TTL, maxsize=256)
+_history_lock  = threading.Lock()
+
+
+def _forget_exchange(row: dict) -> None:
+    """Take an exchange that could not be saved back out of its session's cached rows."""
+    with _history_lock:
+        cached = _history_cache.peek(row["session_id"])
+        if cached is None:
+            return
+        rows, exhausted = cached
+        _history_cache.set(row["session_id"], ([r for r in rows if r["id"] != row["id"]], exhausted))
+
+
+def _remember_exchange(row: dict) -> None:
+    """Prepend a freshly saved exchange to its session's cached newest-first rows."""
+    with _history_lock:
+        cached = _history_cache.peek(row["session_id"])
+        if cached is None:
+            return
+        rows, exhausted = cached
+        rows = [row] + rows
+        if len(rows) > HISTORY_CACHE_ROWS:
+            rows, exhausted = rows[:HISTORY_CACHE_ROWS], False
+        _history_cache.set(row["session_id"], (rows, exhausted))
+
+
+
+def _encode_cursor(timestamp: str, row_id: str) -> str:
+    raw = f"{timestamp}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> tuple[str, str]:
+    """Return (timestamp, id) from a cursor. Raises ValueError if it is malformed."""
+    raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+    timestamp, _, row_id = raw.partition("|")
+    if not timestamp or not row_id:
+        raise ValueError("Malformed cursor")
+    datetime.fromisoformat(timestamp)
+    uuid.UUID(row_id)
+    return timestamp, row_id
+
+
+def encode_history_cursor(row: dict) -> str:
+    return _encode_cursor(row["created_at"], row["id"])
+
+
+def decode_history_cursor(cursor: str) -> tuple[str, str]:
+    """Return (created_at, id) from a cursor. Raises ValueError if it is malformed."""
+    return _decode_cursor(cursor)
+
+
+def encode_session_cursor(row: dict) -> str:
+    return _encode_cursor(row["updated_at"], row["id"])
+
+
+def _to_messages(rows: list) -> list:
+    """Flatten newest-first exchange rows into a chronological [user, assistant, ...] list."""
+    messages = []
+    for row in reversed(rows):
+        messages.append({"role": "user",      "content": row["user_message"],    "created_at": row["created_at"]})
+        messages.append({"role": "assistant",  "content": row["assistant_reply"], "created_at": row["created_at"]})
+    return messages
+
+
+@timed(DB_SECONDS, op="query_history")
+def _query_history(session_id: str, limit: int, before: tuple[str, str] | None, user_id: str | None) -> list:
+    query = (
+        supabase.table("chat_exchanges")
+        .select("id, user_message, assistant_reply, created_at")
+        .eq("session_id", session_id)
+    )
+    if user_id:
+        query = query.eq("user_id", user_id)
+    if before:
+        created_at, row_id = before
+        query = query.or_(f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{row_id})')
+    res = (
+        query.order("created_at", desc=True)
+        .order("id", desc=True)
+        .limit(limit)
+        .execute()
+    )
+    return res.data or []
+
+
+def get_chat_history_page(session_id: str, limit: int = 50, cursor: str | None = None,
+                          user_id: str | None = None) -> dict:
+    """
+    Return one page of a session's history, newest page first.
+    {"messages": [...chronological within the page...], "next_cursor": str | None}
+    Pass next_cursor back as cursor to fetch the page of older exchanges.
+    Passing user_id restricts rows to that owner (for browsing past sessions) and skips the cache.
+    Raises ValueError for a malformed cursor.
+    """
     if not session_id:
+        return {"messages": [], "next_cursor": None}
+    before = decode_history_cursor(cursor) if cursor else None
+    use_cache = not before and not user_id
+
+    cached = _history_cache.get(session_id) if use_cache else None
+    if cached is not None and (cached[1] or len(cached[0]) > limit):
+        rows, exhausted = cached
+        page = rows[:limit]
+        more = len(rows) > limit or not exhausted
+    else:
+        _check_client()
+        try:
+            # One extra row tells us whether an older page exists
+            fetched = _query_history(session_id, limit + 1, before, user_id)
+        except Exception as e:
+            logger.error(f"get_chat_history_page failed: {e}")
+            return {"messages": [], "next_cursor": None}
+        page, more = fetched[:limit], len(fetched) > limit
+        if use_cache:
+            with _history_lock:
+                exhausted = not more and len(fetched) <= HISTORY_CACHE_ROWS
+                current = _history_cache.peek(session_id)
+                if current is None:
+                    _history_cache.set(session_id, (fetched[:HISTORY_CACHE_ROWS], exhausted))
+                elif not current[1] and len(fetched) > len(current[0]):
+                    # The fetch reaches further back than the cached rows; keep any exchange
+                    # remembered while it ran (queued, not yet flushed) and replace the rest
+                    known = {row["id"] for row in fetched}
+                    merged = [row for row in current[0] if row["id"] not in known] + fetched
+                    merged.sort(key=lambda row: (row["created_at"], row["id"]), reverse=True)
+                    _history_cache.set(session_id, (merged[:HISTORY_CACHE_ROWS],
+                                                    exhausted and len(merged) <= HISTORY_CACHE_ROWS))
+
+    return {
+        "messages":    _to_messages(page),
+        "next_cursor": encode_history_cursor(page[-1]) if more and page else None,
+    }
+
+
+def get_chat_history(session_id: str, limit: int = 50) -> list:
+    """Return the newest `limit` exchanges for a session as a flat chronological [user, assistant, ...] list."""
+    try:
+        return get_chat_history_page(session_id, limit)["messages"]
+    except Exception as e:
+        logger.error(f"get_chat_history failed: {e}")
         return []
+
+
+@timed(DB_SECONDS, op="search_chat_exchanges")
+def search_chat_exchanges(user_id: str, query: str, limit: int = 20, offset: int = 0) -> list:
+    """Full-text search over a user's exchanges (search_chat_exchanges RPC), best match first.
+    Rows carry id, session_id, created_at, rank and **-highlighted user/reply snippets."""
+    _check_client()
+    try:
+        res = supabase.rpc("search_chat_exchanges", {
+            "p_user_id": user_id,
+            "p_query":   query,
+            "p_limit":   limit,
+            "p_offset":  offset,
+        }).execute()
+        return res.data or []
+    except Exception as e:
+        logger.error(f"search_chat_exchanges failed: {e}")
+        return []
+
+
+@timed(DB_SECONDS, op="get_recent_user_messages")
+def get_recent_user_messages(limit: int = 500) -> list[str]:
+    """Return the most recent user messages across all sessions (newest first)."""
     _check_client()
     try:
         res = (
             supabase.table("chat_exchanges")
-            .select("user_message, assistant_reply, created_at")
-            .eq("session_id", session_id)
-            .order("created_at")
+            .select("user_message")
+            .order("created_at", desc=True)
             .limit(limit)
             .execute()
         )
-        messages = []
-        for row in (res.data or []):
-            messages.append({"role": "user",      "content": row["user_message"],    "created_at": row["created_at"]})
-            messages.append({"role": "assistant",  "content": row["assistant_reply"], "created_at": row["created_at"]})
-        return messages
+        return [row["user_message"] for row in (res.data or [])]
     except Exception as e:
-        logger.error(f"get_chat_history failed: {e}")
+        logger.error(f"get_recent_user_messages failed: {e}")
         return []
+
+
+@timed(DB_SECONDS, op="get_llm_labelled_messages")
+def get_llm_labelled_messages(limit: int = 20000, page_size: int = 1000) -> list[tuple[str, str]]:
+    """Return up to `limit` (user_message, intent) pairs the LLM classified, newest first.
+    Training data for the local intent model; errors propagate to the training command."""
+    _check_client()
+    pairs = []
+    while len(pairs) < limit:
+        start = len(pairs)
+        res = (
+            supabase.table("chat_exchanges")
+            .select("user_message, intent")
+            .eq("intent_source", "llm")
+            .not_.is_("intent", "null")
+            .order("created_at", desc=True)
+            .range(start, min(start + page_size, limit) - 1)
+            .execute()
+        )
+        rows = res.data or []
+        pairs.extend((row["user_message"], row["intent"]) for row in rows)
+        if len(rows) < page_size:
+            break
+    return pairs[:limit]
+
+
+# ─── Retention / Archival ─────────────────────────────────────────────────────
+
+@timed(DB_SECONDS, op="get_exchanges_before")
+def get_exchanges_before(cutoff: str, limit: int) -> list:
+    """Return up to `limit` of the oldest exchanges created before cutoff (ISO timestamp)."""
+    _check_client()
+    res = (
+        supabase.table("chat_exchanges")
+        .select("id, session_id, user_id, user_message, assistant_reply, created_at")
+        .lt("created_at", cutoff)
+        .order("created_at")
+        .limit(limit)
+        .execute()
+    )
+    return res.data or []
+
+
+@timed(DB_SECONDS, op="archive_exchanges_batch")
+def archive_exchanges_batch(cutoff: str, batch: int, summarize: bool = True,
+                            to_table: bool = True, ids: list | None = None) -> list:
+    """Move one batch out of chat_exchanges via the archive_chat_exchanges RPC; returns the ids
+    it deleted (rows locked by live requests are skipped). Errors propagate so the archival job
+    can stop instead of skipping data."""
+    _check_client()
+    res = supabase.rpc("archive_chat_exchanges", {
+        "p_cutoff":    cutoff,
+        "p_batch":     batch,
+        "p_summarize": summarize,
+        "p_to_table":  to_table,
+        "p_ids":       ids,
+    }).execute()
+    return list(res.data or [])
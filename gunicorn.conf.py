@@ -0,0 +1,17 @@
+import os
+
+# A chat spends nearly all of its 5–20 s waiting on the LLM and upstream APIs,
+# so request threads (not extra processes) are what let one small instance
+# hold many chats in flight. CHAT_CONCURRENCY is the number of threads per worker.
+bind         = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers      = int(os.getenv("WEB_CONCURRENCY", 1))
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+threads      = int(os.getenv("CHAT_CONCURRENCY", 32))
+timeout      = int(os.getenv("GUNICORN_TIMEOUT", 120))
+keepalive    = 5
+
+
+def worker_exit(server, worker):
+    # Flush chat exchanges still queued by the write-behind writer
+    from db import flush_exchanges
+    flush_exchanges()
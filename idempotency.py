@@ -0,0 +1,112 @@
+import os
+import hashlib
+import logging
+import threading
+from dotenv import load_dotenv
+
+from cache import TTLCache
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# A repeat of the same message in the same session within this many seconds is
+# treated as a double submit, even without an Idempotency-Key header
+IDEMPOTENCY_WINDOW = float(os.getenv("IDEMPOTENCY_WINDOW", 10))
+# How long a reply stays replayable for a client-supplied Idempotency-Key
+IDEMPOTENCY_TTL    = float(os.getenv("IDEMPOTENCY_TTL", 300))
+# How long a duplicate waits for the original request before giving up
+IDEMPOTENCY_WAIT   = float(os.getenv("IDEMPOTENCY_WAIT", 90))
+
+MAX_KEY_LENGTH = 255
+
+
+def request_key(user_id: str, session_id: str | None, message: str, header_key: str | None = None) -> tuple[str, float]:
+    """
+    (key, replay TTL) identifying a /chat submission. A client-supplied key is
+    scoped to the user; otherwise the key is derived from the session and the
+    whitespace/case-normalised message and only lives for IDEMPOTENCY_WINDOW.
+    """
+    if header_key:
+        return f"{user_id}:key:{header_key}", IDEMPOTENCY_TTL
+    digest = hashlib.sha256(" ".join(message.lower().split()).encode()).hexdigest()[:32]
+    return f"{user_id}:{session_id}:{digest}", IDEMPOTENCY_WINDOW
+
+
+def fingerprint(message: str) -> str:
+    """What a key was first used for; a reused key must come with the same message."""
+    return hashlib.sha256(message.encode()).hexdigest()
+
+
+class Flight:
+    """One in-progress computation that duplicates can wait on."""
+
+    def __init__(self, ttl: float, owner=None, fingerprint: str | None = None):
+        self.ttl         = ttl
+        self.owner       = owner      # whatever the leader wants followers to reach (its cancel token)
+        self.fingerprint = fingerprint
+        self.response    = None
+        self._done       = threading.Event()
+
+    def wait(self, timeout: float = IDEMPOTENCY_WAIT):
+        """The leader's response, or None if it isn't ready within timeout."""
+        return self.response if self._done.wait(timeout) else None
+
+
+class DuplicateCollapser:
+    """
+    Thread-safe single-flight table with replay. The first request for a key
+    leads and computes; concurrent duplicates attach to its Flight; later
+    duplicates get the stored response until its TTL runs out.
+    """
+
+    def __init__(self, maxsize: int = 4096):
+        self._inflight: dict = {}   # key -> Flight
+        self._done  = TTLCache(ttl=IDEMPOTENCY_TTL, maxsize=maxsize)   # key -> (fingerprint, response)
+        self._lock  = threading.Lock()
+        self._stats = {"computed": 0, "attached": 0, "replayed": 0, "wait_timeouts": 0, "conflicts": 0}
+
+    def claim(self, key: str, ttl: float, owner=None, fingerprint: str | None = None) -> tuple[str, object]:
+        """
+        ("replay", response) for a recently completed key, ("attach", flight) if
+        one is running, otherwise ("lead", flight): the caller must compute and
+        then call finish(). ("conflict", None) if the key was used with a
+        different fingerprint (see fingerprint()).
+        """
+        with self._lock:
+            done   = self._done.peek(key)
+            flight = self._inflight.get(key)
+            used_for = done[0] if done is not None else flight.fingerprint if flight is not None else None
+            if used_for is not None and fingerprint is not None and used_for != fingerprint:
+                self._stats["conflicts"] += 1
+                return "conflict", None
+            if done is not None:
+                self._stats["replayed"] += 1
+                return "replay", done[1]
+            if flight is not None:
+                self._stats["attached"] += 1
+                return "attach", flight
+            flight = self._inflight[key] = Flight(ttl, owner, fingerprint)
+            self._stats["computed"] += 1
+            return "lead", flight
+
+    def finish(self, key: str, flight: Flight, response, replayable: bool = True) -> None:
+        """Publish the leader's response to waiting duplicates and, if replayable, to later ones."""
+        with self._lock:
+            if self._inflight.get(key) is flight:
+                del self._inflight[key]
+            if replayable:
+                self._done.set(key, (flight.fingerprint, response), flight.ttl)
+        flight.response = response
+        flight._done.set()
+
+    def wait_timed_out(self) -> None:
+        with self._lock:
+            self._stats["wait_timeouts"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["in_flight"] = len(self._inflight)
+        stats["replayable"] = len(self._done)
+        return stats
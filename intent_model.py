@@ -0,0 +1,202 @@
+import os
+import gzip
+import json
+import math
+import time
+import random
+import logging
+import argparse
+from collections import Counter
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+LOCAL_INTENT_MODEL     = os.getenv("LOCAL_INTENT_MODEL", "intent_model.json.gz")
+LOCAL_INTENT_THRESHOLD = float(os.getenv("LOCAL_INTENT_THRESHOLD", 0.85))
+
+MODEL_VERSION = 1
+
+
+def char_ngrams(text: str, lo: int = 2, hi: int = 4) -> dict:
+    """L2-normalised counts of the character n-grams of a padded, lower-cased message."""
+    text   = f" {' '.join(text.lower().split())} "
+    counts = Counter(text[i:i + n] for n in range(lo, hi + 1) for i in range(len(text) - n + 1))
+    norm   = math.sqrt(sum(c * c for c in counts.values())) or 1.0
+    return {gram: c / norm for gram, c in counts.items()}
+
+
+def _softmax(scores: list) -> list:
+    top  = max(scores)
+    exps = [math.exp(s - top) for s in scores]
+    total = sum(exps)
+    return [e / total for e in exps]
+
+
+class IntentModel:
+    """
+    Multinomial logistic regression over character n-grams, in pure Python.
+    Weights are sparse: only n-grams seen in training (and not pruned) are stored.
+    """
+
+    def __init__(self, classes: list, weights: dict, bias: list, ngram_range: tuple = (2, 4)):
+        self.classes     = classes
+        self.weights     = weights      # ngram -> [weight per class]
+        self.bias        = bias
+        self.ngram_range = tuple(ngram_range)
+
+    def predict(self, message: str) -> tuple[str, float]:
+        """Return (intent, probability) for a message."""
+        scores = list(self.bias)
+        for gram, value in char_ngrams(message, *self.ngram_range).items():
+            row = self.weights.get(gram)
+            if row is not None:
+                for k, w in enumerate(row):
+                    scores[k] += w * value
+        probs = _softmax(scores)
+        best  = max(range(len(probs)), key=probs.__getitem__)
+        return self.classes[best], probs[best]
+
+    # ── Training ────────────────────────────────────────────────────────────
+
+    @classmethod
+    def train(cls, pairs: list, epochs: int = 8, lr: float = 0.5, l2: float = 1e-5,
+              min_count: int = 2, prune: float = 1e-3, ngram_range: tuple = (2, 4), seed: int = 13):
+        """Fit on (message, intent) pairs with SGD; n-grams seen in fewer than min_count messages are dropped."""
+        classes = sorted({intent for _, intent in pairs})
+        index   = {c: k for k, c in enumerate(classes)}
+        docs    = [(char_ngrams(m, *ngram_range), index[i]) for m, i in pairs]
+
+        df = Counter(gram for feats, _ in docs for gram in feats)
+        vocab = {gram for gram, n in df.items() if n >= min_count}
+        docs  = [({g: v for g, v in feats.items() if g in vocab}, y) for feats, y in docs]
+
+        weights = {gram: [0.0] * len(classes) for gram in vocab}
+        bias    = [0.0] * len(classes)
+        rng     = random.Random(seed)
+        for epoch in range(epochs):
+            rng.shuffle(docs)
+            step = lr / (1 + epoch)
+            for feats, y in docs:
+                scores = list(bias)
+                for gram, value in feats.items():
+                    scores = [s + w * value for s, w in zip(scores, weights[gram])]
+                grad = _softmax(scores)
+                grad[y] -= 1.0
+                bias = [b - step * g for b, g in zip(bias, grad)]
+                for gram, value in feats.items():
+                    weights[gram] = [w - step * g * value for w, g in zip(weights[gram], grad)]
+            # L2 shrinkage once per epoch rather than on every update
+            decay = 1 - step * l2 * len(docs)
+            for gram, row in weights.items():
+                weights[gram] = [w * decay for w in row]
+
+        # Keep the file compact: drop n-grams whose weights are all negligible
+        weights = {
+            gram: [round(w, 4) for w in row]
+            for gram, row in weights.items()
+            if max(abs(w) for w in row) >= prune
+        }
+        return cls(classes, weights, [round(b, 4) for b in bias], ngram_range)
+
+    # ── Persistence ─────────────────────────────────────────────────────────
+
+    def save(self, path: str) -> None:
+        payload = {
+            "version":     MODEL_VERSION,
+            "classes":     self.classes,
+            "ngram_range": list(self.ngram_range),
+            "bias":        self.bias,
+            "weights":     self.weights,
+        }
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            json.dump(payload, f, separators=(",", ":"), ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path: str):
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            payload = json.load(f)
+        if payload.get("version") != MODEL_VERSION:
+            raise ValueError(f"Unsupported intent model version {payload.get('version')}")
+        return cls(payload["classes"], payload["weights"], payload["bias"], payload["ngram_range"])
+
+
+def load_local_model(path: str = LOCAL_INTENT_MODEL):
+    """The trained model at path, or None if there is none (the LLM tier then handles everything)."""
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        model = IntentModel.load(path)
+        logger.info(f"Local intent model loaded from {path} ({len(model.weights)} n-grams)")
+        return model
+    except Exception as e:
+        logger.warning(f"Failed to load local intent model from {path}: {e}")
+        return None
+
+
+# ─── Training command ─────────────────────────────────────────────────────────
+
+def _evaluate(model: IntentModel, pairs: list, threshold: float) -> dict:
+    correct = confident = confident_correct = 0
+    start = time.perf_counter()
+    for message, intent in pairs:
+        predicted, prob = model.predict(message)
+        correct += predicted == intent
+        if prob >= threshold:
+            confident += 1
+            confident_correct += predicted == intent
+    elapsed = time.perf_counter() - start
+    n = len(pairs) or 1
+    return {
+        "accuracy":            round(correct / n, 3),
+        "coverage":            round(confident / n, 3),
+        "accuracy_when_used":  round(confident_correct / confident, 3) if confident else 0.0,
+        "predict_ms":          round(elapsed * 1000 / n, 3),
+    }
+
+
+def _read_jsonl(path: str) -> list:
+    with open(path, encoding="utf-8") as f:
+        return [(row["message"], row["intent"]) for row in map(json.loads, f) if row.get("intent")]
+
+
+def _write_jsonl(path: str, pairs: list) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        for message, intent in pairs:
+            f.write(json.dumps({"message": message, "intent": intent}, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Train the local intent classifier from LLM-labelled chat_exchanges.")
+    parser.add_argument("command", choices=["train"])
+    parser.add_argument("--limit", type=int, default=20000, help="most recent labelled messages to use")
+    parser.add_argument("--from-file", help="train from an exported JSONL file instead of Supabase")
+    parser.add_argument("--export", help="also write the training set to this JSONL file")
+    parser.add_argument("--out", default=LOCAL_INTENT_MODEL)
+    parser.add_argument("--epochs", type=int, default=8)
+    parser.add_argument("--min-count", type=int, default=2)
+    parser.add_argument("--holdout", type=float, default=0.2, help="fraction held out for evaluation")
+    args = parser.parse_args()
+
+    if args.from_file:
+        pairs = _read_jsonl(args.from_file)
+    else:
+        from db import get_llm_labelled_messages
+        pairs = get_llm_labelled_messages(args.limit)
+    pairs = list(dict.fromkeys((m.strip(), i) for m, i in pairs if m.strip()))
+    if args.export:
+        _write_jsonl(args.export, pairs)
+    if len(pairs) < 50:
+        raise SystemExit(f"Only {len(pairs)} labelled messages; need at least 50 to train")
+
+    random.Random(7).shuffle(pairs)
+    cut = int(len(pairs) * (1 - args.holdout))
+    model = IntentModel.train(pairs[:cut], epochs=args.epochs, min_count=args.min_count)
+    logger.info(f"Holdout ({len(pairs) - cut} messages): {_evaluate(model, pairs[cut:], LOCAL_INTENT_THRESHOLD)}")
+
+    model = IntentModel.train(pairs, epochs=args.epochs, min_count=args.min_count)
+    model.save(args.out)
+    logger.info(f"Saved {len(model.classes)} intents, {len(model.weights)} n-grams to {args.out} "
+                f"({os.path.getsize(args.out) // 1024} KB)")
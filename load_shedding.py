@@ -0,0 +1,137 @@
+import os
+import time
+import logging
+import threading
+from collections import deque
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Degraded modes, least to most drastic
+NORMAL, RULES_ONLY, NO_LLM, REJECT = "normal", "rules_only", "no_llm", "reject"
+MODES = [NORMAL, RULES_ONLY, NO_LLM, REJECT]
+
+
+def _thresholds(value: str) -> list:
+    """'16,24,29' -> entry thresholds for rules_only, no_llm, reject; missing or 0 disables a step."""
+    levels = [float(v) if v.strip() else 0.0 for v in value.split(",")] if value.strip() else []
+    levels = (levels + [0.0] * 3)[:3]
+    return [v if v > 0 else float("inf") for v in levels]
+
+
+_threads = int(os.getenv("CHAT_CONCURRENCY", 32))
+
+SHED_ENABLED     = os.getenv("SHED_ENABLED", "true").lower() in ("1", "true", "yes")
+# Chats in flight in this worker at which each mode starts (default: half, three quarters
+# and nearly all of the worker's request threads)
+SHED_INFLIGHT    = _thresholds(os.getenv("SHED_INFLIGHT",
+                                         f"{_threads // 2},{_threads * 3 // 4},{max(1, _threads - 3)}"))
+# Mean seconds to the first token of an LLM answer over SHED_WINDOW at which each mode starts.
+# Time to first token tracks provider queueing; whole-answer time mostly tracks answer length.
+SHED_LLM_LATENCY = _thresholds(os.getenv("SHED_LLM_LATENCY", "5,10"))
+SHED_WINDOW      = float(os.getenv("SHED_WINDOW", 60))
+# A mode is left only once every signal is below this fraction of its entry
+# threshold and has stayed there for SHED_COOLDOWN seconds, one step at a time
+SHED_RECOVERY    = float(os.getenv("SHED_RECOVERY", 0.7))
+SHED_COOLDOWN    = float(os.getenv("SHED_COOLDOWN", 30))
+SHED_RETRY_AFTER = int(os.getenv("SHED_RETRY_AFTER", 15))
+
+
+class LoadShedder:
+    """
+    Picks the pipeline mode for each new chat from two signals: chats in flight
+    and recent LLM time to first token. Rising pressure moves straight to the
+    mode its signals call for; falling pressure steps back one mode per cooldown.
+    """
+
+    def __init__(self, inflight=SHED_INFLIGHT, latency=SHED_LLM_LATENCY, window: float = SHED_WINDOW,
+                 recovery: float = SHED_RECOVERY, cooldown: float = SHED_COOLDOWN, enabled: bool = SHED_ENABLED):
+        self.inflight_levels = inflight
+        self.latency_levels  = latency
+        self.window   = window
+        self.recovery = recovery
+        self.cooldown = cooldown
+        self.enabled  = enabled
+        self.mode     = NORMAL
+        self._level      = 0
+        self._changed_at = time.monotonic()
+        self._calm_since = None
+        self._in_flight  = 0
+        self._latencies: deque = deque()   # (finished_at, seconds)
+        self._lock  = threading.Lock()
+        self._stats = {mode: 0 for mode in MODES}
+        self._stats["transitions"] = 0
+
+    def _latency(self, now: float) -> float:
+        while self._latencies and self._latencies[0][0] < now - self.window:
+            self._latencies.popleft()
+        if not self._latencies:
+            return 0.0
+        return sum(s for _, s in self._latencies) / len(self._latencies)
+
+    @staticmethod
+    def _level_for(value: float, levels: list, factor: float = 1.0) -> int:
+        return sum(value >= threshold * factor for threshold in levels)
+
+    def _update(self, now: float) -> None:
+        signals = [(self._in_flight, self.inflight_levels), (self._latency(now), self.latency_levels)]
+        wanted  = max(self._level_for(v, levels) for v, levels in signals)
+        holding = max(self._level_for(v, levels, self.recovery) for v, levels in signals)
+        level   = self._level
+        if wanted > level:
+            level, self._calm_since = wanted, None
+        elif holding < level:
+            if self._calm_since is None:
+                self._calm_since = now
+            elif now - self._calm_since >= self.cooldown:
+                level, self._calm_since = level - 1, now
+        else:
+            self._calm_since = None
+        if level != self._level:
+            logger.warning(f"Load shedding: {MODES[self._level]} -> {MODES[level]} "
+                           f"(in flight {self._in_flight}, LLM {self._latency(now):.1f}s)")
+            self._level, self.mode, self._changed_at = level, MODES[level], now
+            self._stats["transitions"] += 1
+
+    def enter(self) -> str:
+        """The mode for a new chat. Unless it is REJECT, the caller must call leave() when done."""
+        if not self.enabled:
+            return NORMAL
+        with self._lock:
+            self._update(time.monotonic())
+            self._stats[self.mode] += 1
+            if self.mode != REJECT:
+                self._in_flight += 1
+            return self.mode
+
+    def leave(self) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._in_flight = max(0, self._in_flight - 1)
+
+    def observe_llm(self, seconds: float) -> None:
+        """Record how long an LLM answer took to start streaming (time to first token)."""
+        with self._lock:
+            self._latencies.append((time.monotonic(), seconds))
+
+    def stats(self) -> dict:
+        with self._lock:
+            now = time.monotonic()
+            if self.enabled:
+                self._update(now)
+            return {
+                "enabled":        self.enabled,
+                "mode":           self.mode,
+                "mode_seconds":   round(now - self._changed_at, 1),
+                "in_flight":      self._in_flight,
+                "llm_latency":    round(self._latency(now), 2),
+                "llm_samples":    len(self._latencies),
+                "chats_by_mode":  {mode: self._stats[mode] for mode in MODES},
+                "transitions":    self._stats["transitions"],
+            }
+
+
+shedder = LoadShedder()
@@ -0,0 +1,174 @@
+import os
+import time
+import logging
+import threading
+from dotenv import load_dotenv
+
+from cache import TTLCache
+from prompt_builder import estimate_tokens
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Token budget for the conversation context packed next to TRAVEL_EXPERT_SYSTEM
+MEMORY_TOKEN_BUDGET   = int(os.getenv("MEMORY_TOKEN_BUDGET", 800))
+MEMORY_SUMMARY_TOKENS = int(os.getenv("MEMORY_SUMMARY_TOKENS", 200))
+# Turns kept verbatim; once MEMORY_SUMMARY_EVERY more have piled up, they are folded into the summary
+MEMORY_RECENT_TURNS   = int(os.getenv("MEMORY_RECENT_TURNS", 6))
+MEMORY_SUMMARY_EVERY  = int(os.getenv("MEMORY_SUMMARY_EVERY", 4))
+MEMORY_REPLY_CHARS    = int(os.getenv("MEMORY_REPLY_CHARS", 600))
+MEMORY_CACHE_TTL      = float(os.getenv("MEMORY_CACHE_TTL", 3600))
+# How long a clarifying question ("Which city?") waits for its answer
+MEMORY_PENDING_TTL    = float(os.getenv("MEMORY_PENDING_TTL", 600))
+
+# session_id -> {"summary": str, "turns": [(user, assistant), ...], "summarizing": bool,
+#                "pending": {"intent", "slots", "missing", "at"} | None}
+_memory = TTLCache(ttl=MEMORY_CACHE_TTL, maxsize=2048)
+_memory_lock = threading.Lock()
+_stats = {"seeded": 0, "summaries": 0, "summary_failures": 0, "slots_pending": 0, "slots_resumed": 0}
+
+
+def _clip(text: str, chars: int) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= chars else text[:chars].rsplit(" ", 1)[0] + " …"
+
+
+def _seed(session_id: str) -> dict:
+    """Start a session's memory from the newest exchanges already in the history cache or DB."""
+    state = {"summary": "", "turns": [], "summarizing": False, "pending": None}
+    try:
+        # Imported lazily so the router keeps working without a Supabase client
+        from db import get_chat_history
+        messages = get_chat_history(session_id, MEMORY_RECENT_TURNS + MEMORY_SUMMARY_EVERY)
+        state["turns"] = [
+            (messages[i]["content"], messages[i + 1]["content"])
+            for i in range(0, len(messages) - 1, 2)
+        ]
+        _stats["seeded"] += 1
+    except Exception as e:
+        logger.warning(f"Could not seed conversation memory for {session_id}: {e}")
+    return state
+
+
+def _state(session_id: str) -> dict:
+    state = _memory.get(session_id)
+    if state is not None:
+        return state
+    seeded = _seed(session_id)
+    with _memory_lock:
+        state = _memory.peek(session_id)
+        if state is None:
+            state = seeded
+            _memory.set(session_id, state)
+        return state
+
+
+def _format_turn(user: str, assistant: str) -> str:
+    return f"User: {_clip(user, MEMORY_REPLY_CHARS)}\nAssistant: {_clip(assistant, MEMORY_REPLY_CHARS)}"
+
+
+def build_context(session_id: str | None, budget: int = MEMORY_TOKEN_BUDGET) -> str:
+    """
+    Return the conversation so far, packed into roughly `budget` tokens:
+    the rolling summary first, then as many of the newest turns as still fit.
+    Empty string for a new or unknown session.
+    """
+    if not session_id:
+        return ""
+    state = _state(session_id)
+    with _memory_lock:
+        summary, turns = state["summary"], list(state["turns"])
+
+    parts, used = [], 0
+    if summary:
+        parts.append(f"Summary of the earlier conversation: {summary}")
+        used += estimate_tokens(parts[0])
+
+    recent = []
+    for user, assistant in reversed(turns):
+        block = _format_turn(user, assistant)
+        cost  = estimate_tokens(block)
+        if used + cost > budget:
+            break
+        recent.append(block)
+        used += cost
+    parts.extend(reversed(recent))
+    return "\n\n".join(parts)
+
+
+def _fallback_summary(summary: str, turns: list) -> str:
+    """Extractive summary used when no LLM is available: the user's questions, newest kept."""
+    asked = "; ".join(_clip(user, 120) for user, _ in turns)
+    text  = f"{summary} The user also asked: {asked}." if summary else f"The user asked: {asked}."
+    limit = MEMORY_SUMMARY_TOKENS * 4
+    return text if len(text) <= limit else "…" + text[-limit:]
+
+
+def _fold(session_id: str, state: dict, summarizer) -> None:
+    """Fold the turns that fell out of the recent window into the rolling summary."""
+    with _memory_lock:
+        folded   = state["turns"][:-MEMORY_RECENT_TURNS]
+        previous = state["summary"]
+    try:
+        summary = summarizer(previous, folded) if summarizer else None
+        _stats["summaries"] += 1
+    except Exception as e:
+        logger.warning(f"Conversation summary for {session_id} failed: {e}")
+        _stats["summary_failures"] += 1
+        summary = None
+    with _memory_lock:
+        state["summary"] = summary or _fallback_summary(previous, folded)
+        # Turns recorded meanwhile were appended, so the folded ones are still at the front
+        del state["turns"][:len(folded)]
+        state["summarizing"] = False
+
+
+def remember_turn(session_id: str | None, user_message: str, reply: str, summarizer=None) -> None:
+    """
+    Append a finished turn to the session's memory.
+    Every MEMORY_SUMMARY_EVERY turns past the recent window, summarizer(previous_summary, turns)
+    is called on a background thread to extend the summary with just those turns.
+    """
+    if not session_id:
+        return
+    state = _state(session_id)
+    with _memory_lock:
+        state["turns"].append((user_message, reply))
+        due = (len(state["turns"]) >= MEMORY_RECENT_TURNS + MEMORY_SUMMARY_EVERY
+               and not state["summarizing"])
+        if due:
+            state["summarizing"] = True
+    if due:
+        threading.Thread(target=_fold, args=(session_id, state, summarizer),
+                         name="memory-summary", daemon=True).start()
+
+
+def set_pending(session_id: str | None, intent: str, slots: dict, missing: str) -> None:
+    """Remember an intent that is waiting for the user to supply the `missing` slot."""
+    if not session_id:
+        return
+    state = _state(session_id)
+    with _memory_lock:
+        state["pending"] = {"intent": intent, "slots": dict(slots), "missing": missing, "at": time.monotonic()}
+    _stats["slots_pending"] += 1
+
+
+def take_pending(session_id: str | None) -> dict | None:
+    """Pop the session's pending intent, or None if there is none or it has gone stale."""
+    if not session_id:
+        return None
+    state = _state(session_id)
+    with _memory_lock:
+        pending, state["pending"] = state.get("pending"), None
+    if pending and time.monotonic() - pending["at"] <= MEMORY_PENDING_TTL:
+        return pending
+    return None
+
+
+def slot_resumed() -> None:
+    _stats["slots_resumed"] += 1
+
+
+def memory_stats() -> dict:
+    return {**_stats, "sessions": len(_memory)}
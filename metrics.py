@@ -0,0 +1,186 @@
+import time
+import asyncio
+import functools
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Seconds; chats span 10 ms cache hits to 60 s+ LLM answers
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+# Labels of the chat being served (e.g. its intent), shared by every span it opens
+_scope: ContextVar[dict | None] = ContextVar("metrics_scope", default=None)
+
+_histograms: list = []
+_collectors: list = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(int(value))
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram in the Prometheus data model, one series per label
+    combination. Labels missing from observe() are taken from the current scope()
+    and otherwise recorded as "none".
+    """
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = BUCKETS):
+        self.name    = name
+        self.help    = help
+        self.labels  = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series: dict = {}   # label values -> [bucket counts..., count, sum]
+        self._lock   = threading.Lock()
+        _histograms.append(self)
+
+    def observe(self, seconds: float, **labels) -> None:
+        scope = _scope.get() or {}
+        key = tuple(str(labels.get(n) or scope.get(n) or "none") for n in self.labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0, 0.0]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += seconds
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        for key, values in sorted(series.items()):
+            for bound, count in zip(self.buckets, values):
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {count}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {values[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {values[-2]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {round(values[-1], 6)}")
+        return lines
+
+
+# ─── Where a chat spends its time ─────────────────────────────────────────────
+
+CHAT_SECONDS     = Histogram("travel_chat_seconds", "Whole chat pipeline per message", ("intent", "mode"))
+STAGE_SECONDS    = Histogram("travel_stage_seconds", "Chat pipeline stages: classify, fetch, render, generate",
+                             ("stage", "intent"))
+UPSTREAM_SECONDS = Histogram("travel_upstream_seconds", "Upstream API calls (cache misses only)",
+                             ("provider", "call", "intent", "status"))
+LLM_SECONDS      = Histogram("travel_llm_seconds", "LLM calls by call type", ("call", "intent"))
+DB_SECONDS       = Histogram("travel_db_seconds", "Supabase calls by operation", ("op", "status"))
+
+
+@contextmanager
+def scope(**labels):
+    """Labels (such as intent) for every span opened until the block exits; bind() adds more."""
+    token = _scope.set({**(_scope.get() or {}), **labels})
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+
+def bind(**labels) -> None:
+    """Add labels to the current scope once they are known, e.g. the intent after classification.
+    Asyncio tasks started inside the scope see them too. A no-op outside scope()."""
+    current = _scope.get()
+    if current is not None:
+        current.update(labels)
+
+
+@contextmanager
+def span(histogram: Histogram, **labels):
+    """
+    Time the block into histogram. Yields the labels dict, which may be filled
+    in inside the block; a "status" label, if the histogram has one, becomes
+    "error" when the block raises.
+    """
+    started = time.perf_counter()
+    status  = "ok"
+    try:
+        yield labels
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        if "status" in histogram.labels:
+            labels.setdefault("status", status)
+        histogram.observe(time.perf_counter() - started, **labels)
+
+
+def timed(histogram: Histogram, **labels):
+    """Decorator form of span() for plain and async functions."""
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(histogram, **labels):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(histogram, **labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class Stopwatch:
+    """Times consecutive stages of one pipeline run: each lap() records the time since the last."""
+
+    def __init__(self, histogram: Histogram = STAGE_SECONDS):
+        self.histogram = histogram
+        self._last     = time.perf_counter()
+
+    def lap(self, stage: str, **labels) -> None:
+        now = time.perf_counter()
+        self.histogram.observe(now - self._last, stage=stage, **labels)
+        self._last = now
+
+
+# ─── Exposition ───────────────────────────────────────────────────────────────
+
+def register(collector) -> None:
+    """
+    Add a scrape-time collector: a callable returning metric families as
+    (name, type, help, samples), where samples is a list of (labels dict, value). Used for counters that
+    already live elsewhere (cache stats, token usage, queue depth).
+    """
+    _collectors.append(collector)
+
+
+def render() -> str:
+    """Every histogram and collector in the Prometheus text exposition format (0.0.4)."""
+    lines = []
+    for histogram in _histograms:
+        lines.extend(histogram.render())
+    families: dict = {}
+    for collector in _collectors:
+        for name, kind, help, samples in collector():
+            family = families.setdefault(name, (kind, help, []))
+            family[2].extend(samples)
+    for name, (kind, help, samples) in families.items():
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            names = tuple(labels)
+            lines.append(f"{name}{_format_labels(names, tuple(labels[n] for n in names))} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,15 @@
+-- ============================================================
+-- Migration 005: Keyset pagination index for chat history
+-- /history pages newest-first on (created_at, id) within a
+-- session. This composite index serves every page as a short
+-- index range scan, and also covers plain session_id lookups,
+-- so the single-column session index is dropped to save write cost.
+--
+-- Run in: Supabase Dashboard → SQL Editor
+-- Run AFTER 003.
+-- ============================================================
+
+CREATE INDEX IF NOT EXISTS idx_exchanges_session_created
+    ON public.chat_exchanges(session_id, created_at DESC, id DESC);
+
+DROP INDEX IF EXISTS public.idx_exchanges_session;
@@ -0,0 +1,77 @@
+-- ============================================================
+-- Migration 006: Session list for /sessions
+-- One aggregated query returns every session of a user with its
+-- exchange count and first-message preview, newest activity first.
+-- chat_sessions.updated_at is bumped whenever exchanges are
+-- inserted, so the list orders by real activity.
+--
+-- Run in: Supabase Dashboard → SQL Editor
+-- Run AFTER 005.
+-- ============================================================
+
+-- ─── Keep updated_at current on new exchanges ─────────────────
+-- Statement-level so a batched insert touches each session once;
+-- the UPDATE also fires the existing trg_sessions_updated_at trigger.
+CREATE OR REPLACE FUNCTION public.touch_session_on_exchange()
+RETURNS TRIGGER LANGUAGE plpgsql AS $$
+BEGIN
+    UPDATE public.chat_sessions s
+       SET updated_at = now()
+     WHERE s.id IN (SELECT DISTINCT session_id FROM new_rows);
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_exchanges_touch_session ON public.chat_exchanges;
+CREATE TRIGGER trg_exchanges_touch_session
+    AFTER INSERT ON public.chat_exchanges
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION public.touch_session_on_exchange();
+
+-- ─── Covering index for the per-user list ─────────────────────
+-- Serves WHERE user_id = ? ORDER BY updated_at DESC as an index-only
+-- scan; it supersedes the single-column user_id index.
+CREATE INDEX IF NOT EXISTS idx_chat_sessions_user_updated
+    ON public.chat_sessions(user_id, updated_at DESC) INCLUDE (created_at);
+
+DROP INDEX IF EXISTS public.idx_chat_sessions_user_id;
+
+-- Count and preview are read through idx_exchanges_session_created (migration 005).
+
+-- ─── Aggregated list ──────────────────────────────────────────
+CREATE OR REPLACE FUNCTION public.list_chat_sessions(
+    p_user_id UUID,
+    p_limit   INT         DEFAULT 50,
+    p_before  TIMESTAMPTZ DEFAULT NULL
+)
+RETURNS TABLE (
+    id             UUID,
+    created_at     TIMESTAMPTZ,
+    updated_at     TIMESTAMPTZ,
+    exchange_count BIGINT,
+    preview        TEXT
+)
+LANGUAGE sql STABLE
+AS $$
+    SELECT s.id, s.created_at, s.updated_at, c.exchange_count, f.preview
+      FROM public.chat_sessions s
+     CROSS JOIN LATERAL (
+            SELECT count(*) AS exchange_count
+              FROM public.chat_exchanges e
+             WHERE e.session_id = s.id
+           ) c
+      LEFT JOIN LATERAL (
+            SELECT left(e.user_message, 120) AS preview
+              FROM public.chat_exchanges e
+             WHERE e.session_id = s.id
+             ORDER BY e.created_at, e.id
+             LIMIT 1
+           ) f ON true
+     WHERE s.user_id = p_user_id
+       AND (p_before IS NULL OR s.updated_at < p_before)
+       AND c.exchange_count > 0
+     ORDER BY s.updated_at DESC
+     LIMIT p_limit;
+$$;
+
+GRANT EXECUTE ON FUNCTION public.list_chat_sessions(UUID, INT, TIMESTAMPTZ) TO authenticated, service_role;
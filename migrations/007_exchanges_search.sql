@@ -0,0 +1,70 @@
+-- ============================================================
+-- Migration 007: Full-text search over chat history
+-- Adds a generated tsvector over the user message (weight A) and
+-- assistant reply (weight B), indexed together with user_id in one
+-- GIN index so a search only ever touches the caller's postings.
+--
+-- Adding a STORED generated column rewrites chat_exchanges once;
+-- run it in a quiet period (or after archiving, see 008).
+--
+-- Run in: Supabase Dashboard → SQL Editor
+-- Run AFTER 006.
+-- ============================================================
+
+-- btree_gin lets the uuid user_id share the GIN index with the tsvector
+CREATE EXTENSION IF NOT EXISTS btree_gin WITH SCHEMA extensions;
+
+ALTER TABLE public.chat_exchanges
+    ADD COLUMN IF NOT EXISTS search_tsv TSVECTOR
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english'::regconfig, coalesce(user_message, '')), 'A') ||
+        setweight(to_tsvector('english'::regconfig, coalesce(assistant_reply, '')), 'B')
+    ) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_exchanges_search
+    ON public.chat_exchanges USING GIN (user_id, search_tsv);
+
+-- ─── Ranked, snippeted search ─────────────────────────────────
+-- SECURITY INVOKER (the default): called with a user JWT, the existing
+-- own_exchanges_select RLS policy applies; the server calls it with the
+-- service role and scopes explicitly through p_user_id.
+-- ts_headline is only computed for the returned page.
+CREATE OR REPLACE FUNCTION public.search_chat_exchanges(
+    p_user_id UUID,
+    p_query   TEXT,
+    p_limit   INT DEFAULT 20,
+    p_offset  INT DEFAULT 0
+)
+RETURNS TABLE (
+    id            UUID,
+    session_id    UUID,
+    created_at    TIMESTAMPTZ,
+    rank          REAL,
+    user_snippet  TEXT,
+    reply_snippet TEXT
+)
+LANGUAGE sql STABLE
+SET search_path = public, extensions
+AS $$
+    WITH q AS (
+        SELECT websearch_to_tsquery('english', p_query) AS query
+    ),
+    hits AS (
+        SELECT e.id, e.session_id, e.created_at, e.user_message, e.assistant_reply,
+               ts_rank_cd(e.search_tsv, q.query) AS rank
+          FROM public.chat_exchanges e, q
+         WHERE e.user_id = p_user_id
+           AND e.search_tsv @@ q.query
+         ORDER BY rank DESC, e.created_at DESC
+         LIMIT p_limit OFFSET p_offset
+    )
+    SELECT h.id, h.session_id, h.created_at, h.rank,
+           ts_headline('english', h.user_message, q.query,
+                       'StartSel="**", StopSel="**", MaxFragments=1, MinWords=5, MaxWords=18'),
+           ts_headline('english', h.assistant_reply, q.query,
+                       'StartSel="**", StopSel="**", MaxFragments=2, MinWords=8, MaxWords=25, FragmentDelimiter=" … "')
+      FROM hits h, q
+     ORDER BY h.rank DESC, h.created_at DESC;
+$$;
+
+GRANT EXECUTE ON FUNCTION public.search_chat_exchanges(UUID, TEXT, INT, INT) TO authenticated, service_role;
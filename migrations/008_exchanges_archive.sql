@@ -0,0 +1,115 @@
+-- ============================================================
+-- Migration 008: Retention and archival for chat_exchanges
+-- archive.py moves exchanges older than RETENTION_DAYS out of the
+-- hot table in small batches (each its own short transaction), so
+-- chat_exchanges and its indexes stay small enough to stay cached.
+--
+-- Run in: Supabase Dashboard → SQL Editor
+-- Run AFTER 007.
+-- ============================================================
+
+-- ─── Compact archive ──────────────────────────────────────────
+-- No search vector, no FK to chat_sessions and only a BRIN index on
+-- created_at; long text is TOAST-compressed with lz4.
+CREATE TABLE IF NOT EXISTS public.chat_exchanges_archive (
+    id              UUID        PRIMARY KEY,
+    session_id      UUID        NOT NULL,
+    user_id         UUID        NOT NULL REFERENCES auth.users(id) ON DELETE CASCADE,
+    user_message    TEXT        COMPRESSION lz4 NOT NULL,
+    assistant_reply TEXT        COMPRESSION lz4 NOT NULL DEFAULT '',
+    created_at      TIMESTAMPTZ NOT NULL,
+    archived_at     TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_exchanges_archive_created
+    ON public.chat_exchanges_archive USING BRIN (created_at);
+
+-- ─── Per-session summary of what was archived ─────────────────
+CREATE TABLE IF NOT EXISTS public.chat_session_summaries (
+    session_id     UUID        PRIMARY KEY,
+    user_id        UUID        NOT NULL REFERENCES auth.users(id) ON DELETE CASCADE,
+    exchange_count INT         NOT NULL DEFAULT 0,
+    first_at       TIMESTAMPTZ NOT NULL,
+    last_at        TIMESTAMPTZ NOT NULL,
+    first_message  TEXT        NOT NULL DEFAULT '',
+    archived_at    TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_session_summaries_user ON public.chat_session_summaries(user_id);
+
+ALTER TABLE public.chat_exchanges_archive  ENABLE ROW LEVEL SECURITY;
+ALTER TABLE public.chat_session_summaries  ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "own_archive_select"   ON public.chat_exchanges_archive;
+DROP POLICY IF EXISTS "own_summaries_select" ON public.chat_session_summaries;
+
+CREATE POLICY "own_archive_select" ON public.chat_exchanges_archive
+    FOR SELECT USING (auth.uid() = user_id);
+
+CREATE POLICY "own_summaries_select" ON public.chat_session_summaries
+    FOR SELECT USING (auth.uid() = user_id);
+
+-- ─── Move one batch ───────────────────────────────────────────
+-- Takes either the oldest p_batch rows before p_cutoff, or exactly p_ids
+-- (JSONL export mode: rows already written to disk by archive.py).
+-- SKIP LOCKED keeps it from waiting on rows live requests are touching.
+-- Returns the number of rows removed from chat_exchanges.
+CREATE OR REPLACE FUNCTION public.archive_chat_exchanges(
+    p_cutoff    TIMESTAMPTZ,
+    p_batch     INT     DEFAULT 500,
+    p_summarize BOOLEAN DEFAULT true,
+    p_to_table  BOOLEAN DEFAULT true,
+    p_ids       UUID[]  DEFAULT NULL
+)
+RETURNS INT
+LANGUAGE plpgsql
+SET search_path = public
+AS $$
+DECLARE
+    moved INT;
+BEGIN
+    WITH batch AS (
+        SELECT e.id
+          FROM public.chat_exchanges e
+         WHERE e.created_at < p_cutoff
+           AND (p_ids IS NULL OR e.id = ANY (p_ids))
+         ORDER BY e.created_at
+         LIMIT p_batch
+           FOR UPDATE SKIP LOCKED
+    ),
+    gone AS (
+        DELETE FROM public.chat_exchanges e
+         USING batch b
+         WHERE e.id = b.id
+        RETURNING e.id, e.session_id, e.user_id, e.user_message, e.assistant_reply, e.created_at
+    ),
+    kept AS (
+        INSERT INTO public.chat_exchanges_archive (id, session_id, user_id, user_message, assistant_reply, created_at)
+        SELECT id, session_id, user_id, user_message, assistant_reply, created_at
+          FROM gone
+         WHERE p_to_table
+        ON CONFLICT (id) DO NOTHING
+    ),
+    summary AS (
+        INSERT INTO public.chat_session_summaries AS s
+               (session_id, user_id, exchange_count, first_at, last_at, first_message)
+        SELECT session_id, user_id, count(*), min(created_at), max(created_at),
+               (array_agg(left(user_message, 200) ORDER BY created_at))[1]
+          FROM gone
+         WHERE p_summarize
+         GROUP BY session_id, user_id
+        ON CONFLICT (session_id) DO UPDATE
+           SET exchange_count = s.exchange_count + EXCLUDED.exchange_count,
+               first_message  = CASE WHEN EXCLUDED.first_at < s.first_at
+                                     THEN EXCLUDED.first_message ELSE s.first_message END,
+               first_at       = least(s.first_at, EXCLUDED.first_at),
+               last_at        = greatest(s.last_at, EXCLUDED.last_at),
+               archived_at    = now()
+    )
+    SELECT count(*) INTO moved FROM gone;
+    RETURN moved;
+END;
+$$;
+
+REVOKE ALL ON FUNCTION public.archive_chat_exchanges(TIMESTAMPTZ, INT, BOOLEAN, BOOLEAN, UUID[]) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.archive_chat_exchanges(TIMESTAMPTZ, INT, BOOLEAN, BOOLEAN, UUID[]) TO service_role;
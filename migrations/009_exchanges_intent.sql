@@ -0,0 +1,20 @@
+-- ============================================================
+-- Migration 009: Record the classified intent of each exchange
+-- The router now reports which intent it answered and which tier
+-- chose it ('llm', 'local', 'rules', 'slot'). Rows labelled by the
+-- LLM are the training set for the local intent model
+-- (python intent_model.py train).
+--
+-- Run in: Supabase Dashboard → SQL Editor
+-- Run AFTER 008.
+-- ============================================================
+
+ALTER TABLE public.chat_exchanges
+    ADD COLUMN IF NOT EXISTS intent        TEXT,
+    ADD COLUMN IF NOT EXISTS intent_source TEXT;
+
+-- Export reads LLM-labelled rows newest first
+CREATE INDEX IF NOT EXISTS idx_exchanges_llm_labelled
+    ON public.chat_exchanges (created_at DESC)
+    INCLUDE (intent)
+    WHERE intent_source = 'llm';
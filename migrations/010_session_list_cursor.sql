@@ -0,0 +1,56 @@
+-- ============================================================
+-- Migration 010: Tie-proof keyset pagination for /sessions
+-- Sessions written in one batched flush share updated_at (the
+-- statement-level trigger of 006 stamps them with one now()), so
+-- paging on updated_at alone skipped a session tied at a page
+-- boundary. Pages are now keyed on (updated_at, id).
+--
+-- Run in: Supabase Dashboard → SQL Editor
+-- Run AFTER 006.
+-- ============================================================
+
+CREATE INDEX IF NOT EXISTS idx_chat_sessions_user_updated_id
+    ON public.chat_sessions(user_id, updated_at DESC, id DESC) INCLUDE (created_at);
+
+DROP INDEX IF EXISTS public.idx_chat_sessions_user_updated;
+
+DROP FUNCTION IF EXISTS public.list_chat_sessions(UUID, INT, TIMESTAMPTZ);
+
+CREATE OR REPLACE FUNCTION public.list_chat_sessions(
+    p_user_id   UUID,
+    p_limit     INT         DEFAULT 50,
+    p_before    TIMESTAMPTZ DEFAULT NULL,
+    p_before_id UUID        DEFAULT NULL
+)
+RETURNS TABLE (
+    id             UUID,
+    created_at     TIMESTAMPTZ,
+    updated_at     TIMESTAMPTZ,
+    exchange_count BIGINT,
+    preview        TEXT
+)
+LANGUAGE sql STABLE
+AS $$
+    SELECT s.id, s.created_at, s.updated_at, c.exchange_count, f.preview
+      FROM public.chat_sessions s
+     CROSS JOIN LATERAL (
+            SELECT count(*) AS exchange_count
+              FROM public.chat_exchanges e
+             WHERE e.session_id = s.id
+           ) c
+      LEFT JOIN LATERAL (
+            SELECT left(e.user_message, 120) AS preview
+              FROM public.chat_exchanges e
+             WHERE e.session_id = s.id
+             ORDER BY e.created_at, e.id
+             LIMIT 1
+           ) f ON true
+     WHERE s.user_id = p_user_id
+       AND (p_before IS NULL
+            OR (s.updated_at, s.id) < (p_before, coalesce(p_before_id, 'ffffffff-ffff-ffff-ffff-ffffffffffff'::uuid)))
+       AND c.exchange_count > 0
+     ORDER BY s.updated_at DESC, s.id DESC
+     LIMIT p_limit;
+$$;
+
+GRANT EXECUTE ON FUNCTION public.list_chat_sessions(UUID, INT, TIMESTAMPTZ, UUID) TO authenticated, service_role;
@@ -0,0 +1,72 @@
+-- ============================================================
+-- Migration 011: archive_chat_exchanges reports which rows it moved
+-- In JSONL mode archive.py exported a batch and then asked for it to
+-- be deleted, but SKIP LOCKED leaves out rows a live request holds;
+-- those stayed in chat_exchanges and were exported again by the next
+-- batch. The RPC now returns the ids it deleted, so archive.py writes
+-- exactly those rows.
+--
+-- Run in: Supabase Dashboard → SQL Editor
+-- Run AFTER 010.
+-- ============================================================
+
+DROP FUNCTION IF EXISTS public.archive_chat_exchanges(TIMESTAMPTZ, INT, BOOLEAN, BOOLEAN, UUID[]);
+
+-- Same batch as 008; returns the id of every row removed from chat_exchanges.
+CREATE OR REPLACE FUNCTION public.archive_chat_exchanges(
+    p_cutoff    TIMESTAMPTZ,
+    p_batch     INT     DEFAULT 500,
+    p_summarize BOOLEAN DEFAULT true,
+    p_to_table  BOOLEAN DEFAULT true,
+    p_ids       UUID[]  DEFAULT NULL
+)
+RETURNS SETOF UUID
+LANGUAGE plpgsql
+SET search_path = public
+AS $$
+BEGIN
+    RETURN QUERY
+    WITH batch AS (
+        SELECT e.id
+          FROM public.chat_exchanges e
+         WHERE e.created_at < p_cutoff
+           AND (p_ids IS NULL OR e.id = ANY (p_ids))
+         ORDER BY e.created_at
+         LIMIT p_batch
+           FOR UPDATE SKIP LOCKED
+    ),
+    gone AS (
+        DELETE FROM public.chat_exchanges e
+         USING batch b
+         WHERE e.id = b.id
+        RETURNING e.id, e.session_id, e.user_id, e.user_message, e.assistant_reply, e.created_at
+    ),
+    kept AS (
+        INSERT INTO public.chat_exchanges_archive (id, session_id, user_id, user_message, assistant_reply, created_at)
+        SELECT id, session_id, user_id, user_message, assistant_reply, created_at
+          FROM gone
+         WHERE p_to_table
+        ON CONFLICT (id) DO NOTHING
+    ),
+    summary AS (
+        INSERT INTO public.chat_session_summaries AS s
+               (session_id, user_id, exchange_count, first_at, last_at, first_message)
+        SELECT session_id, user_id, count(*), min(created_at), max(created_at),
+               (array_agg(left(user_message, 200) ORDER BY created_at))[1]
+          FROM gone
+         WHERE p_summarize
+         GROUP BY session_id, user_id
+        ON CONFLICT (session_id) DO UPDATE
+           SET exchange_count = s.exchange_count + EXCLUDED.exchange_count,
+               first_message  = CASE WHEN EXCLUDED.first_at < s.first_at
+                                     THEN EXCLUDED.first_message ELSE s.first_message END,
+               first_at       = least(s.first_at, EXCLUDED.first_at),
+               last_at        = greatest(s.last_at, EXCLUDED.last_at),
+               archived_at    = now()
+    )
+    SELECT gone.id FROM gone;
+END;
+$$;
+
+REVOKE ALL ON FUNCTION public.archive_chat_exchanges(TIMESTAMPTZ, INT, BOOLEAN, BOOLEAN, UUID[]) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.archive_chat_exchanges(TIMESTAMPTZ, INT, BOOLEAN, BOOLEAN, UUID[]) TO service_role;
@@ -0,0 +1,206 @@
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import logging
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+PROFILE_DIR          = os.getenv("PROFILE_DIR", "profiles")
+# Wall-clock sampling period; waits on the LLM and upstream APIs show up as time in their calls
+PROFILE_INTERVAL_MS  = float(os.getenv("PROFILE_INTERVAL_MS", 5))
+PROFILE_MAX_REQUESTS = int(os.getenv("PROFILE_MAX_REQUESTS", 200))
+PROFILE_MAX_MINUTES  = float(os.getenv("PROFILE_MAX_MINUTES", 60))
+
+_labels: dict = {}   # code object -> "func (path:line)"
+
+
+def _label(code) -> str:
+    label = _labels.get(code)
+    if label is None:
+        path  = "/".join(code.co_filename.replace("\\", "/").split("/")[-2:])
+        label = _labels[code] = f"{code.co_name} ({path}:{code.co_firstlineno})"
+    return label
+
+
+def _collapse(frame) -> str:
+    """Root-to-leaf stack of a frame in collapsed ("a;b;c") form."""
+    stack = []
+    while frame is not None:
+        stack.append(_label(frame.f_code))
+        frame = frame.f_back
+    return ";".join(reversed(stack))
+
+
+class RequestProfile:
+    """Stack samples and timings of one profiled request."""
+
+    def __init__(self, thread_id: int):
+        self.id         = f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:6]}"
+        self.thread_id  = thread_id
+        self.started_at = datetime.now(timezone.utc).isoformat()
+        self.stacks     = Counter()
+        self._wall      = time.perf_counter()
+        self._cpu       = time.thread_time()
+
+    def summary(self, top: int = 10, **meta) -> dict:
+        samples   = sum(self.stacks.values()) or 1
+        own       = Counter()
+        inclusive = Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")
+            own[frames[-1]] += count
+            for frame in set(frames):
+                inclusive[frame] += count
+        # Frames on every sampled stack (server, Flask, the view) say nothing about where time went
+        inclusive = Counter({frame: n for frame, n in inclusive.items() if n < samples})
+        share = lambda counts: [(frame, round(100 * n / samples, 1)) for frame, n in counts.most_common(top)]
+        return {
+            "id":           self.id,
+            "started_at":   self.started_at,
+            **meta,
+            "wall_seconds": round(time.perf_counter() - self._wall, 4),
+            "cpu_seconds":  round(time.thread_time() - self._cpu, 4),
+            "samples":      sum(self.stacks.values()),
+            "interval_ms":  PROFILE_INTERVAL_MS,
+            "top_self":      share(own),
+            "top_inclusive": share(inclusive),
+        }
+
+
+class RequestProfiler:
+    """
+    Samples the stacks of selected request threads from one background thread.
+    Armed for the next N requests or a percentage of them (see arm()); while
+    disarmed, start() is a couple of attribute reads and returns None.
+    Each finished request writes <id>.collapsed (flamegraph.pl / speedscope
+    input) and appends a line to summary.jsonl in `directory`.
+    """
+
+    def __init__(self, directory: str = PROFILE_DIR, interval_ms: float = PROFILE_INTERVAL_MS):
+        self.directory = directory
+        self.interval  = interval_ms / 1000
+        self._remaining  = 0        # profile this many more requests
+        self._rate       = 0.0      # or this fraction of them
+        self._expires_at = 0.0
+        self._active: dict = {}     # thread id -> RequestProfile
+        self._helpers: dict = {}    # pool thread id -> RequestProfile of the request it works for
+        self._sampler = None
+        self._lock    = threading.Lock()
+        self._stats   = {"profiled": 0, "samples": 0}
+
+    # ── Control ─────────────────────────────────────────────────────────────
+
+    def arm(self, requests: int = 0, percent: float = 0.0, minutes: float = PROFILE_MAX_MINUTES) -> dict:
+        """Profile the next `requests` requests, or `percent` of requests, for at most `minutes`."""
+        with self._lock:
+            self._remaining  = max(0, min(int(requests), PROFILE_MAX_REQUESTS))
+            self._rate       = max(0.0, min(float(percent), 100.0)) / 100
+            self._expires_at = time.monotonic() + min(float(minutes), PROFILE_MAX_MINUTES) * 60
+        logger.warning(f"Profiler armed: {self._remaining} requests, {self._rate:.0%} sampling, "
+                       f"output in {self.directory}")
+        return self.status()
+
+    def disarm(self) -> dict:
+        with self._lock:
+            self._remaining, self._rate = 0, 0.0
+        return self.status()
+
+    def status(self) -> dict:
+        with self._lock:
+            armed = bool(self._remaining or self._rate) and time.monotonic() < self._expires_at
+            return {
+                "armed":             armed,
+                "remaining":         self._remaining if armed else 0,
+                "percent":           round(self._rate * 100, 2) if armed else 0,
+                "expires_in":        round(self._expires_at - time.monotonic()) if armed else 0,
+                "in_progress":       len(self._active),
+                "directory":         os.path.abspath(self.directory),
+                **self._stats,
+            }
+
+    # ── Per request ─────────────────────────────────────────────────────────
+
+    def start(self) -> RequestProfile | None:
+        """Begin profiling the calling thread's request if it is selected; None otherwise."""
+        if not (self._remaining or self._rate):
+            return None
+        with self._lock:
+            if time.monotonic() >= self._expires_at:
+                self._remaining, self._rate = 0, 0.0
+                return None
+            if self._remaining:
+                self._remaining -= 1
+            elif random.random() >= self._rate:
+                return None
+            profile = RequestProfile(threading.get_ident())
+            self._active[profile.thread_id] = profile
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._sample_loop, name="request-profiler", daemon=True)
+                self._sampler.start()
+        return profile
+
+    def finish(self, profile: RequestProfile | None, **meta) -> None:
+        """Stop sampling the request and write its collapsed stacks and summary."""
+        if profile is None:
+            return
+        with self._lock:
+            self._active.pop(profile.thread_id, None)
+            self._helpers = {tid: p for tid, p in self._helpers.items() if p is not profile}
+            self._stats["profiled"] += 1
+            self._stats["samples"]  += sum(profile.stacks.values())
+        summary = profile.summary(**meta)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(os.path.join(self.directory, f"{profile.id}.collapsed"), "w", encoding="utf-8") as f:
+                f.writelines(f"{stack} {count}\n" for stack, count in profile.stacks.most_common())
+            with self._lock, open(os.path.join(self.directory, "summary.jsonl"), "a", encoding="utf-8") as f:
+                f.write(json.dumps(summary) + "\n")
+        except OSError as e:
+            logger.warning(f"Could not write profile {profile.id}: {e}")
+
+    @contextmanager
+    def helping(self, owner: int):
+        """While the calling (pool) thread works for request thread `owner`, sample it into that
+        request's profile too. Costs one dict lookup when `owner` isn't being profiled."""
+        profile = self._active.get(owner)
+        if profile is None:
+            yield
+            return
+        me = threading.get_ident()
+        with self._lock:
+            if self._active.get(owner) is profile:
+                self._helpers[me] = profile
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._helpers.pop(me, None)
+
+    def _sample_loop(self) -> None:
+        while True:
+            # Sampled under the lock so finish() never sees a profile change while writing it
+            with self._lock:
+                if not self._active:
+                    self._sampler = None
+                    return
+                frames = sys._current_frames()
+                sampled = [(profile.thread_id, profile) for profile in self._active.values()]
+                for thread_id, profile in sampled + list(self._helpers.items()):
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        profile.stacks[_collapse(frame)] += 1
+                frames = frame = None
+            time.sleep(self.interval)
+
+
+request_profiler = RequestProfiler()
@@ -0,0 +1,292 @@
+import os
+import re
+import logging
+import threading
+from dotenv import load_dotenv
+
+from metrics import LLM_SECONDS
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Full travel-expert persona, for answers that draw on the model's own knowledge.
+TRAVEL_EXPERT_SYSTEM = """You are an expert AI travel assistant with deep knowledge of:
+- Indian travel: cities, states, hill stations, beaches, heritage sites, culture, food, festivals, history
+- Indian transport: trains (IRCTC, routes, classes, booking tips), buses, flights, road trips, local transport
+- International travel: visa processes, passport requirements, popular destinations, travel advisories
+- Practical travel: packing lists, travel insurance, budgeting, solo travel, family travel, honeymoon travel
+- Accommodation: hotels, hostels, homestays, resorts, camping, OYO, Booking.com, Airbnb tips; budget vs premium options
+- Work-from-home & digital nomad travel: WiFi-reliable stays, co-working spaces, internet connectivity at hill stations
+  and remote destinations, best WFH-friendly hostels/guesthouses, power backup, mobile data (Jio/BSNL/Airtel coverage),
+  cost of long stays, digital nomad communities in India (Kasol, McLeod Ganj, Rishikesh, Goa, Manali, etc.)
+- Adventure & outdoor: trekking (Himalayas, Western Ghats), wildlife safaris, water sports, camping
+- Health & safety: vaccinations, altitude sickness, monsoon travel, travel safety tips
+- Food & culture: regional Indian cuisine, street food, dietary restrictions, cultural etiquette
+- Seasonal advice: monsoon travel, winter hill stations, summer escapes, festival seasons
+
+When answering complex questions that mix travel + stay + connectivity + budget:
+- Address EVERY part of the question — don't skip WiFi, budget, or "how to get there" aspects
+- For "how to get there": give the full route (train/bus to nearest railhead, then local transport)
+- For stays: give 2-3 specific budget options with approximate price ranges and WiFi notes
+- For WFH/WiFi: mention actual connectivity quality, mobile network coverage, and backup options
+- Always mention if starting city is unclear: give options from multiple major cities
+
+You give honest, practical, well-organized answers. Be conversational and friendly like a knowledgeable friend,
+not a formal guide. If asked about real-time data (live prices, exact availability), explain you can provide
+general guidance and suggest where to check for live data (IRCTC, Google Flights, Booking.com, etc.).
+Never say you cannot help with a travel question — always give your best knowledge-based answer."""
+
+
+# Short persona for answers that only restate fetched data (weather, a train, a drive)
+CONCISE_SYSTEM = """You are a friendly, concise AI travel assistant for India.
+Answer from the data you are given, add one or two practical tips, and keep it short."""
+
+# The classifier only has to emit JSON; it needs no persona
+CLASSIFIER_SYSTEM = "You label messages sent to a travel assistant. Reply with a single JSON object and nothing else."
+
+# ─── Token accounting ─────────────────────────────────────────────────────────
+
+_TOKEN = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Local token estimate for Llama-style BPE: one per word or punctuation mark,
+    or one per 4 characters for long words and non-Latin text, whichever is larger.
+    """
+    if not text:
+        return 0
+    return max(len(_TOKEN.findall(text)), (len(text) + 3) // 4)
+
+
+def fit_tokens(text: str, budget: int, keep: str = "head") -> str:
+    """Trim text to about `budget` tokens, keeping its start ("head") or its end ("tail")."""
+    if budget <= 0:
+        return ""
+    if estimate_tokens(text) <= budget:
+        return text
+    chars = budget * 4
+    while chars > 0:
+        cut = text[:chars] if keep == "head" else text[-chars:]
+        if estimate_tokens(cut) <= budget:
+            return cut + " …" if keep == "head" else "… " + cut
+        chars = int(chars * 0.9)
+    return ""
+
+
+# ─── Budgets ──────────────────────────────────────────────────────────────────
+#
+# (input tokens, output tokens, system prompt) per intent. Override one with
+# LLM_BUDGET_<INTENT>=input/output, e.g. LLM_BUDGET_WEATHER=900/200.
+
+INTENT_BUDGETS = {
+    "weather":        (900,  200,  CONCISE_SYSTEM),
+    "train_number":   (900,  250,  CONCISE_SYSTEM),
+    "road":           (900,  250,  CONCISE_SYSTEM),
+    "best_time":      (900,  300,  CONCISE_SYSTEM),
+    "train_route":    (1200, 400,  CONCISE_SYSTEM),
+    "place_info":     (1500, 600,  TRAVEL_EXPERT_SYSTEM),
+    "trip_planning":  (2500, 1000, TRAVEL_EXPERT_SYSTEM),
+    "general_travel": (2500, 1200, TRAVEL_EXPERT_SYSTEM),
+}
+DEFAULT_BUDGET = (2000, 800, TRAVEL_EXPERT_SYSTEM)
+
+for _intent, (_inp, _out, _system) in list(INTENT_BUDGETS.items()):
+    _override = os.getenv(f"LLM_BUDGET_{_intent.upper()}")
+    if not _override:
+        continue
+    _in_text, _, _out_text = _override.partition("/")
+    if not (_in_text.strip().isdigit() and _out_text.strip().isdigit()
+            and int(_in_text) > 0 and int(_out_text) > 0):
+        logger.error(f"Ignoring LLM_BUDGET_{_intent.upper()}={_override!r}: expected input/output tokens, "
+                     f"e.g. {_inp}/{_out}")
+        continue
+    INTENT_BUDGETS[_intent] = (int(_in_text), int(_out_text), _system)
+
+CLASSIFY_INPUT_TOKENS   = int(os.getenv("CLASSIFY_INPUT_TOKENS", 900))
+CLASSIFY_OUTPUT_TOKENS  = int(os.getenv("CLASSIFY_OUTPUT_TOKENS", 80))
+# Only the last turn or two matter for resolving "there" / "that train"
+CLASSIFY_CONTEXT_TOKENS = int(os.getenv("CLASSIFY_CONTEXT_TOKENS", 250))
+
+
+def _messages(system: str, user: str) -> list:
+    return [{"role": "system", "content": system}, {"role": "user", "content": user}]
+
+
+def _conversation_block(context: str) -> str:
+    """Earlier turns of the session, placed ahead of the current message."""
+    if not context:
+        return ""
+    return f"""Conversation so far (use it to resolve follow-ups like "there", "that train" or "what about tomorrow"):
+{context}
+
+"""
+
+
+# ─── Classification ──────────────────────────────────────────────────────────
+
+_CLASSIFY_TEMPLATE = """{conversation}Message: "{message}"
+
+Intents:
+- "weather": current weather for a location
+- "train_number": a specific train by its 5-digit number
+- "train_route": trains between two cities
+- "road": road travel time/distance between two places
+- "trip_planning": full trip plan (transport + destination info)
+- "place_info": tourist/attraction info about a place
+- "best_time": best season/time to visit a place
+- "greeting": hi, hello, help, what can you do
+- "general_travel": ANY other travel question (visa, packing, flights, hotels, trekking, budget, food, safety, abroad)
+- "unknown": nothing to do with travel (maths, coding, recipes)
+
+Prefer "general_travel" over "unknown" for anything travel-related.
+For a follow-up, take missing parameters from the conversation so far.
+
+Parameters: "location" for weather/place_info/best_time (and general_travel when a place is named);
+"train_number" for train_number; "start" and "end" for train_route/road/trip_planning.
+
+Examples:
+"Weather in Mumbai?" → {{"intent":"weather","location":"Mumbai"}}
+"Where is train 12951 now?" → {{"intent":"train_number","train_number":"12951"}}
+"Trains from Delhi to Mumbai?" → {{"intent":"train_route","start":"Delhi","end":"Mumbai"}}
+"Drive time from Pune to Goa?" → {{"intent":"road","start":"Pune","end":"Goa"}}
+"Plan a trip from Chennai to Kerala" → {{"intent":"trip_planning","start":"Chennai","end":"Kerala"}}
+"Tell me about Jaipur" → {{"intent":"place_info","location":"Jaipur"}}
+"Best time to visit Ladakh?" → {{"intent":"best_time","location":"Ladakh"}}
+"Hi there!" → {{"intent":"greeting"}}
+"Cheap stays with WiFi in Kasol for WFH?" → {{"intent":"general_travel","location":"Kasol"}}
+"Do I need a visa for Thailand?" → {{"intent":"general_travel"}}
+"What is 2+2?" → {{"intent":"unknown"}}
+
+JSON:"""
+
+
+def build_classification(message: str, context: str = "") -> tuple[list, int]:
+    """(messages, max_tokens) for the intent classification call."""
+    fixed   = (estimate_tokens(CLASSIFIER_SYSTEM) + estimate_tokens(_conversation_block(" "))
+               + estimate_tokens(_CLASSIFY_TEMPLATE.format(conversation="", message=message)))
+    room    = min(CLASSIFY_CONTEXT_TOKENS, CLASSIFY_INPUT_TOKENS - fixed)
+    context = fit_tokens(context, room, keep="tail") if context else ""
+    user    = _CLASSIFY_TEMPLATE.format(conversation=_conversation_block(context), message=message)
+    return _messages(CLASSIFIER_SYSTEM, user), CLASSIFY_OUTPUT_TOKENS
+
+
+# ─── Response generation ─────────────────────────────────────────────────────
+
+INTENT_GUIDANCE = {
+    "trip_planning":  "Give a well-organised trip plan covering how to get there, current weather at the destination, what to see, and the ideal travel season.",
+    "place_info":     "Highlight what makes this place unique, top attractions, food, and practical visitor tips.",
+    "train_number":   "Present the train schedule clearly with departure/arrival times and key stops.",
+    "train_route":    "List the available trains with timings and suggest the best option.",
+    "road":           "State the driving time and distance clearly, and add any useful road-trip tips.",
+    "weather":        "Describe the current weather naturally and suggest what to wear or bring.",
+    "best_time":      "Explain the best seasons to visit with reasons (weather, festivals, crowds, prices).",
+    "general_travel": (
+        "Answer EVERY part of the user's question thoroughly. Structure your response with clear sections:\n"
+        "- If they ask HOW TO GET THERE: give the complete route (train to nearest railhead + bus/taxi onward) "
+        "from major cities like Delhi, Mumbai, Chandigarh as applicable. Include travel time and cost estimates.\n"
+        "- If they ask about STAYS/ACCOMMODATION: give 3-5 specific budget/mid-range options with "
+        "approximate nightly rates (₹ range). Mention WiFi quality honestly for each if relevant.\n"
+        "- If they mention WORK FROM HOME / WiFi: rate the internet connectivity at the destination honestly, "
+        "name specific hostels/guesthouses known for good WiFi, mention mobile network coverage (Jio/BSNL/Airtel), "
+        "and suggest backup options (local SIM, hotspot).\n"
+        "- If they mention BUDGET: suggest the cheapest realistic options without sacrificing basic needs.\n"
+        "Be specific with names, prices, and practical tips — not vague generalities."
+    ),
+}
+
+
+def _response_prompt(message: str, data: str, guidance: str, conversation: str, words: int) -> str:
+    if data:
+        return f"""{conversation}The user asked: "{message}"
+
+Here is the fetched data to base your answer on:
+{data}
+
+{guidance}
+
+Write a natural, friendly response that directly answers the user in under {words} words. Do not mention
+"fetched data" or the structure of this prompt. Be conversational and helpful."""
+    # No API data — answer entirely from training knowledge
+    return f"""{conversation}The user asked: "{message}"
+
+{guidance}
+
+Answer this travel question helpfully from your knowledge in under {words} words.
+Be practical, specific, and friendly. Organise the answer clearly."""
+
+
+def build_response(message: str, data_collection: list | None, intent: str | None,
+                   context: str = "") -> tuple[list, int]:
+    """
+    (messages, max_tokens) for the answer-generation call, within the intent's budget.
+    Fetched data has first claim on the input budget, then the conversation context
+    (newest turns kept); the user's message is never trimmed.
+    """
+    input_budget, output_budget, system = INTENT_BUDGETS.get(intent or "", DEFAULT_BUDGET)
+    guidance = INTENT_GUIDANCE.get(intent or "", "")
+    words    = int(output_budget * 0.7)
+
+    room = input_budget - estimate_tokens(system) - estimate_tokens(_response_prompt(message, "", guidance, "", words))
+    data = fit_tokens("\n".join(data_collection or []), room, keep="head")
+    room -= estimate_tokens(data)
+    room -= estimate_tokens(_conversation_block(" "))
+    context = fit_tokens(context, room, keep="tail") if context and room > 50 else ""
+    user = _response_prompt(message, data, guidance, _conversation_block(context), words)
+    return _messages(system, user), output_budget
+
+
+# ─── Conversation summary ────────────────────────────────────────────────────
+
+def build_summary(previous_summary: str, turns: list, max_tokens: int) -> tuple[list, int]:
+    """(messages, max_tokens) for extending a session's rolling summary with new turns."""
+    transcript = "\n".join(f"User: {u}\nAssistant: {fit_tokens(a, 200)}" for u, a in turns)
+    user = f"""Current summary of a travel chat:
+{previous_summary or "(empty)"}
+
+New turns:
+{transcript}
+
+Rewrite the summary to include the new turns in at most {max_tokens // 2} words.
+Keep places, dates, travel mode, budget and preferences the user mentioned. Return only the summary."""
+    return [{"role": "user", "content": user}], max_tokens
+
+
+# ─── Usage logging ───────────────────────────────────────────────────────────
+
+_usage_lock = threading.Lock()
+_usage: dict = {}   # call type -> {"calls", "prompt_tokens", "completion_tokens", "hit_cap", "seconds"}
+
+
+def record_usage(call: str, intent: str | None, messages: list, completion: str,
+                 max_tokens: int, elapsed: float) -> None:
+    """Log the estimated prompt and completion size of one LLM call and add it to token_stats()."""
+    prompt_tokens     = sum(estimate_tokens(m["content"]) for m in messages)
+    completion_tokens = estimate_tokens(completion)
+    hit_cap           = completion_tokens >= max_tokens * 0.95
+    logger.info(f"LLM {call} [{intent or '-'}]: prompt≈{prompt_tokens} completion≈{completion_tokens}/{max_tokens} "
+                f"tokens in {elapsed:.2f}s{' (hit max_tokens)' if hit_cap else ''}")
+    LLM_SECONDS.observe(elapsed, call=call, intent=intent)
+    with _usage_lock:
+        stats = _usage.setdefault(call, {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0,
+                                         "hit_cap": 0, "seconds": 0.0})
+        stats["calls"]             += 1
+        stats["prompt_tokens"]     += prompt_tokens
+        stats["completion_tokens"] += completion_tokens
+        stats["hit_cap"]           += hit_cap
+        stats["seconds"]           += elapsed
+
+
+def average_usage(call: str) -> tuple[float, float]:
+    """(completion tokens, seconds) of an average completed call of this type; zeros before the first."""
+    with _usage_lock:
+        stats = _usage.get(call)
+        if not stats or not stats["calls"]:
+            return 0.0, 0.0
+        return stats["completion_tokens"] / stats["calls"], stats["seconds"] / stats["calls"]
+
+
+def token_stats() -> dict:
+    with _usage_lock:
+        return {call: {**stats, "seconds": round(stats["seconds"], 1)} for call, stats in _usage.items()}
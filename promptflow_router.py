@@ -1,13 +1,34 @@
 import os
 import json
+import random
+import asyncio
 import logging
 import re
+import time
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import nullcontext
 from datetime import datetime
+import httpx
 from dotenv import load_dotenv
-from huggingface_hub import InferenceClient
-from weather_api import fetch_weather
-from road_api import fetch_route
-from rail_api import fetch_train_by_name_or_number
+from huggingface_hub import InferenceClient, AsyncInferenceClient
+from weather_api import fetch_weather, fetch_weather_async
+from road_api import fetch_route, fetch_route_async
+from rail_api import fetch_train_by_name_or_number, fetch_train_by_name_or_number_async
+from intent_model import load_local_model, LOCAL_INTENT_THRESHOLD
+from semantic_cache import NearDuplicateCache
+from prompt_builder import (
+    build_classification, build_response, build_summary, record_usage, average_usage,
+    estimate_tokens,
+)
+from cancellation import RequestCancelled, record_abort
+from load_shedding import shedder, NORMAL, NO_LLM
+from metrics import span, scope, bind, Stopwatch, CHAT_SECONDS
+from profiler import request_profiler
+from memory import (
+    build_context, remember_turn, set_pending, take_pending, slot_resumed, MEMORY_SUMMARY_TOKENS,
+)
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -71,37 +92,39 @@ except Exception as e:
     }
 
 # Define helper functions
-def get_weather(location):
-    """Return current weather summary for the location, using API or fallback."""
-    logger.info(f"Fetching weather for {location}")
-    data = fetch_weather(location)
+def _weather_sentence(location, w):
+    return (f"The current weather in {location} is "
+            f"{w.get('weather_condition','Unknown')} with temperature "
+            f"{w.get('temperature','N/A')}°C, humidity "
+            f"{w.get('humidity','N/A')}%, wind "
+            f"{w.get('wind_speed','N/A')} m/s "
+            f"{w.get('wind_direction','')}.")
+
+def _weather_from_data(location, data):
+    """Format live weather data, else fall back to the bundled JSON."""
     if data:
-        w = data.get('real_time_weather', {})
-        return (f"The current weather in {data.get('location', location)} is "
-                f"{w.get('weather_condition','Unknown')} with temperature "
-                f"{w.get('temperature','N/A')}°C, humidity "
-                f"{w.get('humidity','N/A')}%, wind "
-                f"{w.get('wind_speed','N/A')} m/s "
-                f"{w.get('wind_direction','')}.")
+        return _weather_sentence(data.get('location', location), data.get('real_time_weather', {}))
 
     for entry in fallback_weather_data:
         if entry.get('location','').lower() == location.lower():
-            w = entry.get('real_time_weather', {})
             logger.info(f"Using fallback data for weather in {location}")
-            return (f"The current weather in {location} is "
-                    f"{w.get('weather_condition','Unknown')} with temperature "
-                    f"{w.get('temperature','N/A')}°C, humidity "
-                    f"{w.get('humidity','N/A')}%, wind "
-                    f"{w.get('wind_speed','N/A')} m/s "
-                    f"{w.get('wind_direction','')}.")
+            return _weather_sentence(location, entry.get('real_time_weather', {}))
 
     return f"Sorry, I don't have weather data for {location}."
 
-def get_train_by_number(train_number):
-    """Return train schedule summary by train number, using API or fallback."""
-    logger.info(f"Fetching train info for train #{train_number}")
+def get_weather(location):
+    """Return current weather summary for the location, using API or fallback."""
+    logger.info(f"Fetching weather for {location}")
+    return _weather_from_data(location, fetch_weather(location))
+
+async def get_weather_async(location, client):
+    """Asyncio twin of get_weather()."""
+    logger.info(f"Fetching weather for {location}")
+    return _weather_from_data(location, await fetch_weather_async(location, client))
+
+def _train_from_response(train_number, api_response):
+    """Format a RapidAPI train response, else fall back to the bundled JSON."""
     try:
-        api_response = fetch_train_by_name_or_number(train_number)
         body_data = api_response.get("body", [])
         if body_data:
             trains = body_data[0].get("trains", [])
@@ -131,6 +154,22 @@ def get_train_by_number(train_number):
 
     return f"Sorry, no train with number {train_number} was found."
 
+def get_train_by_number(train_number):
+    """Return train schedule summary by train number, using API or fallback."""
+    logger.info(f"Fetching train info for train #{train_number}")
+    try:
+        api_response = fetch_train_by_name_or_number(train_number)
+    except Exception as e:
+        logger.warning(f"API call failed for train #{train_number}: {e}")
+        api_response = {}
+    return _train_from_response(train_number, api_response)
+
+async def get_train_by_number_async(train_number, client):
+    """Asyncio twin of get_train_by_number()."""
+    logger.info(f"Fetching train info for train #{train_number}")
+    api_response = await fetch_train_by_name_or_number_async(train_number, client)
+    return _train_from_response(train_number, api_response)
+
 def get_trains_by_route(start, end):
     """Return schedules of trains between start and end stations (fallback JSON only)."""
     logger.info(f"Fetching trains between {start} and {end}")
@@ -157,10 +196,8 @@ def get_trains_by_route(start, end):
         return " ".join(matches[:3])
     return f"Sorry, no trains found from {start} to {end}."
 
-def get_road_info(start, end):
-    """Return driving time and distance between start and end (API or fallback)."""
-    logger.info(f"Fetching road info from {start} to {end}")
-    data = fetch_route(f"{start},India", f"{end},India")
+def _road_from_data(start, end, data):
+    """Format live route data, else fall back to the bundled JSON."""
     if data:
         eta = data.get('eta', {})
         return (f"By road, from {start} to {end} it takes about "
@@ -180,6 +217,16 @@ def get_road_info(start, end):
 
     return f"Sorry, I don't have road info from {start} to {end}."
 
+def get_road_info(start, end):
+    """Return driving time and distance between start and end (API or fallback)."""
+    logger.info(f"Fetching road info from {start} to {end}")
+    return _road_from_data(start, end, fetch_route(f"{start},India", f"{end},India"))
+
+async def get_road_info_async(start, end, client):
+    """Asyncio twin of get_road_info()."""
+    logger.info(f"Fetching road info from {start} to {end}")
+    return _road_from_data(start, end, await fetch_route_async(f"{start},India", f"{end},India", client))
+
 def get_place_info(place):
     """Return tourist information about a place."""
     for p in tourism_data.get('places', []):
@@ -223,6 +270,18 @@ def get_best_time_to_visit(place):
         return f"The post-monsoon season (October) is generally a good time to visit most places in India, including {place}."
 
 # ----------------- Improved Rule-based Classification -----------------
+INDIAN_PLACES = [
+    "kasol", "manali", "shimla", "dharamsala", "mcleod ganj", "spiti", "leh", "ladakh",
+    "rishikesh", "haridwar", "mussoorie", "nainital", "dehradun", "kedarnath", "badrinath",
+    "goa", "kerala", "munnar", "alleppey", "coorg", "ooty", "kodaikanal",
+    "jaipur", "udaipur", "jodhpur", "jaisalmer", "pushkar", "ajmer",
+    "varanasi", "agra", "delhi", "mumbai", "bangalore", "chennai", "kolkata", "hyderabad",
+    "darjeeling", "sikkim", "gangtok", "meghalaya", "shillong", "cherrapunji",
+    "andaman", "lakshadweep", "pondicherry", "hampi", "mysore", "coorg",
+    "srinagar", "gulmarg", "pahalgam", "vaishnodevi", "amritsar",
+    "puri", "bhubaneswar", "konark", "vizag", "tirupati", "hampi",
+]
+
 def extract_location_after_prep(message, prep):
     """Extract location after a preposition in a message."""
     if prep in message:
@@ -303,7 +362,8 @@ def rule_based_classify(message):
                         "forecast", "humidity", "climate", "hot", "cold", 
                         "windy", "thunderstorm", "precipitation"]
     
-    if any(word in message for word in weather_keywords):
+    # Whole words only: "rain" must not match "trains", nor "hot" "hotels"
+    if any(re.search(rf"\b{word}\b", message) for word in weather_keywords):
         # Extract location using various prepositions
         location = None
         for prep in ["in ", "for ", "at ", " of "]:
@@ -311,14 +371,11 @@ def rule_based_classify(message):
             if location:
                 break
         
-        # If no location found through prepositions, try to find any major city mentioned
+        # If no location found through prepositions, take the first known place mentioned
         if not location:
-            major_cities = ["delhi", "mumbai", "bangalore", "chennai", "kolkata", "hyderabad", 
-                          "ahmedabad", "pune", "jaipur", "lucknow"]
-            for city in major_cities:
-                if city in message:
-                    location = city.title()
-                    break
+            match = GAZETTEER_PATTERN.search(message)
+            if match:
+                location = GAZETTEER[match.group(1).lower()]
         
         return {"intent": "weather", "location": location or "Delhi"}  # Default to Delhi if no location found
     
@@ -376,24 +433,64 @@ def rule_based_classify(message):
     ]
     if any(kw in message for kw in broad_travel_keywords):
         # Try to extract a destination
-        indian_places = [
-            "kasol", "manali", "shimla", "dharamsala", "mcleod ganj", "spiti", "leh", "ladakh",
-            "rishikesh", "haridwar", "mussoorie", "nainital", "dehradun", "kedarnath", "badrinath",
-            "goa", "kerala", "munnar", "alleppey", "coorg", "ooty", "kodaikanal",
-            "jaipur", "udaipur", "jodhpur", "jaisalmer", "pushkar", "ajmer",
-            "varanasi", "agra", "delhi", "mumbai", "bangalore", "chennai", "kolkata", "hyderabad",
-            "darjeeling", "sikkim", "gangtok", "meghalaya", "shillong", "cherrapunji",
-            "andaman", "lakshadweep", "pondicherry", "hampi", "mysore", "coorg",
-            "srinagar", "gulmarg", "pahalgam", "vaishnodevi", "amritsar",
-            "puri", "bhubaneswar", "konark", "vizag", "tirupati", "hampi",
-        ]
-        for place in indian_places:
+        for place in INDIAN_PLACES:
             if place in message:
                 return {"intent": "general_travel", "location": place.title()}
         return {"intent": "general_travel"}
 
     return {"intent": "unknown"}
 
+# ----------------- Slot filling for clarification replies -----------------
+def _build_gazetteer():
+    """Lower-case place name -> display name, from the bundled data and the lists above."""
+    names = [p.get('name', '') for p in tourism_data.get('places', [])]
+    names += [w.get('location', '') for w in fallback_weather_data]
+    for route in fallback_routes_data:
+        names += [route.get('start', '').split(',')[0], route.get('end', '').split(',')[0]]
+    names += [place.title() for place in INDIAN_PLACES]
+    return {n.strip().lower(): n.strip() for n in names if n.strip()}
+
+def _gazetteer_pattern(gazetteer):
+    """One regex over every place name; longest names first so "New Delhi" wins over "Delhi"."""
+    return re.compile(
+        r"\b(" + "|".join(re.escape(n) for n in sorted(gazetteer, key=len, reverse=True)) + r")\b",
+        re.IGNORECASE,
+    )
+
+GAZETTEER = _build_gazetteer()
+GAZETTEER_PATTERN = _gazetteer_pattern(GAZETTEER)
+
+# Longer replies are treated as new questions rather than answers to "Which city?"
+SLOT_FOLLOWUP_MAX_WORDS = int(os.getenv("SLOT_FOLLOWUP_MAX_WORDS", 6))
+
+def fill_pending_slots(pending, message):
+    """
+    Merge a short clarification reply into a pending intent without an LLM call.
+    Returns the completed info dict, or None if the reply doesn't answer the question.
+    """
+    if len(message.split()) > SLOT_FOLLOWUP_MAX_WORDS:
+        return None
+    info    = {"intent": pending["intent"], **pending["slots"]}
+    missing = pending["missing"]
+
+    if missing == "train_number":
+        numbers = extract_train_numbers(message)
+        if not numbers:
+            return None
+        info["train_number"] = numbers[0]
+        return info
+
+    places = [GAZETTEER[m.lower()] for m in GAZETTEER_PATTERN.findall(message)]
+    if not places:
+        return None
+    if missing in ("start", "end") and len(places) >= 2:
+        # "from Pune to Goa" answers both ends at once
+        start, end = extract_locations_from_route(message)
+        info["start"], info["end"] = (start, end) if start and end else places[:2]
+    else:
+        info[missing] = places[0]
+    return info
+
 # ----------------- HF Inference API Setup -----------------
 load_dotenv()
 HF_TOKEN = os.getenv("HF_TOKEN")
@@ -411,118 +508,158 @@ else:
     except Exception as e:
         logger.error(f"Failed to initialize HF Inference client: {e}")
 
-# System prompt that gives the LLM its travel expert identity.
-# Used in every LLM call so the model always responds in character.
-TRAVEL_EXPERT_SYSTEM = """You are an expert AI travel assistant with deep knowledge of:
-- Indian travel: cities, states, hill stations, beaches, heritage sites, culture, food, festivals, history
-- Indian transport: trains (IRCTC, routes, classes, booking tips), buses, flights, road trips, local transport
-- International travel: visa processes, passport requirements, popular destinations, travel advisories
-- Practical travel: packing lists, travel insurance, budgeting, solo travel, family travel, honeymoon travel
-- Accommodation: hotels, hostels, homestays, resorts, camping, OYO, Booking.com, Airbnb tips; budget vs premium options
-- Work-from-home & digital nomad travel: WiFi-reliable stays, co-working spaces, internet connectivity at hill stations
-  and remote destinations, best WFH-friendly hostels/guesthouses, power backup, mobile data (Jio/BSNL/Airtel coverage),
-  cost of long stays, digital nomad communities in India (Kasol, McLeod Ganj, Rishikesh, Goa, Manali, etc.)
-- Adventure & outdoor: trekking (Himalayas, Western Ghats), wildlife safaris, water sports, camping
-- Health & safety: vaccinations, altitude sickness, monsoon travel, travel safety tips
-- Food & culture: regional Indian cuisine, street food, dietary restrictions, cultural etiquette
-- Seasonal advice: monsoon travel, winter hill stations, summer escapes, festival seasons
-
-When answering complex questions that mix travel + stay + connectivity + budget:
-- Address EVERY part of the question — don't skip WiFi, budget, or "how to get there" aspects
-- For "how to get there": give the full route (train/bus to nearest railhead, then local transport)
-- For stays: give 2-3 specific budget options with approximate price ranges and WiFi notes
-- For WFH/WiFi: mention actual connectivity quality, mobile network coverage, and backup options
-- Always mention if starting city is unclear: give options from multiple major cities
-
-You give honest, practical, well-organized answers. Be conversational and friendly like a knowledgeable friend,
-not a formal guide. If asked about real-time data (live prices, exact availability), explain you can provide
-general guidance and suggest where to check for live data (IRCTC, Google Flights, Booking.com, etc.).
-Never say you cannot help with a travel question — always give your best knowledge-based answer."""
+LLM_MODEL = "meta-llama/Llama-3.3-70B-Instruct"
+
+def _async_llm():
+    """Async inference client for one pipeline run, or a null context without HF_TOKEN.
+    Its connection pool is bound to the running event loop, so it is not shared across runs."""
+    if not HF_TOKEN:
+        return nullcontext()
+    return AsyncInferenceClient(provider="novita", api_key=HF_TOKEN)
+
+# ----------------- Cancellation -----------------
+# A /chat request is cancelled when its client disconnects or a newer message
+# arrives in the same session. The pipeline checks between stages and on every
+# streamed chunk, so the provider stream is closed instead of drained.
+_ABORT_SKIPS = {"classify": ("classify", "generate"), "fetch": ("generate",), "generate": ("generate",)}
+
+def _abort(cancel, stage, generated=0, elapsed=0.0):
+    """Record the work stopping at `stage` saves (from average call costs) and raise RequestCancelled."""
+    tokens = seconds = 0.0
+    for call in _ABORT_SKIPS[stage]:
+        avg_tokens, avg_seconds = average_usage(call)
+        if call == stage:
+            avg_tokens, avg_seconds = max(avg_tokens - generated, 0), max(avg_seconds - elapsed, 0)
+        tokens  += avg_tokens
+        seconds += avg_seconds
+    record_abort(cancel.reason, stage, round(tokens), seconds)
+    raise RequestCancelled(cancel.reason)
+
+def _checkpoint(cancel, stage):
+    if cancel and cancel.cancelled():
+        _abort(cancel, stage)
+
+def _close_stream(stream):
+    close = getattr(stream, "close", None)
+    if close:
+        close()
+
+async def _close_stream_async(stream):
+    aclose = getattr(stream, "aclose", None)
+    if aclose:
+        await aclose()
+
+async def _cancellable(coro, cancel, stage):
+    """Await coro, cancelling it (and its pending fetches) as soon as the request is cancelled."""
+    if not cancel:
+        return await coro
+    task = asyncio.ensure_future(coro)
+    while True:
+        done, _ = await asyncio.wait({task}, timeout=cancel.interval)
+        if done:
+            return task.result()
+        if cancel.cancelled():
+            task.cancel()
+            _abort(cancel, stage)
 
 # ----------------- Improved LLM Prompting -----------------
-def classify_intent(message):
+def _parse_classification(response_text):
+    json_start = response_text.find('{')
+    json_end   = response_text.rfind('}') + 1
+    if json_start >= 0 and json_end > json_start:
+        result = json.loads(response_text[json_start:json_end])
+        logger.info(f"Intent classified: {result}")
+        return result
+    raise ValueError("No JSON in response")
+
+def classify_intent(message, context="", trace=None, cancel=None):
     """
     Classify user intent via LLM, falling back to rule-based on failure.
+    context is the packed conversation memory used to resolve follow-ups.
+    trace, if given, gets "intent_source": "llm" or "rules".
+    cancel, a cancellation.CancelToken, stops the stream early (raises RequestCancelled).
     """
+    if trace is not None:
+        trace["intent_source"] = "rules"
     if not llm_client:
         logger.warning("LLM unavailable, using rule-based classification")
         return rule_based_classify(message)
 
-    prompt = f"""User message: "{message}"
-
-Classify the intent. Choose exactly one from:
-- "weather"         → wants current weather for a location
-- "train_number"    → asking about a specific train by its 5-digit number
-- "train_route"     → wants trains between two cities
-- "road"            → wants road travel time/distance between two places
-- "trip_planning"   → wants a full trip plan covering transport + destination info
-- "place_info"      → wants tourist/attraction info about a place
-- "best_time"       → wants to know the best season/time to visit a place
-- "greeting"        → just saying hi, hello, or asking for help/what you can do
-- "general_travel"  → ANY other travel question (visa, packing, flights, hotels, trekking, budgeting, food, culture, safety, international destinations, tips, etc.)
-- "unknown"         → completely unrelated to travel (e.g. maths, coding, recipes)
-
-Rules:
-- Use "general_travel" broadly — if it's travel-related in any way, prefer it over "unknown"
-- Only use "unknown" when the message has absolutely nothing to do with travel
-
-Parameters to extract:
-- weather / place_info / best_time: "location"
-- train_number: "train_number"
-- train_route / road / trip_planning: "start" and "end"
-- general_travel: "location" if a specific destination/place is mentioned (else omit)
-- greeting / unknown: no extra parameters
-
-Output format (JSON only, no explanation):
-{{"intent": "...", ...params}}
-
-Examples:
-- "What's the weather in Mumbai?" → {{"intent":"weather","location":"Mumbai"}}
-- "Trains from Delhi to Mumbai?" → {{"intent":"train_route","start":"Delhi","end":"Mumbai"}}
-- "Drive time from Pune to Goa?" → {{"intent":"road","start":"Pune","end":"Goa"}}
-- "Plan a trip from Chennai to Kerala" → {{"intent":"trip_planning","start":"Chennai","end":"Kerala"}}
-- "Tell me about Jaipur" → {{"intent":"place_info","location":"Jaipur"}}
-- "Best time to visit Ladakh?" → {{"intent":"best_time","location":"Ladakh"}}
-- "Hi there!" → {{"intent":"greeting"}}
-- "Do I need a visa for Thailand?" → {{"intent":"general_travel"}}
-- "Best budget hotels in Rishikesh?" → {{"intent":"general_travel","location":"Rishikesh"}}
-- "What to pack for a Himalayan trek?" → {{"intent":"general_travel"}}
-- "Is it safe to travel solo in Rajasthan?" → {{"intent":"general_travel","location":"Rajasthan"}}
-- "I want to go to Kasol for work from home, how to get there and cheap stays with WiFi?" → {{"intent":"general_travel","location":"Kasol"}}
-- "Cheapest flights from Bangalore to Goa?" → {{"intent":"general_travel","location":"Goa"}}
-- "What is 2+2?" → {{"intent":"unknown"}}
-
-Return only the JSON. Nothing else."""
-
     try:
         response_text = ""
+        messages, max_tokens = build_classification(message, context)
+        started = time.perf_counter()
         stream = llm_client.chat.completions.create(
-            model="meta-llama/Llama-3.3-70B-Instruct",
-            messages=[
-                {"role": "system", "content": TRAVEL_EXPERT_SYSTEM},
-                {"role": "user",   "content": prompt},
-            ],
+            model=LLM_MODEL,
+            messages=messages,
             temperature=0.1,
-            max_tokens=150,
+            max_tokens=max_tokens,
             stream=True
         )
         for chunk in stream:
             if chunk.choices and chunk.choices[0].delta.content is not None:
                 response_text += chunk.choices[0].delta.content
+            if cancel and cancel.cancelled():
+                _close_stream(stream)
+                _abort(cancel, "classify", estimate_tokens(response_text), time.perf_counter() - started)
+        record_usage("classify", None, messages, response_text, max_tokens, time.perf_counter() - started)
+        result = _parse_classification(response_text)
+        if trace is not None:
+            trace["intent_source"] = "llm"
+        return result
+
+    except RequestCancelled:
+        raise
+    except Exception as e:
+        logger.warning(f"LLM classification failed ({e}), falling back to rules")
+        return rule_based_classify(message)
+
+async def classify_intent_async(message, llm, context="", trace=None, cancel=None):
+    """Asyncio twin of classify_intent(), streaming through an AsyncInferenceClient."""
+    if trace is not None:
+        trace["intent_source"] = "rules"
+    if not llm:
+        logger.warning("LLM unavailable, using rule-based classification")
+        return rule_based_classify(message)
 
-        json_start = response_text.find('{')
-        json_end   = response_text.rfind('}') + 1
-        if json_start >= 0 and json_end > json_start:
-            result = json.loads(response_text[json_start:json_end])
-            logger.info(f"Intent classified: {result}")
-            return result
-        raise ValueError("No JSON in response")
+    try:
+        response_text = ""
+        messages, max_tokens = build_classification(message, context)
+        started = time.perf_counter()
+        stream = await llm.chat.completions.create(
+            model=LLM_MODEL,
+            messages=messages,
+            temperature=0.1,
+            max_tokens=max_tokens,
+            stream=True
+        )
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content is not None:
+                response_text += chunk.choices[0].delta.content
+            if cancel and cancel.cancelled():
+                await _close_stream_async(stream)
+                _abort(cancel, "classify", estimate_tokens(response_text), time.perf_counter() - started)
+        record_usage("classify", None, messages, response_text, max_tokens, time.perf_counter() - started)
+        result = _parse_classification(response_text)
+        if trace is not None:
+            trace["intent_source"] = "llm"
+        return result
 
+    except RequestCancelled:
+        raise
     except Exception as e:
         logger.warning(f"LLM classification failed ({e}), falling back to rules")
         return rule_based_classify(message)
 
-def generate_response(message, data_collection=None, intent=None):
+LLM_UNAVAILABLE_REPLY = "I'm unable to answer right now as the AI service is not configured."
+LLM_ERROR_REPLY       = "I'm having trouble connecting to the AI service right now. Please try again in a moment."
+BUSY_REPLY            = ("I'm very busy right now, so for a few minutes I can only answer with live data: "
+                         "weather, trains, routes and places. Please ask again shortly for general travel advice.")
+
+def _data_only_reply(data_collection):
+    return data_collection[0] if len(data_collection) == 1 else "Here's what I found:\n\n- " + "\n- ".join(data_collection)
+
+def generate_response(message, data_collection=None, intent=None, context="", cancel=None):
     """
     Generate a conversational reply using the LLM.
     - When data_collection is provided: synthesise the fetched data into a friendly answer.
@@ -530,72 +667,180 @@ def generate_response(message, data_collection=None, intent=None):
     """
     if not llm_client:
         if data_collection:
-            return data_collection[0] if len(data_collection) == 1 else "Here's what I found:\n\n- " + "\n- ".join(data_collection)
-        return "I'm unable to answer right now as the AI service is not configured."
-
-    intent_context = {
-        "trip_planning":  "Give a well-organised trip plan covering how to get there, current weather at the destination, what to see, and the ideal travel season.",
-        "place_info":     "Highlight what makes this place unique, top attractions, food, and practical visitor tips.",
-        "train_number":   "Present the train schedule clearly with departure/arrival times and key stops.",
-        "train_route":    "List the available trains with timings and suggest the best option.",
-        "road":           "State the driving time and distance clearly, and add any useful road-trip tips.",
-        "weather":        "Describe the current weather naturally and suggest what to wear or bring.",
-        "best_time":      "Explain the best seasons to visit with reasons (weather, festivals, crowds, prices).",
-        "general_travel": (
-            "Answer EVERY part of the user's question thoroughly. Structure your response with clear sections:\n"
-            "- If they ask HOW TO GET THERE: give the complete route (train to nearest railhead + bus/taxi onward) "
-            "from major cities like Delhi, Mumbai, Chandigarh as applicable. Include travel time and cost estimates.\n"
-            "- If they ask about STAYS/ACCOMMODATION: give 3-5 specific budget/mid-range options with "
-            "approximate nightly rates (₹ range). Mention WiFi quality honestly for each if relevant.\n"
-            "- If they mention WORK FROM HOME / WiFi: rate the internet connectivity at the destination honestly, "
-            "name specific hostels/guesthouses known for good WiFi, mention mobile network coverage (Jio/BSNL/Airtel), "
-            "and suggest backup options (local SIM, hotspot).\n"
-            "- If they mention BUDGET: suggest the cheapest realistic options without sacrificing basic needs.\n"
-            "Be specific with names, prices, and practical tips — not vague generalities."
-        ),
-    }.get(intent or "", "")
-
-    if data_collection:
-        user_prompt = f"""The user asked: "{message}"
-
-Here is the fetched data to base your answer on:
-{chr(10).join(data_collection)}
-
-{intent_context}
-
-Write a natural, friendly response that directly answers the user. Do not mention
-"fetched data" or the structure of this prompt. Be conversational and helpful."""
-    else:
-        # No API data — answer entirely from training knowledge
-        user_prompt = f"""The user asked: "{message}"
-
-{intent_context}
-
-Answer this travel question thoroughly and helpfully from your knowledge.
-Be practical, specific, and friendly. Organise the answer clearly."""
+            return _data_only_reply(data_collection)
+        return LLM_UNAVAILABLE_REPLY
 
     try:
         response_text = ""
+        messages, max_tokens = build_response(message, data_collection, intent, context)
+        started = time.perf_counter()
         stream = llm_client.chat.completions.create(
-            model="meta-llama/Llama-3.3-70B-Instruct",
-            messages=[
-                {"role": "system", "content": TRAVEL_EXPERT_SYSTEM},
-                {"role": "user",   "content": user_prompt},
-            ],
+            model=LLM_MODEL,
+            messages=messages,
             temperature=0.7,
-            max_tokens=1500,
+            max_tokens=max_tokens,
             stream=True
         )
+        first_token = None
         for chunk in stream:
             if chunk.choices and chunk.choices[0].delta.content is not None:
                 response_text += chunk.choices[0].delta.content
+                if first_token is None:
+                    first_token = time.perf_counter() - started
+            if cancel and cancel.cancelled():
+                _close_stream(stream)
+                _abort(cancel, "generate", estimate_tokens(response_text), time.perf_counter() - started)
+        elapsed = time.perf_counter() - started
+        record_usage("generate", intent, messages, response_text, max_tokens, elapsed)
+        shedder.observe_llm(elapsed if first_token is None else first_token)
+        return response_text
+
+    except RequestCancelled:
+        raise
+    except Exception as e:
+        logger.warning(f"LLM response generation failed: {e}")
+        if data_collection:
+            return _data_only_reply(data_collection)
+        return LLM_ERROR_REPLY
+
+async def generate_response_async(message, data_collection, intent, llm, context="", cancel=None):
+    """Asyncio twin of generate_response(), streaming through an AsyncInferenceClient."""
+    if not llm:
+        if data_collection:
+            return _data_only_reply(data_collection)
+        return LLM_UNAVAILABLE_REPLY
+
+    try:
+        response_text = ""
+        messages, max_tokens = build_response(message, data_collection, intent, context)
+        started = time.perf_counter()
+        stream = await llm.chat.completions.create(
+            model=LLM_MODEL,
+            messages=messages,
+            temperature=0.7,
+            max_tokens=max_tokens,
+            stream=True
+        )
+        first_token = None
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content is not None:
+                response_text += chunk.choices[0].delta.content
+                if first_token is None:
+                    first_token = time.perf_counter() - started
+            if cancel and cancel.cancelled():
+                await _close_stream_async(stream)
+                _abort(cancel, "generate", estimate_tokens(response_text), time.perf_counter() - started)
+        elapsed = time.perf_counter() - started
+        record_usage("generate", intent, messages, response_text, max_tokens, elapsed)
+        shedder.observe_llm(elapsed if first_token is None else first_token)
         return response_text
 
+    except RequestCancelled:
+        raise
     except Exception as e:
         logger.warning(f"LLM response generation failed: {e}")
         if data_collection:
-            return data_collection[0] if len(data_collection) == 1 else "Here's what I found:\n\n- " + "\n- ".join(data_collection)
-        return "I'm having trouble connecting to the AI service right now. Please try again in a moment."
+            return _data_only_reply(data_collection)
+        return LLM_ERROR_REPLY
+
+def summarize_conversation(previous_summary, turns):
+    """
+    Extend a session's rolling summary with the turns that just left the recent window.
+    Only the new turns are sent, so the cost stays flat however long the session runs.
+    Returns None without an LLM; memory.py then keeps an extractive summary instead.
+    """
+    if not llm_client:
+        return None
+    messages, max_tokens = build_summary(previous_summary, turns, MEMORY_SUMMARY_TOKENS)
+    started  = time.perf_counter()
+    response = llm_client.chat.completions.create(
+        model=LLM_MODEL,
+        messages=messages,
+        temperature=0.2,
+        max_tokens=max_tokens,
+    )
+    summary = response.choices[0].message.content.strip()
+    record_usage("summarize", None, messages, summary, max_tokens, time.perf_counter() - started)
+    return summary
+
+# ----------------- Direct render (no LLM) -----------------
+# The data helpers already return complete sentences for these intents, so the
+# reply is assembled from local templates instead of a 70B rephrasing pass.
+DIRECT_RENDER_INTENTS = {i.strip() for i in os.getenv(
+    "DIRECT_RENDER_INTENTS", "weather,train_number,road,best_time"
+).split(",") if i.strip()}
+DIRECT_RENDER_TIPS = os.getenv("DIRECT_RENDER_TIPS", "true").lower() in ("1", "true", "yes")
+
+_RENDER_OPENERS = {
+    "weather":      ["Here's the latest for {place}:", "Right now in {place}:", "Current conditions in {place}:"],
+    "train_number": ["Here's what I have on that train:", "Found it:", "Here's the schedule summary:"],
+    "road":         ["Planning the drive?", "Here's the road trip at a glance:", "By car, here's what to expect:"],
+    "best_time":    ["Good question!", "Timing matters for {place}.", "Here's when to go:"],
+}
+_RENDER_CLOSERS = {
+    "weather":      ["Anything else you'd like to know about {place}?", "Want the best time to visit {place} too?"],
+    "train_number": ["Check IRCTC for live running status and seat availability.",
+                     "Timings can shift, so confirm on IRCTC or NTES before you leave."],
+    "road":         ["Start early to beat city traffic, and keep some buffer for stops.",
+                     "Check Google Maps for live traffic before you set off."],
+    "best_time":    ["Want a full trip plan for {place}?", "Ask me about the weather there right now, too."],
+}
+
+def _find_place(name):
+    """The tourism-data.json entry for a place name, if there is one."""
+    for p in tourism_data.get('places', []):
+        if p.get('name', '').lower() == (name or '').lower():
+            return p
+    return None
+
+def _weather_advice(sentence):
+    """What to wear or bring, read off the sentence _weather_sentence() produced."""
+    match = re.search(r'temperature (-?\d+(?:\.\d+)?)°C', sentence)
+    advice = []
+    if match:
+        temp = float(match.group(1))
+        if temp >= 30:
+            advice.append("Light cotton clothes, sunscreen and plenty of water will help.")
+        elif temp <= 15:
+            advice.append("Carry a warm jacket, especially for the evening.")
+        else:
+            advice.append("It's comfortable out, so layers you can take off will do.")
+    if re.search(r'rain|drizzle|thunder|storm', sentence, re.IGNORECASE):
+        advice.append("Keep an umbrella or rain jacket handy.")
+    return " ".join(advice)
+
+def _render_tip(intent, place):
+    if not (DIRECT_RENDER_TIPS and place):
+        return ""
+    if intent == "best_time" and place.get("attractions"):
+        return f"Don't miss {', '.join(place['attractions'][:3])}."
+    return place.get("tips", "")
+
+def render_direct(intent, info, data_collection, force=False):
+    """
+    Reply for a simple data-backed intent built from local templates, or None if the
+    intent isn't in DIRECT_RENDER_INTENTS (unless force) and should go through the LLM as before.
+    Lookup failures ("Sorry, ...") are returned as they are.
+    """
+    if (intent not in DIRECT_RENDER_INTENTS and not force) or intent not in _RENDER_OPENERS or not data_collection:
+        return None
+    data = " ".join(data_collection)
+    if data.startswith("Sorry"):
+        return data
+
+    name  = info.get("location") or info.get("end") or ""
+    place = _find_place(name)
+    parts = [random.choice(_RENDER_OPENERS[intent]).format(place=name), data]
+    if intent == "weather":
+        parts.append(_weather_advice(data))
+    parts.append(_render_tip(intent, place))
+    parts.append(random.choice(_RENDER_CLOSERS[intent]).format(place=name))
+    return "\n\n".join(p for p in parts if p)
+
+def _degraded_reply(intent, info, data_collection):
+    """LLM-free reply while load shedding: templates, else the raw data, else BUSY_REPLY."""
+    return (render_direct(intent, info, data_collection, force=True)
+            or (_data_only_reply(data_collection) if data_collection else BUSY_REPLY))
 
 def validate_parameters(intent, info):
     """Validate and clean up extracted parameters. Returns (valid, params_or_error)."""
@@ -625,20 +870,25 @@ def validate_parameters(intent, info):
 
     return True, {}
 
-def parse_and_respond(message):
-    """
-    Main entry point.
-    1. Classify intent (LLM or rule-based fallback).
-    2. For data-backed intents: call the relevant APIs then generate response.
-    3. For general_travel / greeting: answer directly from LLM knowledge.
-    4. For unknown (non-travel): politely decline.
-    """
-    logger.info(f"Processing: {message}")
+def missing_slot(intent, info):
+    """Name of the first parameter validate_parameters() would ask the user for, else None."""
+    if intent in ["weather", "place_info", "best_time"] and len(info.get("location", "").strip()) < 2:
+        return "location"
+    if intent == "train_number" and not re.match(r'^\d{5}$', info.get("train_number", "").strip()):
+        return "train_number"
+    if intent in ["train_route", "road", "trip_planning"]:
+        for slot in ("start", "end"):
+            if len(info.get(slot, "").strip()) < 2:
+                return slot
+    return None
+
+GREETINGS = {"hi", "hello", "hey", "hola", "namaste", "help",
+             "what can you do", "commands", "start"}
 
-    # ── Greetings handled locally — no LLM call needed ───────────
+def _greeting_reply(message):
+    """Greetings handled locally — no LLM call needed. Returns None for anything else."""
     stripped = message.strip().lower().rstrip("!.,?")
-    if stripped in {"hi", "hello", "hey", "hola", "namaste", "help",
-                    "what can you do", "commands", "start"}:
+    if stripped in GREETINGS:
         return (
             "Hello! I'm your AI travel assistant. I can help you with:\n\n"
             "• Weather in any Indian city\n"
@@ -649,12 +899,26 @@ def parse_and_respond(message):
             "• Visa info, packing tips, budget travel, hotels, trekking, and any other travel question\n\n"
             "What would you like to know?"
         )
+    return None
 
-    # ── Classify ─────────────────────────────────────────────────
-    info   = classify_intent(message)
-    intent = info.get("intent", "general_travel")
-    logger.info(f"Intent: {intent} | params: {info}")
-
+def _resume_pending(session_id, message):
+    """Info for a reply that answers the session's pending clarifying question, else None."""
+    pending = take_pending(session_id)
+    if not pending:
+        return None
+    info = fill_pending_slots(pending, message)
+    if info:
+        slot_resumed()
+        logger.info(f"Resumed pending {pending['intent']} with {pending['missing']}: {info}")
+    return info
+
+def _classified_reply(intent, info, session_id=None):
+    """
+    Answer intents that need no data (greeting, non-travel) and reject invalid parameters.
+    Returns the reply text, or None after cleaning up info in place for the data step.
+    When a parameter is missing, the intent and the slots found so far are kept as
+    pending for the session, so the user's answer can complete them directly.
+    """
     # ── Greeting from LLM classification ─────────────────────────
     if intent == "greeting":
         return (
@@ -673,37 +937,73 @@ def parse_and_respond(message):
     # ── Validate parameters for data-backed intents ───────────────
     valid, result = validate_parameters(intent, info)
     if not valid:
+        slot = missing_slot(intent, info)
+        if slot:
+            slots = {k: v for k, v in info.items() if k != "intent" and isinstance(v, str) and v.strip()}
+            set_pending(session_id, intent, slots, slot)
         return result
     info.update(result)
+    return None
+
+# Cancellable fetches get their own pool, apart from speculation, so a chat never queues behind
+# prefetches. A trip plan runs two fetches at once, hence two workers per request thread.
+FETCH_WORKERS = int(os.getenv("FETCH_WORKERS", 2 * int(os.getenv("CHAT_CONCURRENCY", 32))))
+_fetch_pool   = ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix="fetch")
+
+def _fetch_for(owner, func, *args):
+    """Run one fetch on a pool thread, sampled into the owning request's profile if it has one."""
+    with request_profiler.helping(owner):
+        return func(*args)
+
+def _run_fetches(calls, cancel=None):
+    """
+    Results of (function, *args) upstream calls, in order. With a cancel token the
+    calls run concurrently on the fetch pool while this thread polls the token;
+    once it fires, calls not yet started are cancelled (running ones finish in the
+    background and only warm the caches) and RequestCancelled is raised.
+    """
+    if not cancel:
+        return [func(*args) for func, *args in calls]
+    owner   = threading.get_ident()
+    futures = [_fetch_pool.submit(contextvars.copy_context().run, _fetch_for, owner, func, *args)
+               for func, *args in calls]
+    while True:
+        _, pending = wait(futures, timeout=cancel.interval)
+        if not pending:
+            return [future.result() for future in futures]
+        if cancel.cancelled():
+            for future in pending:
+                future.cancel()
+            _abort(cancel, "fetch")
+
+def collect_data(intent, info, cancel=None):
+    """Fetch the data an intent's answer is based on, as a list of sentences.
+    cancel, a cancellation.CancelToken, stops waiting on upstream APIs as soon as it fires."""
+    collected_data = []
 
     # ── General travel: enrich with place/weather data if a location was detected ──
     if intent == "general_travel":
         location = info.get("location", "").strip()
-        enriched = []
         if location:
             place = get_place_info(location)
             if place:
-                enriched.append(place)
-            enriched.append(get_best_time_to_visit(location))
-            weather = get_weather(location)
+                collected_data.append(place)
+            collected_data.append(get_best_time_to_visit(location))
+            (weather,) = _run_fetches([(get_weather, location)], cancel)
             if "don't have weather" not in weather:
-                enriched.append(weather)
-        return generate_response(message, data_collection=enriched or None, intent="general_travel")
+                collected_data.append(weather)
 
-    # ── Data-backed intents: fetch from APIs then generate ─────────
-    collected_data = []
-
-    if intent == "weather":
-        collected_data.append(get_weather(info["location"]))
+    elif intent == "weather":
+        collected_data.extend(_run_fetches([(get_weather, info["location"])], cancel))
 
     elif intent == "train_number":
-        collected_data.append(get_train_by_number(info["train_number"]))
+        collected_data.extend(_run_fetches([(get_train_by_number, info["train_number"])], cancel))
 
     elif intent == "train_route":
         collected_data.append(get_trains_by_route(info["start"], info["end"]))
 
     elif intent == "road":
-        collected_data.append(get_road_info(info["start"], info["end"]))
+        collected_data.extend(_run_fetches([(get_road_info, info["start"], info["end"])], cancel))
 
     elif intent == "place_info":
         loc  = info["location"]
@@ -715,15 +1015,423 @@ def parse_and_respond(message):
 
     elif intent == "trip_planning":
         start, end = info["start"], info["end"]
-        collected_data.extend([
-            get_trains_by_route(start, end),
-            get_road_info(start, end),
-            get_weather(end),
-        ])
+        road, weather = _run_fetches([(get_road_info, start, end), (get_weather, end)], cancel)
+        collected_data.extend([get_trains_by_route(start, end), road, weather])
         place = get_place_info(end)
         if place:
             collected_data.append(place)
         collected_data.append(get_best_time_to_visit(end))
 
-    return generate_response(message, collected_data, intent)
+    return collected_data
+
+async def collect_data_async(intent, info, client):
+    """Asyncio twin of collect_data(); independent upstream fetches run concurrently."""
+    collected_data = []
+
+    if intent == "general_travel":
+        location = info.get("location", "").strip()
+        if location:
+            place = get_place_info(location)
+            if place:
+                collected_data.append(place)
+            collected_data.append(get_best_time_to_visit(location))
+            weather = await get_weather_async(location, client)
+            if "don't have weather" not in weather:
+                collected_data.append(weather)
+
+    elif intent == "weather":
+        collected_data.append(await get_weather_async(info["location"], client))
+
+    elif intent == "train_number":
+        collected_data.append(await get_train_by_number_async(info["train_number"], client))
+
+    elif intent == "road":
+        collected_data.append(await get_road_info_async(info["start"], info["end"], client))
+
+    elif intent == "trip_planning":
+        start, end = info["start"], info["end"]
+        road, weather = await asyncio.gather(
+            get_road_info_async(start, end, client),
+            get_weather_async(end, client),
+        )
+        collected_data.extend([get_trains_by_route(start, end), road, weather])
+        place = get_place_info(end)
+        if place:
+            collected_data.append(place)
+        collected_data.append(get_best_time_to_visit(end))
+
+    else:
+        # Local-only intents (train_route, place_info, best_time) never block
+        collected_data = collect_data(intent, info)
+
+    return collected_data
+
+# ----------------- Local intent model -----------------
+# A character n-gram classifier trained on LLM-labelled exchanges
+# (python intent_model.py train). When it is confident, it replaces the
+# LLM classification call; parameters still come from the rule-based
+# extractors, so anything they can't ground is left to the LLM.
+local_intent_model = load_local_model()
+
+_classify_lock  = threading.Lock()
+_classify_stats = {"local": 0, "local_deferred": 0, "llm": 0, "rules": 0, "slot": 0}
+
+def _count_classification(source):
+    with _classify_lock:
+        _classify_stats[source] = _classify_stats.get(source, 0) + 1
+
+def classify_local(message, context=""):
+    """Intent and parameters from the local model, or None to defer to the LLM."""
+    if not local_intent_model:
+        return None
+    intent, prob = local_intent_model.predict(message)
+    if prob < LOCAL_INTENT_THRESHOLD:
+        _count_classification("local_deferred")
+        return None
+    info = None
+    if intent in ("greeting", "unknown"):
+        info = {"intent": intent}
+    elif intent == "general_travel":
+        places = GAZETTEER_PATTERN.findall(message)
+        # A destination-less follow-up may refer to a place from earlier turns
+        if places or not context:
+            info = {"intent": intent, **({"location": GAZETTEER[places[0].lower()]} if places else {})}
+    else:
+        rules = _grounded_rules(message)
+        if rules and rules["intent"] == intent:
+            info = rules
+    if info is None:
+        _count_classification("local_deferred")
+        return None
+    logger.info(f"Local intent model: {intent} ({prob:.2f})")
+    return info
+
+def classification_stats():
+    with _classify_lock:
+        stats = dict(_classify_stats)
+    stats["local_model"] = bool(local_intent_model)
+    return stats
+
+# ----------------- Speculative prefetch -----------------
+# rule_based_classify() is nearly free and usually agrees with the LLM, so the
+# fetches it predicts start while the LLM is still classifying. The result is
+# used only when the LLM lands on the same intent and parameters.
+SPECULATIVE_PREFETCH = os.getenv("SPECULATIVE_PREFETCH", "true").lower() in ("1", "true", "yes")
+SPECULATIVE_WORKERS  = int(os.getenv("SPECULATIVE_WORKERS", 16))
+# Intents whose data comes from upstream APIs; the rest are local lookups not worth speculating on
+SPECULATIVE_INTENTS  = {"weather", "train_number", "road", "trip_planning", "general_travel"}
+
+_prefetch_pool  = ThreadPoolExecutor(max_workers=SPECULATIVE_WORKERS, thread_name_prefix="prefetch")
+_prefetch_lock  = threading.Lock()
+_prefetch_stats = {"started": 0, "hits": 0, "misses": 0, "cancelled": 0, "errors": 0}
+
+def _count_prefetch(key):
+    with _prefetch_lock:
+        _prefetch_stats[key] += 1
+
+def _fetch_key(intent, info):
+    """What a fetch depends on: the intent plus its (normalised) parameters."""
+    params = ("location", "train_number", "start", "end")
+    return (intent,) + tuple((info.get(p) or "").strip().lower() for p in params)
+
+def _grounded_rules(message):
+    """
+    rule_based_classify() with validated parameters, or None if any parameter is
+    not actually in the message (e.g. the weather classifier's default location).
+    """
+    info   = rule_based_classify(message)
+    intent = info.get("intent")
+    valid, params = validate_parameters(intent, info)
+    if not valid:
+        return None
+    info.update(params)
+    lowered = message.lower()
+    for key in ("location", "train_number", "start", "end"):
+        if info.get(key):
+            at = lowered.find(info[key].lower())
+            if at < 0:
+                return None
+            # rule_based_classify() lower-cases; keep the user's spelling for the fetch
+            info[key] = message[at:at + len(info[key])]
+    return info
+
+def _classify_rules_only(message, context=""):
+    """
+    Classification without the LLM while load shedding. Parameters must be grounded
+    in the message; a place-less weather or place question may take the last place
+    named in the conversation. Otherwise it is answered as general_travel rather
+    than for rule_based_classify()'s default city, as is anything the rules can't
+    place (they call most travel questions without keywords "unknown").
+    """
+    info = _grounded_rules(message)
+    if info and info["intent"] != "unknown":
+        return info
+    intent = rule_based_classify(message).get("intent")
+    if intent in ("weather", "place_info", "best_time", "general_travel"):
+        places = GAZETTEER_PATTERN.findall(context)
+        if places:
+            return {"intent": intent, "location": GAZETTEER[places[-1].lower()]}
+    return {"intent": "general_travel"}
+
+def _predict_fetch(message):
+    """The (intent, info) rule_based_classify() expects to need upstream data, or None."""
+    if not (SPECULATIVE_PREFETCH and llm_client):
+        return None
+    info = _grounded_rules(message)
+    if not info or info["intent"] not in SPECULATIVE_INTENTS:
+        return None
+    if info["intent"] == "general_travel" and not info.get("location"):
+        return None
+    return info["intent"], info
+
+def _start_prefetch(message):
+    """Submit the rule-predicted fetch to the prefetch pool; returns (key, future) or None."""
+    predicted = _predict_fetch(message)
+    if not predicted:
+        return None
+    intent, info = predicted
+    _count_prefetch("started")
+    return _fetch_key(intent, info), _prefetch_pool.submit(contextvars.copy_context().run, collect_data, intent, info)
+
+def _claim_prefetch(speculation, intent, info):
+    """
+    The speculative data if it was fetched for exactly this intent and info, else None.
+    A mismatched fetch is cancelled if it hasn't started; a running one finishes in the
+    background and only warms the caches.
+    """
+    if not speculation:
+        return None
+    key, future = speculation
+    if intent is None or key != _fetch_key(intent, info):
+        _count_prefetch("cancelled" if future.cancel() else "misses")
+        return None
+    try:
+        data = future.result()
+    except Exception as e:
+        logger.warning(f"Speculative prefetch failed ({e}), fetching again")
+        _count_prefetch("errors")
+        return None
+    _count_prefetch("hits")
+    return data
+
+async def _start_prefetch_async(message, client):
+    """Asyncio twin of _start_prefetch(); returns (key, task) or None."""
+    predicted = _predict_fetch(message)
+    if not predicted:
+        return None
+    intent, info = predicted
+    _count_prefetch("started")
+    task = asyncio.create_task(collect_data_async(intent, info, client))
+    # Retrieve the exception of a discarded task so asyncio doesn't log it as unhandled
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    return _fetch_key(intent, info), task
+
+async def _claim_prefetch_async(speculation, intent, info):
+    """Asyncio twin of _claim_prefetch(); a mismatched task is cancelled outright."""
+    if not speculation:
+        return None
+    key, task = speculation
+    if intent is None or key != _fetch_key(intent, info):
+        _count_prefetch("cancelled" if not task.done() else "misses")
+        task.cancel()
+        return None
+    try:
+        data = await task
+    except Exception as e:
+        logger.warning(f"Speculative prefetch failed ({e}), fetching again")
+        _count_prefetch("errors")
+        return None
+    _count_prefetch("hits")
+    return data
+
+def prefetch_stats():
+    with _prefetch_lock:
+        stats = dict(_prefetch_stats)
+    resolved = stats["hits"] + stats["misses"] + stats["cancelled"]
+    stats["hit_rate"] = round(stats["hits"] / resolved, 3) if resolved else 0.0
+    stats["enabled"]  = SPECULATIVE_PREFETCH
+    return stats
+
+# ----------------- Near-duplicate answer cache -----------------
+# general_travel answers come from LLM knowledge alone, so a reworded repeat
+# of a question ("cheap wifi stays in kasol" / "budget hostels with wifi in
+# Kasol") can reuse the earlier answer. Entries are scoped by location.
+ANSWER_CACHE_ENABLED   = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+answer_cache = NearDuplicateCache(
+    threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", 0.75)),
+    ttl=float(os.getenv("ANSWER_CACHE_TTL", 21600)),
+    maxsize=int(os.getenv("ANSWER_CACHE_MAX", 2000)),
+    sample_rate=float(os.getenv("ANSWER_CACHE_SAMPLE_RATE", 0.05)),
+)
+
+def _answer_cache_scope(intent, info, context):
+    """Cache scope (lower-case location, or "") for a shareable answer, else None."""
+    if not ANSWER_CACHE_ENABLED or intent != "general_travel":
+        return None
+    location = info.get("location", "").strip().lower()
+    if not location and context:
+        # A follow-up without a place of its own may lean on earlier turns
+        return None
+    return location
+
+def _cacheable_answer(reply, collected_data):
+    """True for a real LLM answer, not a service-error or data-only fallback."""
+    if reply in (LLM_UNAVAILABLE_REPLY, LLM_ERROR_REPLY, BUSY_REPLY):
+        return False
+    return not collected_data or reply != _data_only_reply(collected_data)
+
+def _pipeline(message, context, session_id, trace, cancel, mode, llm_available):
+    """
+    The decisions of one chat turn, shared by _respond() and _respond_async().
+    A generator: each step that waits on the network is yielded for the driver
+    to run (sync or async) and its result is sent back in.
+      ("classify",)                        -> info dict from classify_intent()
+      ("fetch", intent, info)              -> collected data sentences
+      ("generate", intent, collected_data) -> the generated reply
+    The reply is the generator's return value.
+    """
+    reply = _greeting_reply(message)
+    if reply:
+        trace.update(intent="greeting", intent_source="rules")
+        bind(intent="greeting")
+        return reply
+    _checkpoint(cancel, "classify")
+    watch = Stopwatch()
+
+    # ── Classify: pending slot → local model → LLM (rules if it fails) ──
+    info = _resume_pending(session_id, message)
+    trace["intent_source"] = "slot"
+    if not info:
+        info = classify_local(message, context)
+        trace["intent_source"] = "local"
+    if not info and mode != NORMAL:
+        info = _classify_rules_only(message, context)
+        trace["intent_source"] = "rules"
+    if not info:
+        info = yield ("classify",)
+    intent = info.get("intent", "general_travel")
+    trace["intent"] = intent
+    bind(intent=intent)
+    watch.lap("classify")
+    _count_classification(trace["intent_source"])
+    logger.info(f"Intent: {intent} | params: {info}")
+
+    reply = _classified_reply(intent, info, session_id)
+    cache_scope = _answer_cache_scope(intent, info, context)
+    if not reply and cache_scope is not None:
+        reply = answer_cache.get(message, cache_scope)
+    if reply:
+        return reply
+
+    # ── Data-backed intents: fetch from APIs then render or generate ──
+    _checkpoint(cancel, "fetch")
+    collected_data = yield ("fetch", intent, info)
+    watch.lap("fetch")
+    reply = render_direct(intent, info, collected_data)
+    if not reply and mode == NO_LLM:
+        reply = _degraded_reply(intent, info, collected_data)
+    if reply:
+        watch.lap("render")
+    else:
+        _checkpoint(cancel, "generate")
+        reply = yield ("generate", intent, collected_data)
+        watch.lap("generate")
+    if cache_scope is not None and llm_available and _cacheable_answer(reply, collected_data):
+        answer_cache.set(message, reply, cache_scope)
+    return reply
+
+def _respond(message, context, session_id=None, trace=None, cancel=None, mode=NORMAL):
+    """Run _pipeline() with blocking calls; the rule-predicted fetch starts while the LLM classifies."""
+    trace = {} if trace is None else trace
+    steps = _pipeline(message, context, session_id, trace, cancel, mode, llm_client is not None)
+    speculation, result = None, None
+    try:
+        while True:
+            step = steps.send(result)
+            if step[0] == "classify":
+                speculation = _start_prefetch(message)
+                result = classify_intent(message, context, trace, cancel)
+            elif step[0] == "fetch":
+                _, intent, info = step
+                result, speculation = _claim_prefetch(speculation, intent, info), None
+                if result is None:
+                    result = collect_data(intent, info, cancel)
+            else:
+                _, intent, collected_data = step
+                result = generate_response(message, collected_data or None, intent, context, cancel)
+    except StopIteration as done:
+        return done.value
+    finally:
+        steps.close()
+        # Answered without the fetch (or cancelled): drop the speculation
+        _claim_prefetch(speculation, None, {})
+
+def parse_and_respond(message, session_id=None, trace=None, cancel=None, mode=NORMAL):
+    """
+    Main entry point.
+    1. Classify intent (LLM or rule-based fallback).
+    2. For data-backed intents: call the relevant APIs then generate response.
+    3. For general_travel / greeting: answer directly from LLM knowledge.
+    4. For unknown (non-travel): politely decline.
+    With a session_id, earlier turns of that chat (see memory.py) go into both
+    LLM calls, and the finished turn is remembered for the next message.
+    A trace dict, if given, receives "intent" and "intent_source" (which tier
+    classified the message: slot, local, llm or rules).
+    A cancel token (cancellation.CancelToken) is checked between stages and
+    on every streamed chunk; once set, RequestCancelled is raised and the
+    turn is not remembered.
+    mode is the load_shedding mode for this chat: rules_only classifies
+    without the LLM, no_llm also answers from templates and raw data.
+    """
+    logger.info(f"Processing: {message}")
+
+    # Spans opened while answering (including upstream and DB calls) are labelled with the intent
+    with scope(), span(CHAT_SECONDS, mode=mode):
+        context = build_context(session_id)
+        reply   = _respond(message, context, session_id, trace, cancel, mode)
+    remember_turn(session_id, message, reply, summarize_conversation if mode == NORMAL else None)
+    return reply
+
+async def _respond_async(message, context, session_id=None, trace=None, cancel=None, mode=NORMAL):
+    """Asyncio twin of _respond(); a cancelled request also cancels its in-flight fetches."""
+    trace = {} if trace is None else trace
+    async with httpx.AsyncClient(timeout=10) as client, _async_llm() as llm:
+        steps = _pipeline(message, context, session_id, trace, cancel, mode, llm is not None)
+        speculation, result = None, None
+        try:
+            while True:
+                step = steps.send(result)
+                if step[0] == "classify":
+                    speculation = await _start_prefetch_async(message, client)
+                    result = await classify_intent_async(message, llm, context, trace, cancel)
+                elif step[0] == "fetch":
+                    _, intent, info = step
+                    result, speculation = await _claim_prefetch_async(speculation, intent, info), None
+                    if result is None:
+                        result = await _cancellable(collect_data_async(intent, info, client), cancel, "fetch")
+                else:
+                    _, intent, collected_data = step
+                    result = await generate_response_async(message, collected_data or None, intent, llm,
+                                                           context, cancel)
+        except StopIteration as done:
+            return done.value
+        finally:
+            steps.close()
+            await _claim_prefetch_async(speculation, None, {})
+
+async def parse_and_respond_async(message, session_id=None, trace=None, cancel=None, mode=NORMAL):
+    """
+    Asyncio-native twin of parse_and_respond().
+    Upstream APIs go through one httpx.AsyncClient and the LLM through an
+    AsyncInferenceClient, so a single event loop can multiplex many chats
+    while they wait on the network. A cancelled request also cancels its
+    in-flight API fetches. Library-only: chat_server serves /chat through the
+    sync driver, and no route or worker awaits this one yet.
+    """
+    logger.info(f"Processing: {message}")
 
+    with scope(), span(CHAT_SECONDS, mode=mode):
+        context = await asyncio.to_thread(build_context, session_id) if session_id else ""
+        reply   = await _respond_async(message, context, session_id, trace, cancel, mode)
+    remember_turn(session_id, message, reply, summarize_conversation if mode == NORMAL else None)
+    return reply
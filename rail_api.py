@@ -1,10 +1,15 @@
 import http.client
 import json
+import httpx
 import os
+import re
 from flask import request, jsonify
 from flask import Blueprint
 from dotenv import load_dotenv
 
+from cache import TTLCache
+from metrics import span, timed, UPSTREAM_SECONDS
+
 load_dotenv()
 
 rail_api = Blueprint('rail_api', __name__)
@@ -26,24 +31,96 @@ CITIES = [
     "Lucknow"
 ]
 
-def fetch_train_by_name_or_number(train_identifier):
-    conn = http.client.HTTPSConnection(RAPIDAPI_HOST)
+# One case-insensitive alternation instead of re-lowercasing CITIES for every stop
+STATION_PATTERN = re.compile("|".join(re.escape(city) for city in CITIES), re.IGNORECASE)
+
+SCHEDULE_FIELDS = (
+    "arrivalTime", "departureTime", "distance",
+    "haltTime", "routeNumber", "stationCode",
+    "stationName", "stnSerialNumber",
+)
+
+# Timetables change a few times a year; a long TTL saves almost every RapidAPI call
+TRAIN_CACHE_TTL = float(os.getenv("TRAIN_CACHE_TTL", 43200))
+
+train_cache = TTLCache(ttl=TRAIN_CACHE_TTL, maxsize=512)
+
+def _train_endpoint(train_identifier):
+    return f"/api/trains-search/v1/train/{train_identifier}?isH5=true&client=web"
+
+@timed(UPSTREAM_SECONDS, provider="rapidapi", call="data")
+def _request_train(train_identifier):
+    conn = http.client.HTTPSConnection(RAPIDAPI_HOST, timeout=10)
     headers = {
         'x-rapidapi-key': RAPIDAPI_KEY,
         'x-rapidapi-host': RAPIDAPI_HOST,
         'x-rapid-api': RAPIDAPI_OTHER_HEADER
     }
-    endpoint = f"/api/trains-search/v1/train/{train_identifier}?isH5=true&client=web"
-    conn.request("GET", endpoint, headers=headers)
-    res = conn.getresponse()
-    data = res.read()
+    try:
+        conn.request("GET", _train_endpoint(train_identifier), headers=headers)
+        res = conn.getresponse()
+        data = res.read()
+    finally:
+        conn.close()
     try:
         return json.loads(data.decode("utf-8"))
     except Exception as e:
         return {"error": "Failed to parse API response", "exception": str(e)}
 
+def is_train_cached(train_identifier, min_ttl: float = 0) -> bool:
+    return train_cache.expires_in(str(train_identifier).strip().lower()) > min_ttl
+
+def fetch_train_by_name_or_number(train_identifier):
+    """Return the raw RapidAPI train response, served from the train cache when possible.
+    Only responses that actually contain train data are cached."""
+    key = str(train_identifier).strip().lower()
+    cached = train_cache.get(key)
+    if cached is not None:
+        return cached
+    response = _request_train(train_identifier)
+    if response.get("body"):
+        train_cache.set(key, response)
+    return response
+
+async def fetch_train_by_name_or_number_async(train_identifier, client: httpx.AsyncClient):
+    """Asyncio twin of fetch_train_by_name_or_number(); shares the same train cache."""
+    key = str(train_identifier).strip().lower()
+    cached = train_cache.get(key)
+    if cached is not None:
+        return cached
+    try:
+        with span(UPSTREAM_SECONDS, provider="rapidapi", call="data"):
+            res = await client.get(
+                f"https://{RAPIDAPI_HOST}{_train_endpoint(train_identifier)}",
+                headers={
+                    'x-rapidapi-key': RAPIDAPI_KEY,
+                    'x-rapidapi-host': RAPIDAPI_HOST,
+                    'x-rapid-api': RAPIDAPI_OTHER_HEADER
+                },
+                timeout=10,
+            )
+            response = res.json()
+    except Exception as e:
+        return {"error": "Failed to parse API response", "exception": str(e)}
+    if response.get("body"):
+        train_cache.set(key, response)
+    return response
+
+def filter_schedule(schedule):
+    """Keep the stops at major CITIES, trimmed to SCHEDULE_FIELDS."""
+    return [
+        {k: stop[k] for k in SCHEDULE_FIELDS if k in stop}
+        for stop in schedule
+        if STATION_PATTERN.search(stop.get("stationName", ""))
+    ]
+
+def to_columnar(stops):
+    """Pivot a list of stop dicts into parallel arrays keyed by field name."""
+    return {field: [stop.get(field) for stop in stops] for field in SCHEDULE_FIELDS}
+
 @rail_api.route('/train-info/<train_identifier>', methods=['GET'])
 def get_train_schedule(train_identifier):
+    columnar = request.args.get("format") == "columnar"
     api_response = fetch_train_by_name_or_number(train_identifier)
     
     try:
@@ -57,23 +134,12 @@ def get_train_schedule(train_identifier):
 
         formatted_trains = []
         for train in trains_data:
-            schedule = train.get("schedule", [])
-            filtered_schedule = [
-                {
-                    k: v for k, v in stop.items()
-                    if k in ["arrivalTime", "departureTime", "distance", 
-                            "haltTime", "routeNumber", "stationCode", 
-                            "stationName", "stnSerialNumber"]
-                }
-                for stop in schedule
-                if any(city.lower() in stop.get("stationName", "").lower() 
-                      for city in CITIES)
-            ]
+            filtered_schedule = filter_schedule(train.get("schedule", []))
             
             formatted_trains.append({
                 "train_name": train.get("trainName"),
                 "train_number": train.get("trainNumber"),
-                "schedule": filtered_schedule
+                "schedule": to_columnar(filtered_schedule) if columnar else filtered_schedule
             })
 
         return jsonify({
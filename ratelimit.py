@@ -0,0 +1,202 @@
+import os
+import math
+import time
+import uuid
+import sqlite3
+import logging
+import tempfile
+import threading
+from dotenv import load_dotenv
+
+from cache import TTLCache
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_ENABLED    = os.getenv("RATE_LIMIT_ENABLED", "true").lower() in ("1", "true", "yes")
+# Sustained messages per minute per user, and how many may be sent back to back
+CHAT_RATE_PER_MINUTE  = float(os.getenv("CHAT_RATE_PER_MINUTE", 12))
+CHAT_RATE_BURST       = int(os.getenv("CHAT_RATE_BURST", 6))
+CHAT_MAX_CONCURRENT   = int(os.getenv("CHAT_MAX_CONCURRENT", 2))
+# memory: per worker process; sqlite: one file shared by all workers on the host;
+# auto: sqlite when gunicorn runs more than one worker
+RATE_LIMIT_BACKEND    = os.getenv("RATE_LIMIT_BACKEND", "auto").lower()
+RATE_LIMIT_DB         = os.getenv("RATE_LIMIT_DB", os.path.join(tempfile.gettempdir(), "travel-agent-ratelimit.sqlite3"))
+# A concurrency slot held longer than this (e.g. by a killed worker) is reclaimed
+RATE_LIMIT_LEASE_TTL  = float(os.getenv("RATE_LIMIT_LEASE_TTL", os.getenv("GUNICORN_TIMEOUT", 120)))
+
+CONCURRENCY_RETRY_AFTER = 2.0
+
+
+def _refill(tokens: float, updated: float, now: float, rate: float, burst: int) -> float:
+    return min(burst, tokens + (now - updated) * rate)
+
+
+class MemoryLimiter:
+    """Token bucket and concurrent-request count per key, held in this process."""
+
+    name = "memory"
+
+    def __init__(self, rate_per_minute: float, burst: int, max_concurrent: int):
+        self.rate           = rate_per_minute / 60
+        self.burst          = burst
+        self.max_concurrent = max_concurrent
+        # An idle bucket is full again after burst / rate seconds, so forgetting it then is exact
+        self._buckets  = TTLCache(ttl=burst / self.rate + 60, maxsize=50000)   # key -> (tokens, updated)
+        self._inflight: dict = {}                                             # key -> count
+        self._lock = threading.Lock()
+
+    def acquire(self, key: str) -> tuple[str | None, str | None, float]:
+        now = time.monotonic()
+        with self._lock:
+            if self._inflight.get(key, 0) >= self.max_concurrent:
+                return None, "concurrency", CONCURRENCY_RETRY_AFTER
+            tokens, updated = self._buckets.peek(key, (self.burst, now))
+            tokens = _refill(tokens, updated, now, self.rate, self.burst)
+            if tokens < 1:
+                self._buckets.set(key, (tokens, now))
+                return None, "rate", (1 - tokens) / self.rate
+            self._buckets.set(key, (tokens - 1, now))
+            self._inflight[key] = self._inflight.get(key, 0) + 1
+        return key, None, 0.0
+
+    def release(self, key: str, lease: str) -> None:
+        with self._lock:
+            count = self._inflight.get(key, 0) - 1
+            if count > 0:
+                self._inflight[key] = count
+            else:
+                self._inflight.pop(key, None)
+
+
+class SQLiteLimiter:
+    """
+    The same limits kept in a local SQLite file, so every gunicorn worker on
+    the host shares them. Each check is one short BEGIN IMMEDIATE transaction.
+    Concurrency slots are leases that expire, so a crashed worker can't leak them.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str, rate_per_minute: float, burst: int, max_concurrent: int,
+                 lease_ttl: float = RATE_LIMIT_LEASE_TTL):
+        self.path           = path
+        self.rate           = rate_per_minute / 60
+        self.burst          = burst
+        self.max_concurrent = max_concurrent
+        self.lease_ttl      = lease_ttl
+        self._local = threading.local()
+        self._calls = 0
+        with self._conn() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL, updated REAL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS leases (lease TEXT PRIMARY KEY, key TEXT, expires_at REAL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS leases_key ON leases (key, expires_at)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def acquire(self, key: str) -> tuple[str | None, str | None, float]:
+        now  = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM leases WHERE key = ? AND expires_at <= ?", (key, now))
+            (held,) = conn.execute("SELECT COUNT(*) FROM leases WHERE key = ?", (key,)).fetchone()
+            if held >= self.max_concurrent:
+                conn.execute("COMMIT")
+                return None, "concurrency", CONCURRENCY_RETRY_AFTER
+            row = conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens = _refill(*(row or (self.burst, now)), now, self.rate, self.burst)
+            if tokens < 1:
+                conn.execute("REPLACE INTO buckets VALUES (?, ?, ?)", (key, tokens, now))
+                conn.execute("COMMIT")
+                return None, "rate", (1 - tokens) / self.rate
+            lease = uuid.uuid4().hex
+            conn.execute("REPLACE INTO buckets VALUES (?, ?, ?)", (key, tokens - 1, now))
+            conn.execute("INSERT INTO leases VALUES (?, ?, ?)", (lease, key, now + self.lease_ttl))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self._calls += 1
+        if self._calls % 1000 == 0:
+            self._prune(now)
+        return lease, None, 0.0
+
+    def release(self, key: str, lease: str) -> None:
+        self._conn().execute("DELETE FROM leases WHERE lease = ?", (lease,))
+
+    def _prune(self, now: float) -> None:
+        """Drop expired leases and buckets that have been idle long enough to be full again."""
+        conn = self._conn()
+        conn.execute("DELETE FROM leases WHERE expires_at <= ?", (now,))
+        conn.execute("DELETE FROM buckets WHERE updated <= ?", (now - self.burst / self.rate,))
+
+
+class ChatLimiter:
+    """
+    Per-user admission for /chat: a token bucket (CHAT_RATE_PER_MINUTE, bursts
+    of CHAT_RATE_BURST) and at most CHAT_MAX_CONCURRENT chats in flight.
+    A backend error admits the request rather than failing the chat.
+    """
+
+    def __init__(self, backend=None, enabled: bool = RATE_LIMIT_ENABLED):
+        self.enabled = enabled
+        self.backend = backend or _default_backend()
+        self._lock   = threading.Lock()
+        self._stats  = {"admitted": 0, "limited_rate": 0, "limited_concurrency": 0, "backend_errors": 0}
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    def acquire(self, user_id: str) -> tuple[str | None, str | None, int]:
+        """
+        (lease, None, 0) if the request may run, and release(user_id, lease) must follow;
+        (None, reason, retry_after) with reason "rate" or "concurrency" if it is limited.
+        """
+        if not self.enabled:
+            return "", None, 0
+        try:
+            lease, reason, retry_after = self.backend.acquire(user_id)
+        except Exception as e:
+            logger.warning(f"Rate limiter ({self.backend.name}) failed, admitting request: {e}")
+            self._count("backend_errors")
+            return "", None, 0
+        if lease is None:
+            self._count(f"limited_{reason}")
+            return None, reason, max(1, math.ceil(retry_after))
+        self._count("admitted")
+        return lease, None, 0
+
+    def release(self, user_id: str, lease: str) -> None:
+        if not lease:
+            return
+        try:
+            self.backend.release(user_id, lease)
+        except Exception as e:
+            logger.warning(f"Rate limiter ({self.backend.name}) release failed: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        return {**stats, "enabled": self.enabled, "backend": self.backend.name}
+
+
+def _default_backend():
+    backend = RATE_LIMIT_BACKEND
+    if backend == "auto":
+        backend = "sqlite" if int(os.getenv("WEB_CONCURRENCY", 1)) > 1 else "memory"
+    if backend == "sqlite":
+        try:
+            return SQLiteLimiter(RATE_LIMIT_DB, CHAT_RATE_PER_MINUTE, CHAT_RATE_BURST, CHAT_MAX_CONCURRENT)
+        except Exception as e:
+            logger.warning(f"Could not open rate-limit database {RATE_LIMIT_DB} ({e}); limiting per worker instead")
+    return MemoryLimiter(CHAT_RATE_PER_MINUTE, CHAT_RATE_BURST, CHAT_MAX_CONCURRENT)
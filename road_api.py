@@ -1,8 +1,12 @@
 import os
+import asyncio
+import httpx
 import requests
 from flask import jsonify, request, Blueprint
 from dotenv import load_dotenv
 
+from metrics import span, UPSTREAM_SECONDS
+
 load_dotenv()
 
 road_api = Blueprint('road_api', __name__)
@@ -15,13 +19,23 @@ def geocode_place(place_name):
     headers = {'Authorization': ORS_API_KEY}
     params = {'text': place_name, 'size': 1}
     try:
-        response = requests.get(GEOCODE_URL, headers=headers, params=params)
-        response.raise_for_status()
+        with span(UPSTREAM_SECONDS, provider="ors", call="geocode"):
+            response = requests.get(GEOCODE_URL, headers=headers, params=params)
+            response.raise_for_status()
         data = response.json()
         return data['features'][0]['geometry']['coordinates'] if data.get('features') else None
     except:
         return None
 
+def _route_summary(start: str, end: str, route: dict) -> dict:
+    duration = route['duration']
+    return {
+        "start": start, "end": end,
+        "distance_km":      round(route['distance'] / 1000, 2),
+        "duration_minutes": round(duration / 60, 1),
+        "eta": {"hours": int(duration // 3600), "minutes": round((duration % 3600) / 60, 1)},
+    }
+
 def fetch_route(start: str, end: str) -> dict | None:
     """Return route data dict, or None on failure. Callable without Flask context."""
     start_coords = geocode_place(start)
@@ -29,23 +43,57 @@ def fetch_route(start: str, end: str) -> dict | None:
     if not start_coords or not end_coords:
         return None
     try:
-        response = requests.get(
-            DIRECTIONS_URL,
-            headers={'Authorization': ORS_API_KEY},
-            params={
-                'start': f"{start_coords[0]},{start_coords[1]}",
-                'end':   f"{end_coords[0]},{end_coords[1]}",
-            },
-            timeout=10,
-        )
-        route    = response.json()['features'][0]['properties']['segments'][0]
-        duration = route['duration']
-        return {
-            "start": start, "end": end,
-            "distance_km":      round(route['distance'] / 1000, 2),
-            "duration_minutes": round(duration / 60, 1),
-            "eta": {"hours": int(duration // 3600), "minutes": round((duration % 3600) / 60, 1)},
-        }
+        with span(UPSTREAM_SECONDS, provider="ors", call="data"):
+            response = requests.get(
+                DIRECTIONS_URL,
+                headers={'Authorization': ORS_API_KEY},
+                params={
+                    'start': f"{start_coords[0]},{start_coords[1]}",
+                    'end':   f"{end_coords[0]},{end_coords[1]}",
+                },
+                timeout=10,
+            )
+            route = response.json()['features'][0]['properties']['segments'][0]
+        return _route_summary(start, end, route)
+    except Exception:
+        return None
+
+async def geocode_place_async(place_name: str, client: httpx.AsyncClient):
+    try:
+        with span(UPSTREAM_SECONDS, provider="ors", call="geocode"):
+            response = await client.get(
+                GEOCODE_URL,
+                headers={'Authorization': ORS_API_KEY},
+                params={'text': place_name, 'size': 1},
+                timeout=10,
+            )
+            response.raise_for_status()
+        data = response.json()
+        return data['features'][0]['geometry']['coordinates'] if data.get('features') else None
+    except Exception:
+        return None
+
+async def fetch_route_async(start: str, end: str, client: httpx.AsyncClient) -> dict | None:
+    """Asyncio twin of fetch_route(); both ends are geocoded concurrently."""
+    start_coords, end_coords = await asyncio.gather(
+        geocode_place_async(start, client),
+        geocode_place_async(end, client),
+    )
+    if not start_coords or not end_coords:
+        return None
+    try:
+        with span(UPSTREAM_SECONDS, provider="ors", call="data"):
+            response = await client.get(
+                DIRECTIONS_URL,
+                headers={'Authorization': ORS_API_KEY},
+                params={
+                    'start': f"{start_coords[0]},{start_coords[1]}",
+                    'end':   f"{end_coords[0]},{end_coords[1]}",
+                },
+                timeout=10,
+            )
+            route = response.json()['features'][0]['properties']['segments'][0]
+        return _route_summary(start, end, route)
     except Exception:
         return None
 
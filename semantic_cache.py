@@ -0,0 +1,261 @@
+import re
+import time
+import zlib
+import random
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+# Words that carry no meaning for "is this the same question?"
+STOPWORDS = {
+    "a", "an", "the", "i", "me", "my", "we", "our", "you", "your", "is", "are", "am", "be", "was",
+    "do", "does", "did", "can", "could", "should", "would", "will", "to", "for", "of", "in", "on",
+    "at", "and", "or", "with", "any", "some", "there", "it", "its", "this", "that", "what", "which",
+    "how", "please", "tell", "suggest", "recommend", "give", "know", "want", "need", "looking",
+    "like", "good", "nice", "about", "from", "get", "go", "going", "near", "around",
+}
+
+# Collapse common paraphrases onto one token
+SYNONYMS = {
+    "cheap": "budget", "cheapest": "budget", "affordable": "budget", "inexpensive": "budget",
+    "hostel": "stay", "hostels": "stay", "hotel": "stay", "hotels": "stay", "stays": "stay",
+    "homestay": "stay", "homestays": "stay", "guesthouse": "stay", "guesthouses": "stay",
+    "accommodation": "stay", "accommodations": "stay", "lodging": "stay",
+    "internet": "wifi", "wi": "wifi", "connectivity": "wifi", "network": "wifi",
+    "wfh": "remote", "remotely": "remote", "nomad": "remote", "nomads": "remote", "work": "remote",
+    "reach": "route", "getting": "route",
+    "trek": "trekking", "treks": "trekking", "hike": "trekking", "hiking": "trekking",
+    "visas": "visa", "packing": "pack", "carry": "pack", "bring": "pack",
+    "secure": "safe", "unsafe": "dangerous", "risky": "dangerous",
+    "luxurious": "luxury", "premium": "luxury", "expensive": "luxury",
+    "nonveg": "non", "dont": "not", "isnt": "not", "without": "not", "avoid": "not", "never": "not",
+    "eat": "food", "eating": "food", "cuisine": "food", "restaurants": "food",
+    "below": "under", "within": "under", "above": "over",
+    "days": "day", "nights": "night", "weeks": "week", "months": "month", "hours": "hour", "hrs": "hour",
+    "people": "person", "persons": "person", "pax": "person", "adults": "person",
+    "rupees": "rupee", "rs": "rupee", "inr": "rupee", "kms": "km",
+    "two": "2", "three": "3", "four": "4", "five": "5", "six": "6", "seven": "7", "eight": "8",
+    "nine": "9", "ten": "10",
+}
+
+# Words that give a number its meaning: "2 day" and "2 person" are different qualifiers
+UNITS = {"day", "night", "week", "month", "hour", "person", "rupee", "km"}
+
+# Words that flip or grade a question's meaning. Two questions are only near-duplicates when they
+# share exactly the same set of these, however similar the rest is ("safe" vs "dangerous",
+# "vegetarian" vs "non vegetarian", "best" vs "worst"). Numbers with their unit ("5000 rupee",
+# "2 day") and the direction of a journey ("from delhi", "delhi>kasol") are qualifiers too.
+QUALIFIERS = {
+    "not", "no", "non", "except", "safe", "dangerous", "best", "worst", "bad", "top",
+    "budget", "luxury", "solo", "family", "kids", "couple", "winter", "summer", "monsoon",
+    "under", "over",
+}
+
+_MERSENNE = (1 << 61) - 1
+
+
+def _words(text: str) -> list:
+    return [SYNONYMS.get(w, w) for w in _WORD.findall(text.lower())]
+
+
+def normalise(text: str) -> list:
+    """Lower-case content words of a question with paraphrases collapsed, order kept."""
+    return [w for w in dict.fromkeys(_words(text)) if w not in STOPWORDS]
+
+
+def qualifiers(text: str) -> frozenset:
+    """The QUALIFIERS a question uses after paraphrases are collapsed, plus each number with the
+    unit after it and each place a journey runs from ("from delhi") or between ("delhi>kasol")."""
+    words = _words(text)
+    quals = {w for w in words if w in QUALIFIERS}
+    for i, w in enumerate(words):
+        prev = words[i - 1] if i else ""
+        nxt  = words[i + 1] if i + 1 < len(words) else ""
+        if w[0].isdigit():
+            quals.add(f"{w} {nxt}" if nxt in UNITS else w)
+        elif w == "from" and nxt and nxt not in STOPWORDS:
+            quals.add(f"from {nxt}")
+        elif w == "to" and prev and nxt and prev not in STOPWORDS and nxt not in STOPWORDS:
+            quals.add(f"{prev}>{nxt}")
+    return frozenset(quals)
+
+
+def shingles(text: str) -> set:
+    """Content words plus their character trigrams, so plurals and typos still overlap.
+    QUALIFIERS and numbers are kept as whole words only: a trigram of "non" must not match
+    "nonstop", nor "500" match "5000"."""
+    words = normalise(text)
+    grams = set(words)
+    for w in words:
+        if w in QUALIFIERS or w[0].isdigit():
+            continue
+        padded = f"#{w}#"
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def similarity(grams: set, quals: frozenset, other_grams: set, other_quals: frozenset) -> float:
+    """Dice similarity of two questions' shingles; 0 when their qualifiers differ.
+    Dice rather than Jaccard, so one extra word in an otherwise identical question
+    ("... for wfh") costs less than a different topic word."""
+    if quals != other_quals:
+        return 0.0
+    return 2 * len(grams & other_grams) / (len(grams) + len(other_grams))
+
+
+class NearDuplicateCache:
+    """
+    Thread-safe answer cache keyed by question similarity rather than exact text.
+    MinHash signatures over shingles() are split into LSH bands to find candidates
+    within a scope (e.g. the detected location); candidates are then confirmed
+    with exact similarity() against `threshold` and identical qualifiers().
+    """
+
+    def __init__(self, threshold: float = 0.75, ttl: float = 21600, maxsize: int = 2000,
+                 num_perm: int = 64, bands: int = 32, sample_rate: float = 0.05, seed: int = 42):
+        assert num_perm % bands == 0, "num_perm must be a multiple of bands"
+        self.threshold   = threshold
+        self.ttl         = ttl
+        self.maxsize     = maxsize
+        self.bands       = bands
+        self.rows        = num_perm // bands
+        self.sample_rate = sample_rate
+        rng = random.Random(seed)
+        self._perms   = [(rng.randrange(1, _MERSENNE), rng.randrange(0, _MERSENNE)) for _ in range(num_perm)]
+        self._entries: OrderedDict = OrderedDict()   # id -> entry dict
+        self._buckets: dict = {}                     # (scope, band, band signature) -> set of ids
+        self._next_id = 0
+        self._lock    = threading.Lock()
+        self._stats   = {"lookups": 0, "hits": 0, "misses": 0, "stores": 0, "evictions": 0,
+                         "borderline_hits": 0, "sampled_hits": 0}
+
+    def _signature(self, grams: set) -> tuple:
+        hashes = [zlib.crc32(g.encode()) for g in grams]
+        return tuple(min((a * h + b) % _MERSENNE for h in hashes) for a, b in self._perms)
+
+    def _band_keys(self, scope: str, signature: tuple) -> list:
+        return [(scope, band, signature[band * self.rows:(band + 1) * self.rows]) for band in range(self.bands)]
+
+    def _drop(self, entry_id: int) -> None:
+        entry = self._entries.pop(entry_id, None)
+        if not entry:
+            return
+        for key in entry["bands"]:
+            bucket = self._buckets.get(key)
+            if bucket:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[key]
+
+    def get(self, question: str, scope: str = "") -> str | None:
+        """The cached answer to the most similar question in scope, or None."""
+        grams = shingles(question)
+        if not grams:
+            return None
+        quals = qualifiers(question)
+        keys  = self._band_keys(scope, self._signature(grams))
+        now   = time.monotonic()
+        best, best_sim = None, 0.0
+        with self._lock:
+            self._stats["lookups"] += 1
+            candidates = set().union(*(self._buckets.get(k, ()) for k in keys))
+            for entry_id in candidates:
+                entry = self._entries.get(entry_id)
+                if entry is None:
+                    continue
+                if entry["expires_at"] <= now:
+                    self._drop(entry_id)
+                    continue
+                sim = similarity(grams, quals, entry["grams"], entry["qualifiers"])
+                if sim > best_sim:
+                    best, best_sim = entry, sim
+            if best is None or best_sim < self.threshold:
+                self._stats["misses"] += 1
+                return None
+            self._stats["hits"] += 1
+            if best_sim < self.threshold + 0.05:
+                self._stats["borderline_hits"] += 1
+            sampled = random.random() < self.sample_rate
+            if sampled:
+                self._stats["sampled_hits"] += 1
+        if sampled:
+            # Logged for review: a wrong pairing here is a false positive of the threshold
+            logger.info(f"Answer cache sample [{scope or '-'}] sim={best_sim:.2f}: "
+                        f"{question!r} ~ {best['question']!r}")
+        return best["answer"]
+
+    def set(self, question: str, answer: str, scope: str = "") -> None:
+        grams = shingles(question)
+        if not grams or not answer:
+            return
+        keys = self._band_keys(scope, self._signature(grams))
+        with self._lock:
+            entry_id, self._next_id = self._next_id, self._next_id + 1
+            self._entries[entry_id] = {
+                "question":   question,
+                "answer":     answer,
+                "grams":      grams,
+                "qualifiers": qualifiers(question),
+                "bands":      keys,
+                "expires_at": time.monotonic() + self.ttl,
+            }
+            for key in keys:
+                self._buckets.setdefault(key, set()).add(entry_id)
+            self._stats["stores"] += 1
+            while len(self._entries) > self.maxsize:
+                self._drop(next(iter(self._entries)))
+                self._stats["evictions"] += 1
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["size"]     = len(self._entries)
+        stats["hit_rate"] = round(stats["hits"] / stats["lookups"], 3) if stats["lookups"] else 0.0
+        return stats
+
+
+# Pairs that must never share an answer; `python semantic_cache.py` checks them
+DISTINCT_QUESTIONS = [
+    ("is kasol safe for solo women", "is kasol dangerous for solo women"),
+    ("best cafes in kasol", "worst cafes in kasol"),
+    ("vegetarian food in kasol", "non vegetarian food in kasol"),
+    ("cheap stays in manali", "luxury stays in manali"),
+    ("low budget trip to goa", "luxury trip to goa"),
+    ("things to do in goa with kids", "things to do in goa without kids"),
+    ("kasol trip under 50000 rupees", "kasol trip under 5000 rupees"),
+    ("itinerary for kasol in 4 days", "itinerary for kasol in 2 days"),
+    ("hostels in kasol for 10 people", "hostels in kasol for 2 people"),
+    ("stays in kasol for 2 nights", "stays in kasol for 2 people"),
+    ("how to reach kasol from delhi", "how to reach delhi from kasol"),
+    ("bus from delhi to kasol", "bus from kasol to delhi"),
+    ("kasol to manali route", "manali to kasol route"),
+    ("best cafes in kasol", "best hostels in kasol"),
+    ("kheerganga trek difficulty", "kheerganga trek permits"),
+]
+
+SAME_QUESTIONS = [
+    ("cheap wifi stays in kasol for wfh", "budget hostels with good wifi in Kasol"),
+    ("itinerary for kasol in two days", "kasol itinerary for 2 days"),
+    ("is kasol safe for solo women", "is kasol secure for solo women"),
+]
+
+
+if __name__ == "__main__":
+    cache = NearDuplicateCache(sample_rate=0)
+    failures = 0
+    for expect_hit, pairs in ((False, DISTINCT_QUESTIONS), (True, SAME_QUESTIONS)):
+        for first, second in pairs:
+            cache.set(first, first)
+            hit = cache.get(second) == first
+            sim = similarity(shingles(first), qualifiers(first), shingles(second), qualifiers(second))
+            ok  = hit == expect_hit and (sim >= cache.threshold) == expect_hit
+            print(f"{'ok  ' if ok else 'FAIL'} sim={sim:.2f} hit={hit}: {first!r} ~ {second!r}")
+            failures += not ok
+    raise SystemExit(1 if failures else 0)
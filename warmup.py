@@ -0,0 +1,162 @@
+import os
+import time
+import logging
+import threading
+from collections import Counter
+from dotenv import load_dotenv
+
+from weather_api import fetch_weather, is_weather_cached, WEATHER_CACHE_TTL
+from rail_api import fetch_train_by_name_or_number, is_train_cached, TRAIN_CACHE_TTL
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+WARMUP_ENABLED        = os.getenv("WARMUP_ENABLED", "false").lower() in ("1", "true", "yes")
+WARMUP_STARTUP_DELAY  = float(os.getenv("WARMUP_STARTUP_DELAY", 5))
+WARMUP_TOP_N          = int(os.getenv("WARMUP_TOP_N", 10))
+WARMUP_FROM_TRAFFIC   = os.getenv("WARMUP_FROM_TRAFFIC", "true").lower() in ("1", "true", "yes")
+WARMUP_TRAFFIC_WINDOW = int(os.getenv("WARMUP_TRAFFIC_WINDOW", 500))
+# Provider quota guard: upstream fetches per cycle, and a pause between each one
+WARMUP_MAX_CALLS      = int(os.getenv("WARMUP_MAX_CALLS", 30))
+WARMUP_CALL_DELAY     = float(os.getenv("WARMUP_CALL_DELAY", 2))
+# Coupled to the cache TTLs: runs must come round before the shortest-lived warmed entry
+# (weather, WEATHER_CACHE_TTL) expires, allowing for a run's own length and a minute of slack
+_RUN_SECONDS          = WARMUP_MAX_CALLS * WARMUP_CALL_DELAY
+WARMUP_INTERVAL       = float(os.getenv("WARMUP_INTERVAL",
+                                        max(60.0, min(WEATHER_CACHE_TTL, TRAIN_CACHE_TTL) - _RUN_SECONDS - 60)))
+# An entry is refreshed unless it would outlive the next run
+_REFRESH_WITHIN       = WARMUP_INTERVAL + _RUN_SECONDS
+
+WARMUP_CITIES = [c.strip() for c in os.getenv(
+    "WARMUP_CITIES", "Delhi,Mumbai,Bangalore,Goa,Jaipur,Manali,Rishikesh,Kasol"
+).split(",") if c.strip()]
+WARMUP_TRAINS = [t.strip() for t in os.getenv("WARMUP_TRAINS", "").split(",") if t.strip()]
+
+_stats = {"runs": 0, "fetched": 0, "skipped_cached": 0, "deferred_for_traffic": 0}
+_stats_lock = threading.Lock()
+_started = False
+_start_lock = threading.Lock()
+
+# Live request gauge — the warm-up yields whenever real traffic is being served
+_live_requests = 0
+_live_lock = threading.Lock()
+
+
+def _count(key: str, n: int = 1) -> None:
+    with _stats_lock:
+        _stats[key] += n
+
+
+# ─── Live traffic tracking ────────────────────────────────────────────────────
+
+def request_started() -> None:
+    global _live_requests
+    with _live_lock:
+        _live_requests += 1
+
+
+def request_finished() -> None:
+    global _live_requests
+    with _live_lock:
+        _live_requests = max(0, _live_requests - 1)
+
+
+def _wait_until_idle() -> None:
+    """Block until no live request is in flight."""
+    waited = False
+    while _live_requests > 0:
+        waited = True
+        time.sleep(0.5)
+    if waited:
+        _count("deferred_for_traffic")
+
+
+# ─── Target selection ─────────────────────────────────────────────────────────
+
+def _targets_from_traffic() -> tuple[list[str], list[str]]:
+    """Rank cities and train numbers mentioned in recent chat_exchanges traffic."""
+    # Imported lazily: the router pulls in the LLM client and the db client
+    from db import get_recent_user_messages
+    from promptflow_router import rule_based_classify, extract_train_numbers
+
+    cities, trains = Counter(), Counter()
+    for message in get_recent_user_messages(WARMUP_TRAFFIC_WINDOW):
+        info = rule_based_classify(message)
+        for key in ("location", "end", "start"):
+            if info.get(key):
+                cities[info[key].strip().title()] += 1
+        trains.update(extract_train_numbers(message))
+    return [c for c, _ in cities.most_common()], [t for t, _ in trains.most_common()]
+
+
+def pick_targets() -> tuple[list[str], list[str]]:
+    """Return the top-N (cities, trains): learned traffic first, then the configured lists."""
+    cities, trains = [], []
+    if WARMUP_FROM_TRAFFIC:
+        try:
+            cities, trains = _targets_from_traffic()
+        except Exception as e:
+            logger.warning(f"Warm-up could not learn targets from traffic: {e}")
+    cities = list(dict.fromkeys(cities + WARMUP_CITIES))[:WARMUP_TOP_N]
+    trains = list(dict.fromkeys(trains + WARMUP_TRAINS))[:WARMUP_TOP_N]
+    return cities, trains
+
+
+# ─── Warm-up loop ─────────────────────────────────────────────────────────────
+
+def run_once() -> int:
+    """Warm the caches for the current targets; returns the number of upstream fetches made."""
+    cities, trains = pick_targets()
+    jobs = [(fetch_weather, is_weather_cached, c) for c in cities]
+    jobs += [(fetch_train_by_name_or_number, is_train_cached, t) for t in trains]
+
+    fetched = 0
+    for fetch, is_cached, target in jobs:
+        if fetched >= WARMUP_MAX_CALLS:
+            break
+        if is_cached(target, _REFRESH_WITHIN):
+            _count("skipped_cached")
+            continue
+        _wait_until_idle()
+        try:
+            fetch(target)
+        except Exception as e:
+            logger.warning(f"Warm-up fetch for {target} failed: {e}")
+        fetched += 1
+        time.sleep(WARMUP_CALL_DELAY)
+
+    _count("runs")
+    _count("fetched", fetched)
+    logger.info(f"Cache warm-up finished: {fetched} fetches for {len(cities)} cities, {len(trains)} trains")
+    return fetched
+
+
+def _loop() -> None:
+    time.sleep(WARMUP_STARTUP_DELAY)
+    while True:
+        try:
+            run_once()
+        except Exception as e:
+            logger.error(f"Cache warm-up run failed: {e}")
+        time.sleep(WARMUP_INTERVAL)
+
+
+def start_warmup() -> bool:
+    """Start the background warm-up thread once per process if WARMUP_ENABLED is set."""
+    global _started
+    if not WARMUP_ENABLED:
+        return False
+    with _start_lock:
+        if _started:
+            return False
+        threading.Thread(target=_loop, name="cache-warmup", daemon=True).start()
+        _started = True
+    logger.info("Cache warm-up thread started")
+    return True
+
+
+def warmup_stats() -> dict:
+    with _stats_lock:
+        stats = dict(_stats)
+    return {**stats, "enabled": WARMUP_ENABLED, "interval": WARMUP_INTERVAL, "live_requests": _live_requests}
@@ -1,15 +1,33 @@
 import os
 import re
+import httpx
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from flask import request, jsonify, Blueprint
 from dotenv import load_dotenv
 
+from cache import TTLCache
+from metrics import span, UPSTREAM_SECONDS
+
 load_dotenv()
 
 weather_api = Blueprint('weather_api', __name__)
 
 TOMORROW_API_KEY = os.getenv("TOMORROW_API_KEY", "")
 
+GEOCODE_URL    = "https://api.tomorrow.io/v4/geocode/search"
+REALTIME_URL   = "https://api.tomorrow.io/v4/weather/realtime"
+WEATHER_FIELDS = 'temperature,weatherCode,windSpeed,windDirection,humidity,precipitationIntensity,pressureSurfaceLevel'
+
+# Place names rarely move, so geocodes live much longer than readings
+GEOCODE_CACHE_TTL     = float(os.getenv("GEOCODE_CACHE_TTL", 86400))
+WEATHER_CACHE_TTL     = float(os.getenv("WEATHER_CACHE_TTL", 600))
+WEATHER_BATCH_MAX     = int(os.getenv("WEATHER_BATCH_MAX", 10))
+WEATHER_BATCH_WORKERS = int(os.getenv("WEATHER_BATCH_WORKERS", 5))
+
+geocode_cache = TTLCache(ttl=GEOCODE_CACHE_TTL, maxsize=2048)
+weather_cache = TTLCache(ttl=WEATHER_CACHE_TTL, maxsize=1024)
+
 def is_coordinate(location):
     """Validate latitude,longitude format"""
     pattern = r'^-?\d+\.?\d*,-?\d+\.?\d*$'
@@ -50,130 +68,209 @@ def degrees_to_direction(degrees):
                  "South", "South-West", "West", "North-West"]
     return directions[round(degrees % 360 / 45) % 8] if degrees else "Unknown"
 
-def fetch_weather(location: str) -> dict | None:
-    """Return weather data dict for location, or None on failure. Callable without Flask context."""
-    try:
-        if is_coordinate(location):
-            lat, lon = map(float, location.split(','))
-            location_name = location
-        else:
+def _parse_geocode(geo_data: dict) -> tuple[float, float, str] | None:
+    if not geo_data.get('features'):
+        return None
+    feature = geo_data['features'][0]
+    lon, lat = feature['geometry']['coordinates']
+    return lat, lon, feature['properties']['name']
+
+def _realtime_block(values: dict) -> dict:
+    return {
+        "temperature":       values.get('temperature'),
+        "weather_condition": get_weather_code_description(values.get('weatherCode')),
+        "wind_speed":        values.get('windSpeed'),
+        "wind_direction":    degrees_to_direction(values.get('windDirection')),
+        "humidity":          values.get('humidity'),
+        "precipitation":     values.get('precipitationIntensity', 0),
+        "air_pressure":      values.get('pressureSurfaceLevel'),
+    }
+
+def geocode_location(location: str) -> tuple[float, float, str] | None:
+    """Resolve a place name or "lat,lon" string to (lat, lon, name) through the geocode cache.
+    Returns None if the place is unknown; raises on upstream HTTP errors."""
+    if is_coordinate(location):
+        lat, lon = map(float, location.split(','))
+        return lat, lon, location
+
+    def fetch():
+        with span(UPSTREAM_SECONDS, provider="tomorrow", call="geocode"):
             geo_response = requests.get(
-                "https://api.tomorrow.io/v4/geocode/search",
+                GEOCODE_URL,
                 headers={'apikey': TOMORROW_API_KEY},
                 params={'query': location, 'limit': 1},
                 timeout=8,
             )
             geo_response.raise_for_status()
-            geo_data = geo_response.json()
-            if not geo_data.get('features'):
-                return None
-            feature = geo_data['features'][0]
-            lon, lat = feature['geometry']['coordinates']
-            location_name = feature['properties']['name']
-
-        weather_response = requests.get(
-            "https://api.tomorrow.io/v4/weather/realtime",
+        return _parse_geocode(geo_response.json())
+
+    # Concurrent lookups of one place (e.g. a batch and a chat) share a single upstream call
+    return geocode_cache.get_or_set(location.strip().lower(), fetch)
+
+def fetch_realtime_weather(lat: float, lon: float) -> dict:
+    """Return the formatted real-time weather block for a coordinate through the weather cache."""
+    def fetch():
+        with span(UPSTREAM_SECONDS, provider="tomorrow", call="data"):
+            weather_response = requests.get(
+                REALTIME_URL,
+                headers={'apikey': TOMORROW_API_KEY},
+                params={'location': f"{lat},{lon}", 'units': 'metric', 'fields': WEATHER_FIELDS},
+                timeout=8,
+            )
+            weather_response.raise_for_status()
+        return _realtime_block(weather_response.json()['data']['values'])
+
+    return weather_cache.get_or_set((round(lat, 2), round(lon, 2)), fetch)
+
+def lookup_weather(location: str) -> dict:
+    """Return weather data dict for location. Raises LookupError if it can't be geocoded."""
+    coords = geocode_location(location)
+    if coords is None:
+        raise LookupError("Location not found")
+    lat, lon, location_name = coords
+    return {
+        "location": location_name,
+        "real_time_weather": fetch_realtime_weather(lat, lon),
+    }
+
+def is_weather_cached(location: str, min_ttl: float = 0) -> bool:
+    """True if both the geocode and the current reading for location are cached,
+    the reading for at least another min_ttl seconds."""
+    coords = (geocode_location(location) if is_coordinate(location)
+              else geocode_cache.peek(location.strip().lower()))
+    if coords is None:
+        return False
+    return weather_cache.expires_in((round(coords[0], 2), round(coords[1], 2))) > min_ttl
+
+def fetch_weather(location: str) -> dict | None:
+    """Return weather data dict for location, or None on failure. Callable without Flask context."""
+    try:
+        return lookup_weather(location)
+    except Exception:
+        return None
+
+async def geocode_location_async(location: str, client: httpx.AsyncClient) -> tuple[float, float, str] | None:
+    """Non-blocking geocode_location(); shares the same geocode cache."""
+    if is_coordinate(location):
+        lat, lon = map(float, location.split(','))
+        return lat, lon, location
+
+    key = location.strip().lower()
+    cached = geocode_cache.get(key)
+    if cached is not None:
+        return cached
+
+    with span(UPSTREAM_SECONDS, provider="tomorrow", call="geocode"):
+        geo_response = await client.get(
+            GEOCODE_URL,
+            headers={'apikey': TOMORROW_API_KEY},
+            params={'query': location, 'limit': 1},
+            timeout=8,
+        )
+        geo_response.raise_for_status()
+    result = _parse_geocode(geo_response.json())
+    if result:
+        geocode_cache.set(key, result)
+    return result
+
+async def fetch_realtime_weather_async(lat: float, lon: float, client: httpx.AsyncClient) -> dict:
+    """Non-blocking fetch_realtime_weather(); shares the same weather cache."""
+    key = (round(lat, 2), round(lon, 2))
+    cached = weather_cache.get(key)
+    if cached is not None:
+        return cached
+
+    with span(UPSTREAM_SECONDS, provider="tomorrow", call="data"):
+        weather_response = await client.get(
+            REALTIME_URL,
             headers={'apikey': TOMORROW_API_KEY},
-            params={
-                'location': f"{lat},{lon}",
-                'units': 'metric',
-                'fields': 'temperature,weatherCode,windSpeed,windDirection,humidity,precipitationIntensity,pressureSurfaceLevel',
-            },
+            params={'location': f"{lat},{lon}", 'units': 'metric', 'fields': WEATHER_FIELDS},
             timeout=8,
         )
         weather_response.raise_for_status()
-        values = weather_response.json()['data']['values']
+    result = _realtime_block(weather_response.json()['data']['values'])
+    weather_cache.set(key, result)
+    return result
+
+async def fetch_weather_async(location: str, client: httpx.AsyncClient) -> dict | None:
+    """Asyncio twin of fetch_weather(): weather data dict for location, or None on failure."""
+    try:
+        coords = await geocode_location_async(location, client)
+        if coords is None:
+            return None
+        lat, lon, location_name = coords
         return {
             "location": location_name,
-            "real_time_weather": {
-                "temperature":       values.get('temperature'),
-                "weather_condition": get_weather_code_description(values.get('weatherCode')),
-                "wind_speed":        values.get('windSpeed'),
-                "wind_direction":    degrees_to_direction(values.get('windDirection')),
-                "humidity":          values.get('humidity'),
-                "precipitation":     values.get('precipitationIntensity', 0),
-                "air_pressure":      values.get('pressureSurfaceLevel'),
-            },
+            "real_time_weather": await fetch_realtime_weather_async(lat, lon, client),
         }
     except Exception:
         return None
 
+def _batch_item(query: str, future) -> dict:
+    """Turn one batch future into a result row carrying either data or a per-item error."""
+    try:
+        return {"query": query, **future.result()}
+    except LookupError as e:
+        return {"query": query, "error": str(e), "status": 404}
+    except requests.exceptions.HTTPError as e:
+        return {
+            "query": query,
+            "error": "API request failed",
+            "details": f"{e.response.status_code} - {e.response.text}",
+            "status": 502,
+        }
+    except Exception as e:
+        return {"query": query, "error": str(e), "status": 500}
+
+def fetch_weather_batch(locations: list[str]) -> list[dict]:
+    """Geocode and fetch weather for several locations concurrently.
+    Duplicate queries share one lookup; results keep the request order."""
+    unique = list(dict.fromkeys(locations))
+    workers = max(1, min(WEATHER_BATCH_WORKERS, len(unique)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {loc: pool.submit(lookup_weather, loc) for loc in unique}
+        rows = {loc: _batch_item(loc, fut) for loc, fut in futures.items()}
+    return [rows[loc] for loc in locations]
 
-@weather_api.route('/weather', methods=['GET'])
+def _batch_locations() -> list[str]:
+    """Read the batch location list from ?locations=a|b|c or a JSON body {"locations": [...]}."""
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        raw = data.get('locations') or []
+        if isinstance(raw, str):
+            raw = raw.split('|')
+    else:
+        raw = (request.args.get('locations') or '').split('|')
+    return [str(loc).strip() for loc in raw if str(loc).strip()]
+
+
+@weather_api.route('/weather', methods=['GET', 'POST'])
 def get_weather():
+    if request.method == 'POST' or 'locations' in request.args:
+        return get_weather_batch()
+
     location = request.args.get('location')
     if not location:
         return jsonify({"error": "Location parameter is required"}), 400
 
     try:
-        # Handle coordinates or geocode location name
-        if is_coordinate(location):
-            lat, lon = map(float, location.split(','))
-            location_name = location
-        else:
-            # Geocode location name to coordinates
-            geocode_url = "https://api.tomorrow.io/v4/geocode/search"
-            headers = {'apikey': TOMORROW_API_KEY}
-            params = {'query': location, 'limit': 1}
-            
-            geo_response = requests.get(geocode_url, headers=headers, params=params)
-            geo_response.raise_for_status()
-            geo_data = geo_response.json()
-            
-            if not geo_data.get('features'):
-                return jsonify({"error": "Location not found"}), 404
-                
-            feature = geo_data['features'][0]
-            lon, lat = feature['geometry']['coordinates']
-            location_name = feature['properties']['name']
-
-        # Get weather data
-        weather_url = "https://api.tomorrow.io/v4/weather/realtime"
-        headers = {'apikey': TOMORROW_API_KEY}
-        params = {
-            'location': f"{lat},{lon}",
-            'units': 'metric',
-            'fields': ','.join([
-                'temperature',
-                'weatherCode',
-                'windSpeed',
-                'windDirection',
-                'humidity',
-                'precipitationIntensity',
-                'pressureSurfaceLevel'
-            ])
-        }
-        
-        weather_response = requests.get(weather_url, headers=headers, params=params)
-        weather_response.raise_for_status()
-        weather_data = weather_response.json()
-
-        if 'data' not in weather_data:
-            return jsonify({"error": "Invalid API response format"}), 500
-
-        values = weather_data['data']['values']
-
-        return jsonify({
-            "location": location_name,
-            "real_time_weather": {
-                "temperature": values.get('temperature'),
-                "weather_condition": get_weather_code_description(values.get('weatherCode')),
-                "wind_speed": values.get('windSpeed'),
-                "wind_direction": degrees_to_direction(values.get('windDirection')),
-                "humidity": values.get('humidity'),
-                "precipitation": values.get('precipitationIntensity', 0),
-                "air_pressure": values.get('pressureSurfaceLevel')
-            }
-        })
-
+        return jsonify(lookup_weather(location))
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 404
     except requests.exceptions.HTTPError as e:
         return jsonify({
-            "error": f"API request failed",
+            "error": "API request failed",
             "details": f"{e.response.status_code} - {e.response.text}"
         }), 500
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+def get_weather_batch():
+    locations = _batch_locations()
+    if not locations:
+        return jsonify({"error": "At least one location is required"}), 400
+    if len(locations) > WEATHER_BATCH_MAX:
+        return jsonify({"error": f"At most {WEATHER_BATCH_MAX} locations per request"}), 400
 
-
+    return jsonify({"results": fetch_weather_batch(locations)})